@@ -1,10 +1,15 @@
 import os
 import base64
-from typing import Optional
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
 from fastapi import HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
 from dotenv import load_dotenv
+from app.services.usage_ledger import set_usage_user
 
 load_dotenv()
 
@@ -32,11 +37,92 @@ try:
 except Exception:
     SUPABASE_JWT_SECRET = _SUPABASE_JWT_SECRET_RAW.encode()
 
+# Verified-token cache: maximum entries, and maximum age (seconds) of an entry
+# even if the token's own `exp` is later
+AUTH_CACHE_MAX_SIZE: int = int(os.environ.get("AUTH_CACHE_MAX_SIZE", "10000"))
+AUTH_CACHE_TTL_SECONDS: float = float(os.environ.get("AUTH_CACHE_TTL_SECONDS", "300"))
+
+
+class VerifiedTokenCache:
+    """
+    LRU cache of verified JWT payloads
+
+    The mobile client replays the same token on every request, so after the
+    first verification the HMAC check and claim parsing are skipped. Entries are
+    keyed by the token's SHA-256 digest (raw tokens are never kept) and expire
+    at the token's `exp` or after `ttl` seconds, whichever comes first. Only
+    successfully verified tokens are cached.
+    """
+
+    def __init__(self, max_size: int = AUTH_CACHE_MAX_SIZE, ttl: float = AUTH_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        """Return the cached payload for `token`, or None if absent/expired"""
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, payload: dict):
+        """Cache a verified payload until min(exp, now + ttl)"""
+        expires_at = time.time() + self.ttl
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Snapshot of cache counters for diagnostics"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Singleton instance
+token_cache = VerifiedTokenCache()
+
 
 def verify_jwt_token(token: str) -> dict:
     """
     Verify and decode a Supabase JWT token.
     
+    Repeat tokens are served from `token_cache` without re-verifying.
+    
     Args:
         token: The JWT token string to verify
         
@@ -46,6 +132,10 @@ def verify_jwt_token(token: str) -> dict:
     Raises:
         HTTPException: If token is invalid, expired, or malformed
     """
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+    
     try:
         # Decode and verify the JWT token
         # Supabase JWT is HS256, secret is base64-decoded bytes
@@ -55,6 +145,7 @@ def verify_jwt_token(token: str) -> dict:
             algorithms=["HS256"],
             options={"verify_aud": False}  # audience field varies by Supabase config
         )
+        token_cache.put(token, payload)
         return payload
     except jwt.ExpiredSignatureError as e:
         print(f"JWT Expired: {e}")
@@ -120,6 +211,8 @@ async def get_current_user(
             detail="Invalid token: user ID not found"
         )
     
+    # LLM calls made for this request are attributed to the user (usage ledger)
+    set_usage_user(user_id)
     return user_id
 
 
@@ -1,8 +1,14 @@
 import os
-from supabase import create_client, Client
+import asyncio
+from time import perf_counter
+from typing import Optional
+import httpx
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from app.services.metrics import SUPABASE_CALL_SECONDS
 
 load_dotenv()
 
@@ -30,27 +36,227 @@ if not jwt_secret:
         "Please add it to your .env file."
     )
 
+# Connection pool sizing for the shared Supabase (PostgREST) transport
+SUPABASE_POOL_MAX_CONNECTIONS: int = int(os.environ.get("SUPABASE_POOL_MAX_CONNECTIONS", "100"))
+SUPABASE_POOL_MAX_KEEPALIVE: int = int(os.environ.get("SUPABASE_POOL_MAX_KEEPALIVE", "20"))
+SUPABASE_POOL_KEEPALIVE_EXPIRY: float = float(os.environ.get("SUPABASE_POOL_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_TIMEOUT_SECONDS: float = float(os.environ.get("SUPABASE_TIMEOUT_SECONDS", "10"))
+
+# Table-API client handed to repositories (supports `await .table(...).execute()`)
+SupabaseClient = AsyncPostgrestClient
+
+
+class _MeteredByteStream(httpx.AsyncByteStream):
+    """Response body wrapper that reports when the pooled connection is released"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._on_close:
+                self._on_close()
+                self._on_close = None
+
+
+class _MeteredTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps httpx's pooled transport and tracks how many connections are checked out.
+
+    A request counts as in flight from the moment it is sent until its response
+    body is closed, which is when httpx returns the connection to the pool.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_connections: int):
+        self._transport = transport
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_requests = 0
+        self.saturated_requests = 0
+
+    def _acquire(self) -> None:
+        if self.in_flight >= self.max_connections:
+            self.saturated_requests += 1
+        self.in_flight += 1
+        self.total_requests += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+
+    @staticmethod
+    def _table(request: httpx.Request) -> str:
+        # /rest/v1/mood_logs -> mood_logs, /rest/v1/rpc/fn -> rpc/fn
+        path = request.url.path
+        marker = path.find("/rest/v1/")
+        return path[marker + len("/rest/v1/"):] if marker >= 0 else path
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._acquire()
+        start = perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self._release()
+            SUPABASE_CALL_SECONDS.observe(perf_counter() - start, request.method, self._table(request), "error")
+            raise
+        SUPABASE_CALL_SECONDS.observe(
+            perf_counter() - start, request.method, self._table(request), str(response.status_code)
+        )
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_MeteredByteStream(response.stream, self._release),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class SupabasePool:
+    """
+    Shared, connection-pooled async transport for Supabase's PostgREST API.
+
+    One httpx.AsyncClient (keep-alive connections, TLS sessions) is reused by
+    every request. Each request gets a lightweight PostgREST client bound to the
+    caller's JWT, so RLS still sees the right auth.uid().
+    """
+
+    def __init__(
+        self,
+        url: str,
+        anon_key: str,
+        max_connections: int = SUPABASE_POOL_MAX_CONNECTIONS,
+        max_keepalive: int = SUPABASE_POOL_MAX_KEEPALIVE,
+        keepalive_expiry: float = SUPABASE_POOL_KEEPALIVE_EXPIRY,
+        timeout: float = SUPABASE_TIMEOUT_SECONDS,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """
+        Initialize pool (the HTTP client itself is created lazily)
+
+        Args:
+            url: Supabase project URL
+            anon_key: Supabase ANON key (never the service_role key)
+            max_connections: Maximum open connections
+            max_keepalive: Maximum idle keep-alive connections
+            keepalive_expiry: Seconds an idle connection is kept open
+            timeout: Per-request timeout in seconds
+            transport: Optional inner transport (tests)
+        """
+        self.rest_url = f"{url.rstrip('/')}/rest/v1"
+        self.anon_key = anon_key
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self._inner_transport = transport
+        self._transport: Optional[_MeteredTransport] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The shared httpx client, created on first use in the running event loop"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        # Pooled connections belong to one event loop; rebuild if the loop changed
+        if self._client is None or (loop is not None and loop is not self._loop):
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry,
+            )
+            inner = self._inner_transport or httpx.AsyncHTTPTransport(limits=limits)
+            self._transport = _MeteredTransport(inner, self.max_connections)
+            self._client = httpx.AsyncClient(
+                transport=self._transport,
+                timeout=self.timeout,
+                follow_redirects=True,
+            )
+            self._loop = loop
+        return self._client
+
+    def bind(self, user_jwt: Optional[str] = None) -> SupabaseClient:
+        """
+        Create a PostgREST client on the shared transport.
+
+        Args:
+            user_jwt: Caller's JWT. If None, the anon key is used (no user context).
+
+        Returns:
+            SupabaseClient: Table-API client whose requests carry the JWT
+        """
+        headers = {
+            **DEFAULT_POSTGREST_CLIENT_HEADERS,
+            "apikey": self.anon_key,
+            "Authorization": f"Bearer {user_jwt or self.anon_key}",
+        }
+        return SupabaseClient(self.rest_url, headers=headers, http_client=self.client)
+
+    def stats(self) -> dict:
+        """Pool saturation metrics"""
+        transport = self._transport
+        return {
+            "max_connections": self.max_connections,
+            "max_keepalive": self.max_keepalive,
+            "in_flight": transport.in_flight if transport else 0,
+            "peak_in_flight": transport.peak_in_flight if transport else 0,
+            "total_requests": transport.total_requests if transport else 0,
+            "saturated_requests": transport.saturated_requests if transport else 0,
+        }
+
+    async def aclose(self) -> None:
+        """Close all pooled connections"""
+        if self._client is not None:
+            client = self._client
+            self._client = None
+            self._transport = None
+            self._loop = None
+            await client.aclose()
+
+
+# Shared pool for the whole worker
+supabase_pool = SupabasePool(SUPABASE_URL, SUPABASE_ANON_KEY)
+
+def get_supabase_pool() -> SupabasePool:
+    """Dependency injection for FastAPI"""
+    return supabase_pool
+
+
 # Security scheme for extracting Bearer token
 security_scheme = HTTPBearer()
 
 
 def get_supabase_with_auth(
     credentials: HTTPAuthorizationCredentials = Depends(security_scheme)
-) -> Client:
+) -> SupabaseClient:
     """
-    Create a per-request Supabase client with user's JWT forwarded.
+    Get a per-request Supabase client with user's JWT forwarded.
     
     This enables Row Level Security (RLS) enforcement at the database layer.
     The client will use auth.uid() from the JWT to filter data automatically.
     
-    CRITICAL: This function creates a NEW client for EACH request.
-    Do NOT cache or make this global.
+    The returned client is cheap: it only carries the request's headers and
+    shares the worker-wide connection pool (keep-alive + TLS reuse).
+    Never cache the returned client across requests - it is bound to one JWT.
     
     Args:
         credentials: Bearer token from Authorization header
         
     Returns:
-        Client: Authenticated Supabase client with RLS enabled
+        SupabaseClient: Authenticated client with RLS enabled
         
     Raises:
         HTTPException: If authentication token is missing
@@ -63,31 +269,26 @@ def get_supabase_with_auth(
     
     user_jwt = credentials.credentials
     
-    # Create client with ANON key (not service_role!)
-    client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-    
-    # Forward user's JWT to enable RLS
+    # Bind the user's JWT (requests still use the ANON key as apikey, not service_role!)
     # Supabase will verify the JWT and set auth.uid() for RLS policies
-    client.postgrest.auth(user_jwt)
-    
-    return client
+    return supabase_pool.bind(user_jwt)
 
 
 # Optional: For endpoints that don't require auth (public data)
-def get_supabase_anon() -> Client:
+def get_supabase_anon() -> SupabaseClient:
     """
     Anonymous client for public data access.
     Use only for truly public endpoints.
     
     Returns:
-        Client: Anonymous Supabase client (no user context)
+        SupabaseClient: Anonymous client (no user context)
     """
-    return create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+    return supabase_pool.bind(None)
 
 
 # Legacy function for backward compatibility
 # DEPRECATED: Use get_supabase_with_auth instead
-def get_supabase() -> Client:
+def get_supabase() -> SupabaseClient:
     """
     DEPRECATED: Returns anonymous client without user context.
     
@@ -97,3 +298,21 @@ def get_supabase() -> Client:
     Use get_supabase_with_auth instead to enforce Row Level Security.
     """
     return get_supabase_anon()
+
+
+def get_access_token(
+    credentials: HTTPAuthorizationCredentials = Depends(security_scheme)
+) -> str:
+    """
+    Raw bearer token of the request.
+    
+    Only for work that runs after the response (background jobs), which must
+    bind its own client with the caller's JWT so RLS still applies.
+    
+    Args:
+        credentials: Bearer token from Authorization header
+        
+    Returns:
+        str: The user's JWT
+    """
+    return credentials.credentials
@@ -1,10 +1,45 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+from app.auth import token_cache
+from app.core import supabase_pool
+from app.services.ai_manager import ai_manager
+from app.services.analysis_cache import analysis_cache
+from app.services.chat_history import chat_history_cache
+from app.services.jobs import job_queue
+from app.services.llm_executor import llm_executor
+from app.services.metrics import CONTENT_TYPE, MetricsMiddleware, metrics, monitor_event_loop
+from app.services.rate_limiter import rate_limiter
+from app.services.usage_ledger import usage_ledger
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Drop idle users from the in-process rate limiter
+    eviction = asyncio.create_task(rate_limiter.run_eviction())
+    # Write buffered LLM usage entries to the ledger store
+    ledger_flusher = asyncio.create_task(usage_ledger.run_flusher())
+    # Event-loop lag probe (exported on /metrics)
+    lag_monitor = asyncio.create_task(monitor_event_loop())
+    # Background job workers; also resumes jobs left in the spool by a restart
+    await job_queue.start()
+    yield
+    eviction.cancel()
+    await job_queue.stop()
+    ledger_flusher.cancel()
+    lag_monitor.cancel()
+    await asyncio.to_thread(usage_ledger.flush)
+    # Release pooled Supabase connections on shutdown
+    await supabase_pool.aclose()
+
 
 app = FastAPI(
     title="Auramind API",
     description="Backend for Auramind - Digital Companion",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # CORS (Allow all for MVP dev)
@@ -14,7 +49,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
+# Outermost, so latency includes every other middleware
+app.add_middleware(MetricsMiddleware)
+
+# stats() snapshots exported on /metrics as auramind_<component>_<key>
+metrics.collector("llm_executor", llm_executor.stats)
+metrics.collector("supabase_pool", supabase_pool.stats)
+metrics.collector("token_cache", token_cache.stats)
+metrics.collector("rate_limiter", rate_limiter.stats)
+metrics.collector("analysis_cache", analysis_cache.stats)
+metrics.collector("chat_history_cache", chat_history_cache.stats)
+metrics.collector("job_queue", job_queue.stats)
+metrics.collector("single_flight", ai_manager.flights.stats)
+metrics.collector("usage_ledger", usage_ledger.stats)
 
 @app.get("/")
 async def root():
@@ -24,6 +73,11 @@ async def root():
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus text exposition of this worker's metrics"""
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
 from app.routers import mood, chat
 app.include_router(mood.router)
 app.include_router(chat.router)
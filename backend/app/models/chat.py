@@ -9,3 +9,4 @@ class ChatResponse(BaseModel):
     reply: str
     avatar_state: str = "STATE_NEUTRAL"
     remaining_calls: int = 20
+    prompt_tokens: Optional[int] = None  # Prompt size of this turn's Gemini call
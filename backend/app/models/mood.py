@@ -23,3 +23,7 @@ class MoodLogResponse(MoodLogCreate):
     
     model_config = ConfigDict(from_attributes=True)
 
+
+class PostLogStatus(BaseModel):
+    status: str = Field(..., description="Post-log processing state: pending, running, done or failed")
+    new_achievements: List[dict] = Field(default_factory=list, description="Badges earned by this log (once done)")
@@ -1,19 +1,26 @@
-from fastapi import APIRouter, HTTPException, Depends
+import json
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from app.models.chat import ChatRequest, ChatResponse
 from app.services.ai_manager import get_ai_manager
 from app.auth import get_current_user
-from app.core import get_supabase_with_auth
+from app.services.repositories import Repositories, get_repositories
 from app.services.rate_limiter import get_rate_limiter
-from supabase import Client
+from app.services.llm_executor import run_cancellable
+from app.services.chat_history import load_history, save_turn, update_summary
+from datetime import datetime, timezone
 
 router = APIRouter(prefix="/chat", tags=["AI Chat"])
 
 @router.post("/", response_model=ChatResponse)
 async def chat_with_ai(
     request: ChatRequest, 
+    http_request: Request,
+    background_tasks: BackgroundTasks,
     current_user: str = Depends(get_current_user),
     ai_manager = Depends(get_ai_manager),
-    supabase: Client = Depends(get_supabase_with_auth),
+    repos: Repositories = Depends(get_repositories),
     rate_limiter = Depends(get_rate_limiter)
 ):
     """
@@ -21,62 +28,156 @@ async def chat_with_ai(
     
     Flow:
     1. Authenticate & Check Rate Limit
-    2. Store User Message
-    3. Fetch History (Context)
-    4. AI Processing
-    5. Store Assistant Message
-    6. Return Response
+    2. Load History (Context) - from the per-user cache, DB only on a miss
+    3. AI Processing - history packed into a token budget (summary + newest messages)
+    4. Store User + Assistant Messages (one insert)
+    5. Return Response; messages that no longer fit are folded into the
+       rolling summary in the background
     """
     
     # 1. Rate Limiting
-    if not rate_limiter.is_allowed(current_user):
-        remaining = rate_limiter.get_remaining_calls(current_user)
+    if not await rate_limiter.is_allowed(current_user):
+        remaining = await rate_limiter.get_remaining_calls(current_user)
         raise HTTPException(
             status_code=429,
             detail=f"Rate limit exceeded. {remaining} calls remaining."
         )
 
     try:
-        # 2. Store User Message
-        supabase.table("chat_messages").insert({
-            "user_id": current_user,
-            "role": "user",
-            "content": request.message
-        }).execute()
+        sent_at = datetime.now(timezone.utc).isoformat()
         
-        # 3. Fetch History (Last 10 messages)
-        # Sort by created_at desc to get recent, then reverse back for context
-        history_response = supabase.table("chat_messages")\
-            .select("role, content")\
-            .eq("user_id", current_user)\
-            .order("created_at", desc=True)\
-            .limit(10)\
-            .execute()
-            
-        # Supabase returns most recent first, we need chronological order for AI
-        history = history_response.data[::-1] if history_response.data else []
+        # 2. Load History (recent messages + rolling summary, chronological order for AI)
+        history, summary = await load_history(repos, current_user)
         
-        # 4. AI Processing
-        ai_result = await ai_manager.chat(request.message, history)
+        # 3. AI Processing
+        # (cancelled if the client disconnects, freeing the LLM slot)
+        ai_result = await run_cancellable(http_request, ai_manager.chat(request.message, history, summary))
         
         reply_text = ai_result.get("reply", "Mình đang gặp chút trục trặc, bạn thử lại sau nhé.")
         avatar_state = ai_result.get("avatar_state", "STATE_NEUTRAL")
         
-        # 5. Store Assistant Message
-        supabase.table("chat_messages").insert({
-            "user_id": current_user,
-            "role": "assistant",
-            "content": reply_text,
-            "avatar_state": avatar_state
-        }).execute()
+        # 4. Store User + Assistant Messages
+        await save_turn(repos, current_user, request.message, sent_at, reply_text, avatar_state)
         
-        # 6. Return Response
+        context = ai_result.get("context")
+        if context is not None and context.overflow:
+            background_tasks.add_task(
+                update_summary, repos, current_user, context, ai_manager.summarize_chat
+            )
+        
+        # 5. Return Response
         return ChatResponse(
             reply=reply_text,
             avatar_state=avatar_state,
-            remaining_calls=rate_limiter.get_remaining_calls(current_user)
+            remaining_calls=await rate_limiter.get_remaining_calls(current_user),
+            prompt_tokens=(ai_result.get("usage") or {}).get("prompt_tokens")
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Chat Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/stream")
+async def chat_with_ai_stream(
+    request: ChatRequest,
+    current_user: str = Depends(get_current_user),
+    ai_manager = Depends(get_ai_manager),
+    repos: Repositories = Depends(get_repositories),
+    rate_limiter = Depends(get_rate_limiter)
+):
+    """
+    Streaming chat with Aura AI companion (Server-Sent Events).
+    
+    Same flow as POST /chat/, but tokens are forwarded as Gemini produces them.
+    
+    Events (each `data` is JSON):
+    - avatar_state: {"avatar_state": "STATE_..."} - sent once, before the reply text
+    - token: {"text": "..."} - reply chunks, in order
+    - done: {"reply": "...", "avatar_state": "...", "remaining_calls": n, "prompt_tokens": n}
+    - error: {"detail": "...", "reply": "<partial text>"} - instead of done when
+      Gemini failed mid-reply; the turn is not stored, the client may retry
+    
+    Both messages of the turn are stored after the stream completes. If the
+    client disconnects mid-stream the Gemini call is cancelled and nothing is stored.
+    """
+    
+    # 1. Rate Limiting (before the stream starts, so clients get a real 429)
+    if not await rate_limiter.is_allowed(current_user):
+        remaining = await rate_limiter.get_remaining_calls(current_user)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded. {remaining} calls remaining."
+        )
+
+    try:
+        sent_at = datetime.now(timezone.utc).isoformat()
+        
+        # 2. Load History (recent messages + rolling summary, chronological order for AI)
+        history, summary = await load_history(repos, current_user)
+    except Exception as e:
+        print(f"Chat Stream Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Filled in by event_stream for the post-response summary task
+    turn = {"context": None}
+
+    async def event_stream():
+        # 3. AI Processing (streamed)
+        reply_parts = []
+        avatar_state = "STATE_NEUTRAL"
+        context = None
+        error = None
+        async for event, value in ai_manager.chat_stream(request.message, history, summary):
+            if event == "avatar_state":
+                avatar_state = value
+                yield _sse("avatar_state", {"avatar_state": value})
+            elif event == "context":
+                context = value
+            elif event == "error":
+                error = value
+            else:
+                reply_parts.append(value)
+                yield _sse("token", {"text": value})
+        
+        if error is not None:
+            # Truncated reply: never store it as if it were complete
+            yield _sse("error", {"detail": error, "reply": "".join(reply_parts).strip()})
+            return
+        
+        reply_text = "".join(reply_parts).strip() or "Mình đang gặp chút trục trặc, bạn thử lại sau nhé."
+        turn["context"] = context
+        
+        # 4. Store User + Assistant Messages
+        try:
+            await save_turn(repos, current_user, request.message, sent_at, reply_text, avatar_state)
+        except Exception as e:
+            print(f"Chat Stream Persist Error: {e}")
+        
+        # 5. Final event
+        yield _sse("done", {
+            "reply": reply_text,
+            "avatar_state": avatar_state,
+            "remaining_calls": await rate_limiter.get_remaining_calls(current_user),
+            "prompt_tokens": context.prompt_tokens if context is not None else None
+        })
+
+    async def summarize_overflow():
+        # Messages that no longer fit -> rolling summary (after the response is closed)
+        context = turn["context"]
+        if context is not None and context.overflow:
+            await update_summary(repos, current_user, context, ai_manager.summarize_chat)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(summarize_overflow)
+    )
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import List
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Query, Request, Response
+from typing import List, Optional
 from datetime import datetime
-from collections import Counter, defaultdict
-from app.models.mood import MoodLogCreate, MoodLogResponse
-from app.models.calendar import DaySummary, MonthlyCalendarResponse
-from app.core import get_supabase_with_auth
+from app.models.mood import MoodLogCreate, MoodLogResponse, PostLogStatus
+from app.models.calendar import MonthlyCalendarResponse
+from app.services.pipeline import StageTimer
+from app.services.repositories import Repositories, decode_cursor, encode_cursor, get_repositories
+from app.services.jobs import get_job_queue, JobQueue
+from app.services.post_log import POST_LOG_JOB, enqueue_post_log
 from app.auth import get_current_user
-from supabase import Client
+from app.core import get_access_token
 
 router = APIRouter(prefix="/mood-logs", tags=["Mood Logs"])
 
@@ -14,8 +16,11 @@ router = APIRouter(prefix="/mood-logs", tags=["Mood Logs"])
 @router.post("/", response_model=MoodLogResponse)
 async def create_mood_log(
     log: MoodLogCreate,
+    http_request: Request,
+    response: Response,
     current_user: str = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_with_auth)
+    access_token: str = Depends(get_access_token),
+    repos: Repositories = Depends(get_repositories)
 ):
     """
     Create a new mood log for the authenticated user.
@@ -29,34 +34,50 @@ async def create_mood_log(
     Features:
     - Rate limiting (20 calls per hour per user)
     - Context awareness from previous logs
-    - Automatic profile avatar_state update
+    - Automatic profile avatar_state update, streak and badge checks, run as a
+      background job after the response; poll GET /mood-logs/{id}/achievements
+      (the log id is the job id) for the badges this log earned
+    - Per-stage durations are returned in the Server-Timing header
     
     Requires authentication via Bearer token in Authorization header.
     RLS automatically enforces that user_id matches auth.uid().
     """
     from app.services.ai_manager import get_ai_manager
+    from app.services.llm_executor import run_cancellable
     from app.services.rate_limiter import get_rate_limiter
     
     # Check rate limit
     rate_limiter = get_rate_limiter()
-    if not rate_limiter.is_allowed(current_user):
-        remaining = rate_limiter.get_remaining_calls(current_user)
+    if not await rate_limiter.is_allowed(current_user):
+        remaining = await rate_limiter.get_remaining_calls(current_user)
         raise HTTPException(
             status_code=429,
             detail=f"Rate limit exceeded. You have {remaining} AI analysis calls remaining this hour. Please try again later."
         )
     
-    # Run AI agent pipeline if there's content to analyze
-    if log.note or log.voice_transcript:
-        ai_manager = get_ai_manager()
-        
+    ai_manager = get_ai_manager()
+    
+    async def run_ai() -> Optional[dict]:
+        # Run AI agent pipeline if there's content to analyze
+        if not (log.note or log.voice_transcript):
+            return None
         # Pass user context for context-aware responses
-        ai_results = await ai_manager.analyze_mood(
+        # (cancelled if the client disconnects, freeing the LLM slot)
+        return await run_cancellable(http_request, ai_manager.analyze_mood(
             log.note, 
             log.voice_transcript,
             user_id=current_user,
-            supabase=supabase
-        )
+            supabase=repos.db
+        ))
+    
+    timer = StageTimer()
+    with timer.measure("ai"):
+        ai_results = await run_ai()
+    
+    if ai_results:
+        timer.timings.update({
+            f"ai_{name}": duration for name, duration in ai_results.get("timings", {}).items()
+        })
         
         # Override/populate fields with AI analysis
         log.mood_score = ai_results.get('mood_score', log.mood_score)
@@ -79,40 +100,21 @@ async def create_mood_log(
     
     try:
         # Insert mood log
-        response = supabase.table("mood_logs").insert(data).execute()
-        # Supabase-py v2 returns a response object with .data
-        if not response.data:
+        with timer.measure("insert"):
+            created_log = await repos.mood_logs.insert(data)
+        if not created_log:
             raise HTTPException(status_code=500, detail="Failed to create mood log")
         
-        created_log = response.data[0]
-        new_achievements = []
-        
-        # --- Update Profile & Check Badges ---
+        # --- Update Profile & Check Badges (background job) ---
         try:
-            # 1. Update basic profile info (avatar state)
-            supabase.table("profiles").update({
-                "avatar_state": avatar_state
-            }).eq("user_id", current_user).execute()
-            
-            # 2. Fetch updated profile (trigger has run) to get new streak info
-            profile_response = supabase.table("profiles").select("*").eq("id", current_user).single().execute()
-            current_profile = profile_response.data
-            
-            if current_profile:
-                from app.services.badges import BadgeService
-                badge_service = BadgeService(supabase)
-                new_achievements = await badge_service.check_new_badges(
-                    user_id=current_user,
-                    new_log=created_log,
-                    current_profile=current_profile
-                )
-                
-        except Exception as flow_error:
+            await enqueue_post_log(current_user, access_token, created_log, avatar_state)
+        except Exception as queue_error:
             # Non-critical, log and continue
-            print(f"Post-log flow error: {flow_error}")
-            
-        # Attach new achievements to response
-        created_log['new_achievements'] = new_achievements
+            print(f"Post-log enqueue error: {queue_error}")
+        
+        # Badges arrive via GET /mood-logs/{id}/achievements once the job ran
+        created_log['new_achievements'] = []
+        response.headers["Server-Timing"] = timer.server_timing()
         return created_log
 
     except HTTPException:
@@ -122,33 +124,104 @@ async def create_mood_log(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/", response_model=List[MoodLogResponse])
+@router.get("/{log_id}/achievements", response_model=PostLogStatus)
+async def get_log_achievements(
+    log_id: str,
+    current_user: str = Depends(get_current_user),
+    job_queue: JobQueue = Depends(get_job_queue)
+):
+    """
+    Post-log processing state and the badges a mood log earned.
+    
+    Poll after POST /mood-logs/ until status is "done" (usually well under a
+    second). Results are kept for JOB_RESULT_TTL_SECONDS; older or unknown
+    logs return 404.
+    
+    Requires authentication via Bearer token in Authorization header.
+    """
+    job = await job_queue.status(log_id)
+    if not job or job["kind"] != POST_LOG_JOB or job["owner"] != current_user:
+        raise HTTPException(status_code=404, detail="No post-log result for this mood log")
+    
+    return PostLogStatus(status=job["status"], new_achievements=job["result"] or [])
+
+
+# Page size for ?cursor= requests that do not pass ?limit=
+DEFAULT_PAGE_SIZE = 50
+
+# Columns behind MoodLogResponse, and the ones clients may omit with ?exclude=
+MOOD_LOG_COLUMNS = [name for name in MoodLogResponse.model_fields if name != "new_achievements"]
+EXCLUDABLE_FIELDS = {
+    "note", "voice_transcript", "activities", "primary_emotion",
+    "summary", "health_metrics", "ai_feedback", "avatar_state"
+}
+
+
+@router.get("/", response_model=List[MoodLogResponse], response_model_exclude_unset=True)
 async def get_mood_logs(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Page size (default 50 when paging with a cursor)"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    start: Optional[datetime] = Query(None, description="Only logs created at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only logs created before this time"),
+    exclude: Optional[str] = Query(None, description="Comma-separated fields to omit, e.g. note,voice_transcript"),
     current_user: str = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_with_auth)
+    repos: Repositories = Depends(get_repositories)
 ):
     """
-    Get all mood logs for the authenticated user.
+    Get the authenticated user's mood logs, newest first.
+    
+    Without `limit` or `cursor` every log is returned, as the dashboard
+    expects. With them, pagination is keyset-based on (created_at, id): when
+    more logs exist, the response carries an `X-Next-Cursor` header; pass it
+    back as `?cursor=` to get the next page. Excluded fields are left out of
+    the JSON entirely.
     
     Requires authentication via Bearer token in Authorization header.
     RLS automatically filters: USING (auth.uid() = user_id)
     Manual .eq("user_id", current_user) filter kept for defense-in-depth.
     """
+    excluded = {field.strip() for field in exclude.split(",") if field.strip()} if exclude else set()
+    if excluded - EXCLUDABLE_FIELDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot exclude: {', '.join(sorted(excluded - EXCLUDABLE_FIELDS))}"
+        )
+    
+    try:
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if position and limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    
     try:
-        response = supabase.table("mood_logs").select("*").eq("user_id", current_user).execute()
-        return response.data
+        rows, next_position = await repos.mood_logs.page(
+            current_user,
+            limit,
+            cursor=position,
+            start=start.isoformat() if start else None,
+            end=end.isoformat() if end else None,
+            columns=", ".join(column for column in MOOD_LOG_COLUMNS if column not in excluded)
+        )
     except Exception as e:
         print(f"DB Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    
+    if next_position:
+        response.headers["X-Next-Cursor"] = encode_cursor(next_position)
+    return rows
 
 
 @router.get("/calendar/", response_model=MonthlyCalendarResponse)
 async def get_calendar_data(
+    http_request: Request,
+    background_tasks: BackgroundTasks,
     month: int = Query(..., ge=1, le=12, description="Month (1-12)"),
     year: int = Query(..., ge=2020, le=2050, description="Year"),
     include_insight: bool = Query(False, description="Include AI-generated monthly insight"),
     current_user: str = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_with_auth)
+    repos: Repositories = Depends(get_repositories)
 ):
     """
     Get aggregated mood and health data for holistic calendar view.
@@ -160,33 +233,27 @@ async def get_calendar_data(
     - Health summary (steps, sleep, meditation, etc.)
     - Log count
     
-    Optionally includes AI-generated correlation insight (uses 1 API call).
+    Optionally includes AI-generated correlation insight (uses 1 API call the
+    first time; cached per month afterwards and refreshed when new logs land).
     Philosophy: "Calendar là nơi kể lại câu chuyện của người dùng"
     """
     from app.services.ai_manager import get_ai_manager
+    from app.services.llm_executor import run_cancellable
     from app.services.rate_limiter import get_rate_limiter
-    from app.models.calendar import HealthSummary
+    from app.services.calendar import day_summary_from_row, get_cached_insight
     
-    # Build date range for the month
-    start_date = f"{year}-{month:02d}-01T00:00:00"
+    # Build date range for the month (log_date is a UTC date)
+    start_date = f"{year}-{month:02d}-01"
     if month == 12:
-        end_date = f"{year + 1}-01-01T00:00:00"
+        end_date = f"{year + 1}-01-01"
     else:
-        end_date = f"{year}-{month + 1:02d}-01T00:00:00"
+        end_date = f"{year}-{month + 1:02d}-01"
     
     try:
-        # Query mood logs for the month (including health_metrics)
-        response = supabase.table("mood_logs")\
-            .select("mood_score, avatar_state, activities, health_metrics, created_at")\
-            .eq("user_id", current_user)\
-            .gte("created_at", start_date)\
-            .lt("created_at", end_date)\
-            .order("created_at", desc=False)\
-            .execute()
+        # One pre-aggregated row per day (maintained by triggers, migration 007)
+        rows = await repos.daily_summaries.list_between(current_user, start_date, end_date)
         
-        logs = response.data or []
-        
-        if not logs:
+        if not rows:
             return MonthlyCalendarResponse(
                 year=year,
                 month=month,
@@ -195,116 +262,48 @@ async def get_calendar_data(
                 total_logs=0
             )
         
-        # Aggregate by date
-        daily_data = defaultdict(lambda: {
-            "mood_scores": [],
-            "avatar_states": [],
-            "activities": [],
-            "health_metrics": []  # Collect all health metrics for aggregation
-        })
-        
-        for log in logs:
-            # Parse date (handle timezone)
-            created_at = log["created_at"]
-            if isinstance(created_at, str):
-                date_str = created_at[:10]  # Extract YYYY-MM-DD
-            else:
-                date_str = created_at.strftime("%Y-%m-%d")
-            
-            daily_data[date_str]["mood_scores"].append(log["mood_score"])
-            if log.get("avatar_state"):
-                daily_data[date_str]["avatar_states"].append(log["avatar_state"])
-            if log.get("activities"):
-                daily_data[date_str]["activities"].extend(log["activities"])
-            if log.get("health_metrics"):
-                daily_data[date_str]["health_metrics"].append(log["health_metrics"])
-        
-        # Build day summaries
-        days = []
-        insight_data = []  # For AI analysis
+        days = [day_summary_from_row(row) for row in rows]
         
-        for date_str, data in sorted(daily_data.items()):
-            avg_mood = sum(data["mood_scores"]) / len(data["mood_scores"])
-            
-            # Most common avatar state
-            if data["avatar_states"]:
-                primary_state = Counter(data["avatar_states"]).most_common(1)[0][0]
-            else:
-                primary_state = "STATE_NEUTRAL"
-            
-            # Top 3 activities
-            if data["activities"]:
-                top_activities = [a for a, _ in Counter(data["activities"]).most_common(3)]
-            else:
-                top_activities = []
-            
-            # Aggregate health metrics (if any exist)
-            health_summary = None
-            if data["health_metrics"]:
-                health_agg = {
-                    "steps": [],
-                    "sleep_hours": [],
-                    "meditation_min": [],
-                    "water_glasses": [],
-                    "exercise_min": []
-                }
-                for hm in data["health_metrics"]:
-                    if hm.get("steps") is not None:
-                        health_agg["steps"].append(hm["steps"])
-                    if hm.get("sleep_hours") is not None:
-                        health_agg["sleep_hours"].append(hm["sleep_hours"])
-                    if hm.get("meditation_min") is not None:
-                        health_agg["meditation_min"].append(hm["meditation_min"])
-                    if hm.get("water_glasses") is not None:
-                        health_agg["water_glasses"].append(hm["water_glasses"])
-                    if hm.get("exercise_min") is not None:
-                        health_agg["exercise_min"].append(hm["exercise_min"])
-                
-                # Only create summary if at least one metric exists
-                if any(health_agg.values()):
-                    health_summary = HealthSummary(
-                        total_steps=sum(health_agg["steps"]) if health_agg["steps"] else None,
-                        avg_sleep_hours=round(sum(health_agg["sleep_hours"]) / len(health_agg["sleep_hours"]), 1) if health_agg["sleep_hours"] else None,
-                        total_meditation_min=sum(health_agg["meditation_min"]) if health_agg["meditation_min"] else None,
-                        avg_water_glasses=round(sum(health_agg["water_glasses"]) / len(health_agg["water_glasses"]), 1) if health_agg["water_glasses"] else None,
-                        total_exercise_min=sum(health_agg["exercise_min"]) if health_agg["exercise_min"] else None
-                    )
-            
-            days.append(DaySummary(
-                date=date_str,
-                average_mood_score=round(avg_mood, 1),
-                primary_avatar_state=primary_state,
-                top_activities=top_activities,
-                log_count=len(data["mood_scores"]),
-                health_summary=health_summary
-            ))
-            
-            # Prepare data for insight agent (include health for correlation)
-            insight_data.append({
-                "date": date_str,
-                "avg_mood": avg_mood,
-                "avatar_state": primary_state,
-                "activities": top_activities,
-                "health": health_summary.model_dump() if health_summary else None
-            })
+        # Prepare data for insight agent (include health for correlation)
+        insight_data = [
+            {
+                "date": day.date,
+                "avg_mood": day.average_mood_score,
+                "avatar_state": day.primary_avatar_state,
+                "activities": day.top_activities,
+                "health": day.health_summary.model_dump() if day.health_summary else None
+            }
+            for day in days
+        ]
         
-        # Generate monthly insight if requested (and rate limit allows)
+        # Monthly insight if requested: served from the persistent cache when
+        # the month is unchanged, otherwise generated (if rate limit allows)
         monthly_insight = None
         if include_insight and len(days) >= 3:
-            rate_limiter = get_rate_limiter()
-            if rate_limiter.is_allowed(current_user):
-                ai_manager = get_ai_manager()
+            async def generate_insight() -> Optional[str]:
+                if not await get_rate_limiter().is_allowed(current_user):
+                    return None
                 # Use correlation analysis for holistic insight
-                monthly_insight = await ai_manager.get_holistic_insight(insight_data)
+                return await get_ai_manager().get_holistic_insight(insight_data, user_id=current_user)
+            
+            monthly_insight = await run_cancellable(
+                http_request,
+                get_cached_insight(
+                    repos, current_user, year, month, insight_data,
+                    generate_insight, background_tasks
+                )
+            )
         
         return MonthlyCalendarResponse(
             year=year,
             month=month,
             days=days,
             monthly_insight=monthly_insight,
-            total_logs=len(logs)
+            total_logs=sum(day.log_count for day in days)
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Calendar DB Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,159 @@
+"""
+Adaptive concurrency limit (AIMD) for LLM calls
+
+A fixed limit is either too low for a healthy provider or far too high for a
+degraded one: when Gemini slows down, hundreds of calls sit in flight, each
+holding a request open. AdaptiveLimiter moves the limit like TCP congestion
+control:
+
+- a congestion signal (timeout, overload error, or a call slower than its
+  agent's slow-call limit) cuts the limit multiplicatively (x `backoff`),
+  at most once per round: only calls admitted after the last cut can cut again
+- a healthy call while the limit is actually used raises it additively
+  (about +1 per `limit` successes)
+
+The limit stays between `min_limit` and `max_limit`. Callers that cannot get
+a slot within `queue_timeout` get LLMOverloadedError instead of waiting
+behind a slow provider, which keeps tail latency bounded.
+"""
+import asyncio
+from collections import deque
+from time import monotonic
+from typing import Deque, Optional
+
+
+class LLMOverloadedError(Exception):
+    """Raised when no LLM slot frees up within the queue timeout"""
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limiter whose limit adapts to latency and errors
+
+    Usage:
+        ticket = await limiter.acquire()
+        try:
+            ...call...
+        finally:
+            limiter.release(ticket, dropped=<congestion signal?>)
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        initial_limit: Optional[int] = None,
+        backoff: float = 0.9,
+        queue_timeout: Optional[float] = None
+    ):
+        """
+        Initialize limiter
+
+        Args:
+            max_limit: Upper bound (and default starting point) for the limit
+            min_limit: Lower bound for the limit
+            initial_limit: Starting limit (defaults to max_limit)
+            backoff: Factor applied to the limit on a congestion signal
+            queue_timeout: Seconds a caller may wait for a slot (None: forever)
+        """
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self._limit = float(min(max(initial_limit or self.max_limit, self.min_limit), self.max_limit))
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = float("-inf")
+        self.decreases = 0
+        self.rejected = 0
+
+    @property
+    def limit(self) -> int:
+        """Current number of calls allowed in flight"""
+        return int(self._limit)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> float:
+        """
+        Wait for a slot
+
+        Returns:
+            Ticket to pass to release()
+
+        Raises:
+            LLMOverloadedError: If no slot is free within queue_timeout
+        """
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return monotonic()
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            # Shielded: a timeout or cancellation must not lose a slot granted meanwhile
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self._remove(future)
+                self.rejected += 1
+                raise LLMOverloadedError(
+                    f"No LLM slot within {self.queue_timeout}s ({self.in_flight} in flight, limit {self.limit})"
+                )
+            # Granted right at the deadline: keep the slot
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release_slot()
+            else:
+                future.cancel()
+                self._remove(future)
+            raise
+        return monotonic()
+
+    def release(self, ticket: float, dropped: bool = False) -> None:
+        """
+        Free a slot and adapt the limit
+
+        Args:
+            ticket: Value returned by acquire()
+            dropped: True for a congestion signal (timeout, overload, slow call)
+        """
+        if dropped:
+            if ticket >= self._last_decrease:
+                self._limit = max(self.min_limit, self._limit * self.backoff)
+                self._last_decrease = monotonic()
+                self.decreases += 1
+        elif self.in_flight * 2 >= self.limit:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+        self._release_slot()
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.limit:
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _remove(self, future: asyncio.Future):
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+
+    def stats(self) -> dict:
+        """Snapshot for diagnostics"""
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "decreases": self.decreases,
+            "rejected": self.rejected,
+        }
@@ -1,10 +1,21 @@
 import os
+import asyncio
+import re
 import json
 import google.generativeai as genai
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
-from typing import Optional
-from supabase import Client
+from typing import Any, AsyncIterator, List, Optional, Tuple
+from pydantic import BaseModel, Field, ValidationError
+from app.core import SupabaseClient
+from app.services.metrics import AI_FALLBACKS
+from app.services.analysis_cache import AnalysisCache, analysis_cache, analysis_key
+from app.services.chat_context import ChatContext, ContextBuilder
+from app.services.chat_history import CHAT_HISTORY_SIZE
+from app.services.llm_executor import LLMExecutor, llm_executor
+from app.services.pipeline import StageGraph, StageTimer
+from app.services.single_flight import SingleFlight, flight_key
+from app.services.repositories import MoodLogRepository
 
 load_dotenv()
 
@@ -13,6 +24,33 @@ api_key = os.environ.get("GEMINI_API_KEY")
 if api_key:
     genai.configure(api_key=api_key)
 
+# Mood-log pipeline mode:
+# - "split": AnalyzerAgent + EmpathyAgent (2 LLM calls, default)
+# - "fused": FusedMoodAgent (1 structured JSON call, falls back to split on invalid output)
+PIPELINE_SPLIT = "split"
+PIPELINE_FUSED = "fused"
+AI_PIPELINE_MODE = os.environ.get("AI_PIPELINE_MODE", PIPELINE_SPLIT).lower()
+
+
+
+AVATAR_STATES = {
+    "STATE_NEUTRAL",
+    "STATE_JOYFUL",
+    "STATE_SAD",
+    "STATE_ANXIOUS",
+    "STATE_EXHAUSTED",
+    "STATE_OVERWHELMED",
+}
+AVATAR_STATE_PATTERN = re.compile(r"STATE_[A-Z]+")
+
+
+def clean_activities(activities: list) -> List[str]:
+    """Filter out null, empty strings, and non-string values from an activities array"""
+    return [
+        str(a).strip() for a in (activities or [])
+        if a is not None and str(a).strip()
+    ]
+
 class AnalyzerAgent:
     """
     Analyzer Agent - Extracts emotional metrics from user journal entries
@@ -20,12 +58,26 @@ class AnalyzerAgent:
     Enhancements:
     - Validates activities array (no null/empty strings)
     - Fallback emotion changed to "neutral"
+    - Results cached on disk by normalized text (see analysis_cache)
     """
-    def __init__(self):
+    name = "analyzer"
+    # Bump whenever the prompt below changes, so cached results are not reused
+    PROMPT_VERSION = "1"
+
+    def __init__(self, executor: Optional[LLMExecutor] = None, cache: Optional[AnalysisCache] = None):
         self.model = genai.GenerativeModel('gemini-1.5-flash',
             generation_config={"response_mime_type": "application/json"})
+        self.executor = executor or llm_executor
+        self.cache = cache or analysis_cache
 
     async def analyze(self, text: str) -> dict:
+        model_name = getattr(self.model, "model_name", None) or type(self.model).__name__
+        key = analysis_key(text, str(model_name), self.PROMPT_VERSION)
+        # SQLite may wait on other workers' writes: keep it off the event loop
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            return cached
+        
         prompt = f"""Role: Bạn là một chuyên gia phân tích tâm lý học dữ liệu (Data Psychologist).
 Task: Phân tích nội dung nhật ký người dùng để trích xuất các chỉ số cảm xúc.
 Input: {text}
@@ -45,25 +97,21 @@ Output Format:
   "summary": "[Tóm tắt trạng thái trong 1 câu]"
 }}"""
         try:
-            response = self.model.generate_content(prompt)
+            response = await self.executor.generate(self.model, prompt, agent=self.name)
             result = json.loads(response.text)
             
             # Validate and clean activities array
-            activities = result.get('activities', [])
-            # Filter out null, empty strings, and non-string values
-            cleaned_activities = [
-                str(a).strip() for a in activities 
-                if a is not None and str(a).strip()
-            ]
-            result['activities'] = cleaned_activities
+            result['activities'] = clean_activities(result.get('activities', []))
             
             # Ensure primary_emotion has a default
             if not result.get('primary_emotion'):
                 result['primary_emotion'] = 'neutral'
             
+            await asyncio.to_thread(self.cache.put, key, result)
             return result
         except Exception as e:
             print(f"Analyzer Error: {e}")
+            AI_FALLBACKS.inc(self.name)
             # Fallback with neutral emotion
             return {
                 "mood_score": 5, 
@@ -82,10 +130,13 @@ class EmpathyAgent:
     - Context awareness from previous mood logs
     - Streak detection and encouragement
     """
-    def __init__(self):
+    name = "empathy"
+
+    def __init__(self, executor: Optional[LLMExecutor] = None):
         self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.executor = executor or llm_executor
 
-    async def get_user_context(self, user_id: str, supabase: Client) -> dict:
+    async def get_user_context(self, user_id: str, supabase: SupabaseClient) -> dict:
         """
         Fetch recent mood logs to provide context
         
@@ -100,14 +151,9 @@ class EmpathyAgent:
             # Fetch mood logs from last 7 days
             seven_days_ago = (datetime.utcnow() - timedelta(days=7)).isoformat()
             
-            response = supabase.table("mood_logs")\
-                .select("created_at, mood_score")\
-                .eq("user_id", user_id)\
-                .gte("created_at", seven_days_ago)\
-                .order("created_at", desc=True)\
-                .execute()
-            
-            logs = response.data if response.data else []
+            logs = await MoodLogRepository(supabase).list_since(
+                user_id, seven_days_ago, columns="created_at, mood_score"
+            )
             
             # Detect consecutive day streak
             streak = self._calculate_streak(logs)
@@ -174,12 +220,89 @@ Constraints:
 - Tối ưu câu trả lời để sử dụng ít token nhất có thể nhưng vẫn đảm bảo chất lượng
 Target: Giúp người dùng cảm thấy được lắng nghe và vỗ về."""
         try:
-            response = self.model.generate_content(prompt)
+            response = await self.executor.generate(self.model, prompt, agent=self.name)
             return response.text.strip()
         except Exception as e:
             print(f"Empathy Error: {e}")
+            AI_FALLBACKS.inc(self.name)
             return "Mình đang lắng nghe bạn. Hãy chia sẻ thêm nhé."
 
+class FusedMoodOutput(BaseModel):
+    """Schema the fused agent's JSON must satisfy"""
+    mood_score: int = Field(..., ge=1, le=10)
+    stress_level: int = Field(..., ge=1, le=10)
+    energy_level: int = Field(..., ge=1, le=10)
+    primary_emotion: Optional[str] = None
+    activities: List[Optional[str]] = []
+    summary: str = ""
+    ai_feedback: str = Field(..., min_length=1)
+
+
+class FusedMoodAgent:
+    """
+    Fused Agent - Analyzer + Empathy in a single structured JSON call
+    
+    Halves LLM round trips per mood log. Output is validated against
+    FusedMoodOutput; callers fall back to the two-call path when it fails.
+    """
+    name = "fused"
+
+    def __init__(self, executor: Optional[LLMExecutor] = None):
+        self.model = genai.GenerativeModel('gemini-1.5-flash',
+            generation_config={"response_mime_type": "application/json"})
+        self.executor = executor or llm_executor
+
+    async def analyze_and_respond(self, text: str, user_context: Optional[dict] = None) -> dict:
+        """
+        Extract emotional metrics and write the empathetic reply in one call
+        
+        Args:
+            text: Journal entry (note + voice transcript)
+            user_context: Optional context from EmpathyAgent.get_user_context
+            
+        Returns:
+            dict with analyzer fields plus ai_feedback
+            
+        Raises:
+            ValidationError / ValueError: If the model output does not match the schema
+        """
+        context_str = ""
+        if user_context and user_context.get('has_context'):
+            streak = user_context.get('streak', 0)
+            if streak >= 3:
+                context_str = f"\nNgười dùng đã ghi nhật ký {streak} ngày liên tiếp - hãy khen ngợi điều này trong ai_feedback!"
+        
+        prompt = f"""Role: Bạn là Aura - vừa là chuyên gia phân tích tâm lý học dữ liệu, vừa là người bạn ảo thấu cảm.
+Input: {text}{context_str}
+Task:
+1. Phân tích nhật ký để trích xuất các chỉ số cảm xúc (thang điểm 1-10).
+2. Viết ai_feedback bằng tiếng Việt theo kỹ thuật Lắng nghe phản chiếu (Reflective Listening), xưng "mình", gọi "bạn".
+Constraints:
+- Chỉ trả về JSON nguyên bản, không chào hỏi hay giải thích thêm
+- ai_feedback ngắn gọn (không quá 3 câu), KHÔNG đưa ra lời khuyên y khoa hay chẩn đoán bệnh
+- Nếu mood_score < 3, ai_feedback phải kèm theo một lời trấn an sâu sắc
+- Tối ưu câu trả lời để sử dụng ít token nhất có thể nhưng vẫn đảm bảo chất lượng
+
+Output Format:
+{{
+  "mood_score": [1-10],
+  "stress_level": [1-10],
+  "energy_level": [1-10],
+  "primary_emotion": "[vui, buồn, giận, lo lắng, bình yên, mệt mỏi, neutral]",
+  "activities": ["tag1", "tag2"],
+  "summary": "[Tóm tắt trạng thái trong 1 câu]",
+  "ai_feedback": "[Phản hồi thấu cảm]"
+}}"""
+        response = await self.executor.generate(self.model, prompt, agent=self.name)
+        output = FusedMoodOutput.model_validate_json(response.text)
+        
+        result = output.model_dump()
+        result['activities'] = clean_activities(result['activities'])
+        result['ai_feedback'] = result['ai_feedback'].strip()
+        if not result.get('primary_emotion'):
+            result['primary_emotion'] = 'neutral'
+        return result
+
 class AvatarOrchestratorAgent:
     """
     Avatar Orchestrator - Determines avatar state based on mood and stress levels
@@ -220,26 +343,35 @@ class AvatarOrchestratorAgent:
 class ChatAgent:
     """
     Chat Agent - Handles real-time conversation with memory
+    
+    History is packed into a token budget by ContextBuilder (rolling summary +
+    newest messages) instead of a fixed message count.
     """
-    def __init__(self):
+    name = "chat"
+    FALLBACK_REPLY = "Mình đang lắng nghe, bạn nói tiếp đi..."
+
+    def __init__(self, executor: Optional[LLMExecutor] = None, context_builder: Optional[ContextBuilder] = None):
         self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.executor = executor or llm_executor
+        # Leave room for one turn in the history buffer, so messages that
+        # never fit are summarized before the buffer drops them
+        self.context_builder = context_builder or ContextBuilder(max_messages=max(CHAT_HISTORY_SIZE - 2, 1))
 
-    async def chat(self, message: str, history: list[dict]) -> dict:
+    async def chat(self, message: str, history: list[dict], summary: Optional[dict] = None) -> dict:
         """
         Chat with AI using conversation history
         
         Args:
             message: Current user message
-            history: List of previous messages [{"role": "user/assistant", "content": "..."}]
+            history: List of previous messages [{"role": "user/assistant", "content": "...", "created_at": ...}]
+            summary: Optional rolling summary row ({"summary", "summarized_until"})
             
         Returns:
-            dict containing reply and avatar_state
+            dict containing reply, avatar_state, usage (prompt token report)
+            and context (the ChatContext used, incl. overflow to summarize)
         """
-        # Format history for prompt
-        history_str = ""
-        for msg in history:
-            role = "User" if msg['role'] == 'user' else "Aura"
-            history_str += f"{role}: {msg['content']}\n"
+        context = self.context_builder.build(history, summary)
+        history_str = context.render()
             
         prompt = f"""Role: Bạn là Aura, một người bạn ảo thấu cảm.
 Context History:
@@ -266,15 +398,163 @@ Output Format (JSON Only):
   "avatar_state": "STATE_..."
 }}"""
         
+        context.record_prompt(prompt)
         try:
-            response = self.model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
-            return json.loads(response.text)
+            response = await self.executor.generate(
+                self.model,
+                prompt,
+                agent=self.name,
+                generation_config={"response_mime_type": "application/json"}
+            )
+            context.record_prompt(prompt, response)
+            result = json.loads(response.text)
         except Exception as e:
             print(f"Chat Agent Error: {e}")
-            return {
-                "reply": "Mình đang lắng nghe, bạn nói tiếp đi...",
+            AI_FALLBACKS.inc(self.name)
+            result = {
+                "reply": self.FALLBACK_REPLY,
                 "avatar_state": "STATE_NEUTRAL"
             }
+        result["usage"] = context.usage()
+        result["context"] = context
+        return result
+
+    async def chat_stream(
+        self, message: str, history: list[dict], summary: Optional[dict] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming variant of chat()
+        
+        The model is asked to put the avatar state alone on the first line, so
+        it can be sent before the reply text starts streaming.
+        
+        Args:
+            message: Current user message
+            history: List of previous messages [{"role": "user/assistant", "content": "...", "created_at": ...}]
+            summary: Optional rolling summary row ({"summary", "summarized_until"})
+            
+        Yields:
+            ("avatar_state", "STATE_...") once, then ("token", text) chunks,
+            then ("context", ChatContext) with the prompt token report.
+            If Gemini fails after text was already sent, ("error", message)
+            comes before ("context", ...): the reply is truncated.
+        """
+        context = self.context_builder.build(history, summary)
+        history_str = context.render()
+        
+        prompt = f"""Role: Bạn là Aura, một người bạn ảo thấu cảm.
+Context History:
+{history_str}
+Current User Message: {message}
+
+Task:
+1. Xác định trạng thái Avatar phù hợp nhất với cảm xúc của người dùng:
+   STATE_NEUTRAL, STATE_JOYFUL, STATE_SAD, STATE_ANXIOUS, STATE_EXHAUSTED, STATE_OVERWHELMED
+2. Đưa ra phản hồi bằng tiếng Việt: ngắn gọn (1-3 câu), tự nhiên, thấu hiểu, dùng "mình" và "bạn".
+
+Output Format (plain text, KHÔNG dùng JSON):
+Dòng 1: chỉ ghi trạng thái Avatar (ví dụ: STATE_SAD)
+Từ dòng 2: nội dung phản hồi"""
+        
+        buffer = ""
+        state_sent = False
+        context.record_prompt(prompt)
+        try:
+            async for chunk in self.executor.stream(self.model, prompt, agent=self.name):
+                if getattr(chunk, "usage_metadata", None) is not None:
+                    context.record_prompt(prompt, chunk)
+                text = chunk.text or ""
+                if state_sent:
+                    if text:
+                        yield ("token", text)
+                    continue
+                
+                buffer += text
+                if "\n" not in buffer:
+                    continue
+                first_line, rest = buffer.split("\n", 1)
+                state, leftover = self._parse_state_line(first_line)
+                yield ("avatar_state", state)
+                state_sent = True
+                reply_start = "\n".join(part for part in (leftover, rest) if part).lstrip()
+                if reply_start:
+                    yield ("token", reply_start)
+            
+            if not state_sent:
+                # Stream ended without a newline
+                state, leftover = self._parse_state_line(buffer)
+                yield ("avatar_state", state)
+                state_sent = True
+                yield ("token", leftover or self.FALLBACK_REPLY)
+        except Exception as e:
+            print(f"Chat Agent Stream Error: {e}")
+            AI_FALLBACKS.inc(self.name)
+            if not state_sent:
+                yield ("avatar_state", "STATE_NEUTRAL")
+                yield ("token", self.FALLBACK_REPLY)
+            else:
+                # Part of the reply is out already; a fallback would not fit after it
+                yield ("error", "Reply interrupted")
+        yield ("context", context)
+
+    @staticmethod
+    def _parse_state_line(line: str) -> Tuple[str, str]:
+        """
+        Extract the avatar state from the first streamed line
+        
+        Returns:
+            (avatar_state, leftover text that was not part of the state marker)
+        """
+        match = AVATAR_STATE_PATTERN.search(line)
+        if match and match.group(0) in AVATAR_STATES:
+            leftover = (line[:match.start()] + line[match.end():]).strip(" :*[]`")
+            return match.group(0), leftover
+        return "STATE_NEUTRAL", line.strip()
+
+
+
+class ChatSummaryAgent:
+    """
+    Chat Summary Agent - Folds older chat messages into a rolling summary
+    
+    Called in the background when messages no longer fit the chat prompt's
+    token budget; the result is stored in chat_summaries and reused.
+    """
+    name = "summary"
+
+    def __init__(self, executor: Optional[LLMExecutor] = None):
+        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.executor = executor or llm_executor
+
+    async def summarize(self, previous_summary: Optional[str], messages: list[dict]) -> Optional[str]:
+        """
+        Merge messages into the existing summary
+        
+        Args:
+            previous_summary: Current summary (None for the first one)
+            messages: Messages to add, oldest first
+            
+        Returns:
+            New summary text, or None on error (the old summary stays in use)
+        """
+        conversation = ChatContext(None, messages, [], 0).render()
+        prompt = f"""Bạn đang duy trì bản tóm tắt cuộc trò chuyện giữa người dùng và Aura (người bạn ảo thấu cảm).
+
+Tóm tắt hiện tại:
+{previous_summary or "(chưa có)"}
+
+Tin nhắn mới cần bổ sung:
+{conversation}
+Nhiệm vụ: Viết lại bản tóm tắt (tiếng Việt, tối đa 120 từ) gồm các sự kiện, cảm xúc và
+chủ đề quan trọng mà Aura cần nhớ. Chỉ trả về nội dung tóm tắt."""
+
+        try:
+            response = await self.executor.generate(self.model, prompt, agent=self.name)
+            return (response.text or "").strip() or None
+        except Exception as e:
+            print(f"Chat Summary Agent Error: {e}")
+            AI_FALLBACKS.inc(self.name)
+            return None
 
 
 class InsightAgent:
@@ -283,8 +563,33 @@ class InsightAgent:
     
     Uses gemini-1.5-flash for cost optimization and fast responses.
     """
-    def __init__(self):
+    name = "insight"
+    HOLISTIC_FALLBACK = "Bạn đang làm rất tốt với việc theo dõi cả cảm xúc lẫn sức khỏe! 💪"
+    HOLISTIC_ROLE = """Role: Bạn là Holistic Insight Analyst của AuraMind - chuyên phân tích mối tương quan nhân quả giữa Sức khỏe, Hoạt động và Tâm trạng.
+
+Philosophy: "Sức khỏe và Tâm trạng là nguyên nhân và kết quả của nhau.\""""
+    HOLISTIC_GUIDELINES = """Constraints:
+- Chỉ trả về 1-2 câu (tối đa 40 từ)
+- Viết tiếng Việt tự nhiên, thân thiện (xưng "mình", gọi "bạn")
+- TẬP TRUNG vào mối liên hệ NHÂN QUẢ:
+  + Giấc ngủ ảnh hưởng mood thế nào?
+  + Vận động giúp cải thiện tâm trạng ra sao?
+  + Thiền định có tác động gì?
+- Nếu có dữ liệu sức khỏe, ưu tiên phân tích nó
+- Nếu không tìm thấy pattern rõ ràng, đưa ra gợi ý tích cực
+
+Ví dụ output:
+- "Dữ liệu cho thấy giấc ngủ dưới 5 tiếng thường kéo mood của bạn xuống thấp, trong khi vận động giúp bạn hồi phục nhanh chóng."
+- "Mình thấy những ngày bạn tập gym và ngủ đủ giấc, mood của bạn luôn ở mức cao nhất!"
+- "Thiền định 15 phút mỗi ngày dường như giúp bạn giảm stress đáng kể."
+"""
+
+    def __init__(
+        self,
+        executor: Optional[LLMExecutor] = None
+    ):
         self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.executor = executor or llm_executor
 
     async def analyze_month(self, days_data: list) -> str:
         """
@@ -323,10 +628,11 @@ Ví dụ output:
 """
         
         try:
-            response = self.model.generate_content(prompt)
+            response = await self.executor.generate(self.model, prompt, agent=self.name)
             return response.text.strip()
         except Exception as e:
             print(f"Insight Agent Error: {e}")
+            AI_FALLBACKS.inc(self.name)
             return "Bạn đang làm rất tốt với việc theo dõi cảm xúc hàng ngày! 💪"
 
     async def analyze_monthly_correlation(self, month_data: list) -> str:
@@ -336,6 +642,10 @@ Ví dụ output:
         Philosophy: "Calendar là nơi kể lại câu chuyện của người dùng"
         Mood and health are cause-and-effect of each other.
         
+        Each month gets a prompt of its own, so users' health data is never
+        mixed. A month-boundary burst is admitted (or fails fast) by the
+        executor's adaptive concurrency limit and circuit breaker.
+        
         Args:
             month_data: List of day summaries with:
                 - date, avg_mood, avatar_state, activities
@@ -347,56 +657,47 @@ Ví dụ output:
         if not month_data:
             return "Chưa có đủ dữ liệu để phân tích mối tương quan tháng này."
         
-        # Format data for prompt with holistic view
-        data_summary = ""
+        return await self._correlate_one(month_data)
+
+    @staticmethod
+    def _format_month(month_data: list) -> str:
+        """Format day summaries (mood + health + activities) for the prompt"""
+        lines = []
         for day in month_data:
             health = day.get('health') or {}
-            health_str = ""
+            health_parts = []
             if health.get('avg_sleep_hours') is not None:
-                health_str += f"ngủ {health['avg_sleep_hours']}h, "
+                health_parts.append(f"ngủ {health['avg_sleep_hours']}h")
             if health.get('total_steps') is not None:
-                health_str += f"{health['total_steps']} bước, "
+                health_parts.append(f"{health['total_steps']} bước")
             if health.get('total_meditation_min') is not None:
-                health_str += f"thiền {health['total_meditation_min']} phút, "
+                health_parts.append(f"thiền {health['total_meditation_min']} phút")
             if health.get('total_exercise_min') is not None:
-                health_str += f"tập {health['total_exercise_min']} phút, "
+                health_parts.append(f"tập {health['total_exercise_min']} phút")
             
-            health_str = health_str.rstrip(', ') if health_str else "không có dữ liệu sức khỏe"
+            health_str = ', '.join(health_parts) if health_parts else "không có dữ liệu sức khỏe"
             activities_str = ', '.join(day['activities']) if day['activities'] else 'không có hoạt động'
             
-            data_summary += f"- {day['date']}: Mood={day['avg_mood']:.1f}, Health=[{health_str}], Activities=[{activities_str}]\n"
-        
-        prompt = f"""Role: Bạn là Holistic Insight Analyst của AuraMind - chuyên phân tích mối tương quan nhân quả giữa Sức khỏe, Hoạt động và Tâm trạng.
+            lines.append(f"- {day['date']}: Mood={day['avg_mood']:.1f}, Health=[{health_str}], Activities=[{activities_str}]\n")
+        return "".join(lines)
 
-Philosophy: "Sức khỏe và Tâm trạng là nguyên nhân và kết quả của nhau."
+    async def _correlate_one(self, month_data: list) -> str:
+        """One month, one prompt"""
+        prompt = f"""{self.HOLISTIC_ROLE}
 
 Task: Phân tích dữ liệu tổng hợp dưới đây và tìm ra MỘT mối tương quan nhân quả nổi bật nhất.
 
 Data:
-{data_summary}
-
-Constraints:
-- Chỉ trả về 1-2 câu (tối đa 40 từ)
-- Viết tiếng Việt tự nhiên, thân thiện (xưng "mình", gọi "bạn")
-- TẬP TRUNG vào mối liên hệ NHÂN QUẢ:
-  + Giấc ngủ ảnh hưởng mood thế nào?
-  + Vận động giúp cải thiện tâm trạng ra sao?
-  + Thiền định có tác động gì?
-- Nếu có dữ liệu sức khỏe, ưu tiên phân tích nó
-- Nếu không tìm thấy pattern rõ ràng, đưa ra gợi ý tích cực
-
-Ví dụ output:
-- "Dữ liệu cho thấy giấc ngủ dưới 5 tiếng thường kéo mood của bạn xuống thấp, trong khi vận động giúp bạn hồi phục nhanh chóng."
-- "Mình thấy những ngày bạn tập gym và ngủ đủ giấc, mood của bạn luôn ở mức cao nhất!"
-- "Thiền định 15 phút mỗi ngày dường như giúp bạn giảm stress đáng kể." 
-"""
+{self._format_month(month_data)}
+{self.HOLISTIC_GUIDELINES}"""
         
         try:
-            response = self.model.generate_content(prompt)
+            response = await self.executor.generate(self.model, prompt, agent=self.name)
             return response.text.strip()
         except Exception as e:
             print(f"Holistic Insight Agent Error: {e}")
-            return "Bạn đang làm rất tốt với việc theo dõi cả cảm xúc lẫn sức khỏe! 💪"
+            AI_FALLBACKS.inc(self.name)
+            return self.HOLISTIC_FALLBACK
 
 
 class AIAgentManager:
@@ -408,44 +709,74 @@ class AIAgentManager:
     - Robust error handling with fallbacks
     - Rate limiting support
     - Real-time chat support
+    - Concurrent identical mood analyses / insights share one call (single-flight)
     """
-    def __init__(self):
-        self.analyzer = AnalyzerAgent()
-        self.empathizer = EmpathyAgent()
+    def __init__(
+        self,
+        executor: Optional[LLMExecutor] = None,
+        pipeline_mode: str = AI_PIPELINE_MODE
+    ):
+        self.executor = executor or llm_executor
+        self.pipeline_mode = pipeline_mode
+        self.analyzer = AnalyzerAgent(self.executor)
+        self.empathizer = EmpathyAgent(self.executor)
+        self.fused_agent = FusedMoodAgent(self.executor)
+        self.fused_fallbacks = 0
         self.orchestrator = AvatarOrchestratorAgent()
-        self.chat_agent = ChatAgent()
-        self.insight_agent = InsightAgent()
+        self.chat_agent = ChatAgent(self.executor)
+        self.chat_summary_agent = ChatSummaryAgent(self.executor)
+        self.insight_agent = InsightAgent(self.executor)
+        self.flights = SingleFlight()
 
     async def get_monthly_insight(self, days_data: list) -> str:
         """Delegates to InsightAgent for monthly pattern analysis"""
         return await self.insight_agent.analyze_month(days_data)
 
-    async def get_holistic_insight(self, month_data: list) -> str:
+    async def get_holistic_insight(self, month_data: list, user_id: Optional[str] = None) -> str:
         """
         Delegates to InsightAgent for holistic mood/health/activity correlation analysis
         
+        Concurrent requests for the same user and data share one Gemini call.
+        
         Args:
             month_data: List of day summaries with mood, health, and activities
+            user_id: Optional user ID (part of the coalescing key)
             
         Returns:
             Vietnamese insight about causal relationships
         """
-        return await self.insight_agent.analyze_monthly_correlation(month_data)
+        return await self.flights.do(
+            flight_key("holistic_insight", user_id, month_data),
+            lambda: self.insight_agent.analyze_monthly_correlation(month_data)
+        )
 
-    async def chat(self, message: str, history: list[dict]) -> dict:
+    async def chat(self, message: str, history: list[dict], summary: Optional[dict] = None) -> dict:
         """Delegates to ChatAgent"""
-        return await self.chat_agent.chat(message, history)
+        return await self.chat_agent.chat(message, history, summary)
+
+    def chat_stream(
+        self, message: str, history: list[dict], summary: Optional[dict] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Delegates to ChatAgent streaming (yields ("avatar_state", ...), ("token", ...), ("error", ...) on a truncated reply, ("context", ...))"""
+        return self.chat_agent.chat_stream(message, history, summary)
+
+    async def summarize_chat(self, previous_summary: Optional[str], messages: list[dict]) -> Optional[str]:
+        """Delegates to ChatSummaryAgent"""
+        return await self.chat_summary_agent.summarize(previous_summary, messages)
 
     async def analyze_mood(
         self, 
         note: str, 
         voice_transcript: str = None,
         user_id: Optional[str] = None,
-        supabase: Optional[Client] = None
+        supabase: Optional[SupabaseClient] = None
     ) -> dict:
         """
         Main pipeline for processing user journal entries
         
+        Concurrent calls for the same user and text (e.g. a double-fired
+        POST) share one pipeline run and get the same result.
+        
         Args:
             note: Text note from user
             voice_transcript: Optional voice-to-text transcript
@@ -453,7 +784,8 @@ class AIAgentManager:
             supabase: Optional Supabase client for context fetching
             
         Returns:
-            dict containing all agent outputs with error handling
+            dict containing all agent outputs with error handling,
+            plus per-stage durations in ms under "timings"
         """
         combined_text = (note or "") + " " + (voice_transcript or "")
         combined_text = combined_text.strip()
@@ -461,33 +793,51 @@ class AIAgentManager:
         if not combined_text:
             return self._get_empty_response()
 
+        return await self.flights.do(
+            flight_key("analyze_mood", user_id, combined_text),
+            lambda: self._analyze_mood(combined_text, user_id, supabase)
+        )
+
+    async def _analyze_mood(
+        self,
+        combined_text: str,
+        user_id: Optional[str],
+        supabase: Optional[SupabaseClient]
+    ) -> dict:
+        """One run of the mood pipeline (see analyze_mood)"""
         try:
-            # Step 1: Analyze emotional metrics
-            analyzer_output = await self.analyzer.analyze(combined_text)
-            
-            # Step 2: Get user context (if available)
-            user_context = None
-            if user_id and supabase:
-                try:
-                    user_context = await self.empathizer.get_user_context(user_id, supabase)
-                except Exception as e:
-                    print(f"Context fetch error (non-critical): {e}")
-                    user_context = None
-            
-            # Step 3: Generate empathetic response
-            try:
-                ai_feedback = await self.empathizer.respond(
-                    combined_text, 
-                    analyzer_output,
-                    user_context
+            # Stages: the context fetch runs concurrently with the analyzer
+            # (split mode); the fused call needs the context for its prompt.
+            timer = StageTimer()
+            graph = StageGraph(timer)
+            graph.add("context", lambda: self._fetch_context(user_id, supabase))
+            if self.pipeline_mode == PIPELINE_FUSED:
+                graph.add(
+                    "fused",
+                    lambda context: self._run_fused(combined_text, context),
+                    deps=("context",)
                 )
-            except Exception as e:
-                print(f"Empathy error: {e}")
-                # Fallback response using primary_emotion
-                emotion = analyzer_output.get('primary_emotion', 'neutral')
-                ai_feedback = self._get_fallback_response(emotion)
+            else:
+                graph.add("analyze", lambda: self.analyzer.analyze(combined_text))
+            results = await graph.run()
+            
+            analyzer_output = results.get("fused")
+            if analyzer_output is not None:
+                ai_feedback = analyzer_output['ai_feedback']
+                mode_used = PIPELINE_FUSED
+            else:
+                if "analyze" not in results:
+                    # Fused output failed validation -> two-call path (context reused)
+                    with timer.measure("analyze"):
+                        results["analyze"] = await self.analyzer.analyze(combined_text)
+                analyzer_output = results["analyze"]
+                with timer.measure("respond"):
+                    ai_feedback = await self._respond(
+                        combined_text, analyzer_output, results["context"]
+                    )
+                mode_used = PIPELINE_SPLIT
             
-            # Step 4: Determine avatar state
+            # Determine avatar state
             avatar_state = self.orchestrator.get_avatar_state(
                 analyzer_output.get('mood_score', 5),
                 analyzer_output.get('stress_level', 5)
@@ -502,14 +852,53 @@ class AIAgentManager:
                 "activities": analyzer_output.get('activities', []),
                 "summary": analyzer_output.get('summary', ''),
                 "ai_feedback": ai_feedback,
-                "avatar_state": avatar_state
+                "avatar_state": avatar_state,
+                "pipeline_mode": mode_used,
+                "timings": timer.timings
             }
             
         except Exception as e:
             print(f"Pipeline error: {e}")
+            AI_FALLBACKS.inc("pipeline")
             # Complete fallback when entire pipeline fails
             return self._get_error_fallback()
     
+    async def _fetch_context(
+        self,
+        user_id: Optional[str],
+        supabase: Optional[SupabaseClient]
+    ) -> Optional[dict]:
+        """Pipeline stage: user context (if available), never raises"""
+        if not (user_id and supabase):
+            return None
+        try:
+            return await self.empathizer.get_user_context(user_id, supabase)
+        except Exception as e:
+            print(f"Context fetch error (non-critical): {e}")
+            return None
+    
+    async def _run_fused(self, text: str, user_context: Optional[dict]) -> Optional[dict]:
+        """Pipeline stage: fused call, None when output is invalid or the call failed"""
+        try:
+            return await self.fused_agent.analyze_and_respond(text, user_context)
+        except (ValidationError, ValueError) as e:
+            print(f"Fused output invalid, falling back to split pipeline: {e}")
+        except Exception as e:
+            print(f"Fused Agent Error, falling back to split pipeline: {e}")
+        self.fused_fallbacks += 1
+        AI_FALLBACKS.inc("fused")
+        return None
+    
+    async def _respond(self, text: str, analyzer_output: dict, user_context: Optional[dict]) -> str:
+        """Pipeline stage: empathetic response, falls back on primary_emotion"""
+        try:
+            return await self.empathizer.respond(text, analyzer_output, user_context)
+        except Exception as e:
+            print(f"Empathy error: {e}")
+            AI_FALLBACKS.inc("empathy")
+            emotion = analyzer_output.get('primary_emotion', 'neutral')
+            return self._get_fallback_response(emotion)
+    
     def _get_empty_response(self) -> dict:
         """Response for empty input"""
         return {
@@ -0,0 +1,203 @@
+"""
+Analysis Cache - content-addressed, on-disk cache of AnalyzerAgent results
+
+Users often re-submit the same note (client retries, flaky networks). The
+analyzer's JSON output only depends on the text, the model and the prompt,
+so results are stored under sha256(model, prompt version, normalized text):
+
+- identical or whitespace-only-different notes skip the Gemini call
+- entries expire after ANALYZER_CACHE_TTL_SECONDS
+- at most ANALYZER_CACHE_MAX_ENTRIES are kept (least recently used removed)
+
+The store is a SQLite file, so all workers on a host share it and it
+survives restarts. Only successful analyses are cached, never fallbacks.
+
+Calls block on SQLite (up to the 5s busy timeout), so async code runs them in
+a worker thread (asyncio.to_thread). Hits do not write: their last-use times
+are buffered and saved in one batch on the next put or every TOUCH_BATCH hits.
+"""
+import os
+import hashlib
+import json
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+from typing import Optional
+
+# SQLite file shared by all workers on the host
+ANALYZER_CACHE_PATH: str = os.environ.get(
+    "ANALYZER_CACHE_PATH", os.path.join(tempfile.gettempdir(), "auramind_analyzer_cache.sqlite3")
+)
+
+# Maximum cached analyses (0 disables the cache)
+ANALYZER_CACHE_MAX_ENTRIES: int = int(os.environ.get("ANALYZER_CACHE_MAX_ENTRIES", "50000"))
+
+# Seconds a cached analysis stays valid
+ANALYZER_CACHE_TTL_SECONDS: float = float(os.environ.get("ANALYZER_CACHE_TTL_SECONDS", "604800"))
+
+# Run the size/expiry sweep every N writes
+PRUNE_EVERY: int = 100
+
+# Save buffered last-use times after this many hits
+TOUCH_BATCH: int = 100
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Unicode NFC, trimmed, runs of whitespace collapsed to one space"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text or "")).strip()
+
+
+def analysis_key(text: str, model: str, prompt_version: str) -> str:
+    """Cache key for one analyzer input"""
+    payload = f"{model}\x00{prompt_version}\x00{normalize_text(text)}"
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class AnalysisCache:
+    """
+    SQLite-backed key -> JSON result cache with TTL and LRU size bound
+
+    Methods are synchronous and thread-safe: each calling thread (e.g. the
+    asyncio.to_thread pool) opens its own WAL-mode connection.
+    """
+
+    def __init__(
+        self,
+        path: str = ANALYZER_CACHE_PATH,
+        max_entries: int = ANALYZER_CACHE_MAX_ENTRIES,
+        ttl: float = ANALYZER_CACHE_TTL_SECONDS
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # key -> last hit time, not yet written
+        self._touched = {}
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._ready = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS analyses ("
+                    " key TEXT PRIMARY KEY, result TEXT NOT NULL,"
+                    " expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS analyses_used_at ON analyses (used_at)")
+                self._ready = True
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[dict]:
+        """Cached result for `key`, or None if absent/expired (errors count as misses)"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT result FROM analyses WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Analysis Cache Read Error: {e}")
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self._lock:
+            self._touched[key] = now
+            flush = len(self._touched) >= TOUCH_BATCH
+        if flush:
+            self.save_touched()
+        return json.loads(row[0])
+
+    def save_touched(self):
+        """Write buffered last-use times in one transaction (best effort)"""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if not touched:
+            return
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "UPDATE analyses SET used_at = ? WHERE key = ?",
+                    [(used_at, key) for key, used_at in touched.items()]
+                )
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Analysis Cache Write Error: {e}")
+
+    def put(self, key: str, result: dict):
+        """Store a result (best effort)"""
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses (key, result, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result, ensure_ascii=False), now + self.ttl, now)
+            )
+            with self._lock:
+                self._writes += 1
+                prune = self._writes % PRUNE_EVERY == 0
+            self.save_touched()
+            if prune:
+                self.prune(now)
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Analysis Cache Write Error: {e}")
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        now = time.time() if now is None else now
+        self.save_touched()
+        conn = self._conn()
+        removed = conn.execute("DELETE FROM analyses WHERE expires_at <= ?", (now,)).rowcount
+        excess = self.size() - self.max_entries
+        if excess > 0:
+            removed += conn.execute(
+                "DELETE FROM analyses WHERE key IN"
+                " (SELECT key FROM analyses ORDER BY used_at LIMIT ?)", (excess,)
+            ).rowcount
+        return removed
+
+    def size(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Snapshot of cache counters for diagnostics"""
+        lookups = self.hits + self.misses
+        return {
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Singleton instance
+analysis_cache = AnalysisCache()
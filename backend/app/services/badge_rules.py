@@ -0,0 +1,193 @@
+"""
+Badge rules - badges declared as data, compiled once into an evaluation plan
+
+Adding a badge means adding an entry to BADGE_RULES:
+
+    {"code": "STREAK_3", "name": "...", "all": [("streak", ">=", 3)]}
+
+- "all": every condition must hold ("any": at least one). No conditions = always earned.
+- Conditions are (fact, operator, value). Facts are derived from the log and
+  profile once per evaluation (see FACTS); only facts that a pending rule uses
+  are computed.
+
+The compiled plan skips rules whose badge the user already holds before
+evaluating anything, and can evaluate a whole log history in one pass for
+backfills.
+"""
+import operator
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from app.services.streaks import apply_log_to_streak, to_log_date
+
+BADGE_RULES: List[dict] = [
+    {"code": "FIRST_STEP", "name": "Ghi nhật ký lần đầu tiên", "all": []},
+    {"code": "STREAK_3", "name": "Chuỗi 3 ngày liên tiếp", "all": [("streak", ">=", 3)]},
+    {"code": "STREAK_7", "name": "Chuỗi 7 ngày liên tiếp", "all": [("streak", ">=", 7)]},
+    {"code": "STREAK_30", "name": "Chuỗi 30 ngày liên tiếp", "all": [("streak", ">=", 30)]},
+    # Hours are UTC (same as created_at in the DB)
+    {"code": "EARLY_BIRD", "name": "Thức dậy sớm (5:00 - 8:00)",
+     "all": [("hour", ">=", 5), ("hour", "<", 8)]},
+    {"code": "NIGHT_OWL", "name": "Cú đêm (23:00 - 4:00)",
+     "any": [("hour", ">=", 23), ("hour", "<", 4)]},
+    {"code": "BALANCE_MASTER", "name": "Cân bằng hoàn hảo (Mood tốt + Ngủ đủ)",
+     "all": [("mood", ">=", 7), ("sleep_hours", ">=", 7)]},
+    {"code": "ACTIVE_SOUL", "name": "Tâm hồn năng động (5000+ bước chân)",
+     "all": [("steps", ">=", 5000)]},
+]
+
+
+def _log_hour(log: dict, profile: dict) -> int:
+    created_at = log.get('created_at')
+    if isinstance(created_at, str):
+        return datetime.fromisoformat(created_at.replace('Z', '+00:00')).hour
+    if isinstance(created_at, datetime):
+        return created_at.hour
+    return datetime.now().hour
+
+
+def _health(log: dict, key: str) -> float:
+    return (log.get('health_metrics') or {}).get(key) or 0
+
+
+# Fact name -> extractor(log, profile)
+FACTS: Dict[str, Callable[[dict, dict], Any]] = {
+    "streak": lambda log, profile: profile.get('current_streak') or 0,
+    "hour": _log_hour,
+    "mood": lambda log, profile: log.get('mood_score') or 0,
+    "sleep_hours": lambda log, profile: _health(log, 'sleep_hours'),
+    "steps": lambda log, profile: _health(log, 'steps'),
+}
+
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    ">=": operator.ge,
+    ">": operator.gt,
+    "<=": operator.le,
+    "<": operator.lt,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+Condition = Tuple[str, Callable[[Any, Any], bool], Any]
+
+
+class CompiledRule:
+    """One badge rule with its conditions resolved to functions"""
+
+    def __init__(self, code: str, name: str, conditions: List[Condition], match_all: bool):
+        self.code = code
+        self.name = name
+        self.conditions = conditions
+        self.match_all = match_all
+        self.facts = {fact for fact, _, _ in conditions}
+
+    def matches(self, facts: Dict[str, Any]) -> bool:
+        if not self.conditions:
+            return True
+        results = (compare(facts[fact], value) for fact, compare, value in self.conditions)
+        return all(results) if self.match_all else any(results)
+
+
+class BadgePlan:
+    """
+    Compiled badge rules
+
+    Usage:
+        plan = compile_rules(BADGE_RULES)
+        codes = plan.evaluate(new_log, profile, held={"FIRST_STEP"})
+    """
+
+    def __init__(self, rules: List[CompiledRule]):
+        self.rules = rules
+        self.names = {rule.code: rule.name for rule in rules}
+        self.codes = set(self.names)
+
+    @staticmethod
+    def extract_facts(rules: List[CompiledRule], log: dict, profile: dict) -> Dict[str, Any]:
+        """Derive the facts `rules` need from one log, each computed once"""
+        needed = set().union(*(rule.facts for rule in rules)) if rules else set()
+        return {fact: FACTS[fact](log, profile) for fact in needed}
+
+    def evaluate(self, log: dict, profile: dict, held: Optional[Set[str]] = None) -> List[str]:
+        """
+        Badge codes earned by one log, in declaration order
+
+        Args:
+            log: Mood log (created_at, mood_score, health_metrics)
+            profile: Profile after the log (current_streak)
+            held: Codes the user already holds; their rules are skipped
+
+        Returns:
+            Codes of badges earned that are not in `held`
+        """
+        held = held or set()
+        pending = [rule for rule in self.rules if rule.code not in held]
+        if not pending:
+            return []
+        facts = self.extract_facts(pending, log, profile)
+        return [rule.code for rule in pending if rule.matches(facts)]
+
+    def evaluate_history(
+        self,
+        logs: Iterable[dict],
+        profile: Optional[dict] = None,
+        held: Optional[Set[str]] = None
+    ) -> List[Tuple[str, dict]]:
+        """
+        Replay a user's logs (oldest first) and find when each badge was earned
+
+        Streaks are rebuilt log by log with the same rules as the DB trigger,
+        so no per-log profile snapshots are needed. Stops as soon as every
+        badge is held.
+
+        Args:
+            logs: Mood logs in chronological order
+            profile: Starting profile (defaults to no streak)
+            held: Codes already held before the first log
+
+        Returns:
+            [(badge_code, log that earned it)] in the order they were earned
+        """
+        held = set(held or ())
+        profile = dict(profile or {})
+        earned = []
+        for log in logs:
+            if held >= self.codes:
+                break
+            profile = apply_log_to_streak(profile, to_log_date(log.get('created_at')))
+            for code in self.evaluate(log, profile, held):
+                held.add(code)
+                earned.append((code, log))
+        return earned
+
+
+def compile_rules(rules: List[dict]) -> BadgePlan:
+    """
+    Validate declarative rules and build an evaluation plan
+
+    Raises:
+        ValueError: On duplicate codes, unknown facts/operators, or both "all" and "any"
+    """
+    compiled = []
+    seen = set()
+    for rule in rules:
+        code = rule["code"]
+        if code in seen:
+            raise ValueError(f"Duplicate badge code: {code}")
+        seen.add(code)
+        if "all" in rule and "any" in rule:
+            raise ValueError(f"Badge {code}: use either 'all' or 'any', not both")
+
+        conditions = []
+        for fact, op, value in rule.get("all", rule.get("any", [])):
+            if fact not in FACTS:
+                raise ValueError(f"Badge {code}: unknown fact '{fact}'")
+            if op not in OPERATORS:
+                raise ValueError(f"Badge {code}: unknown operator '{op}'")
+            conditions.append((fact, OPERATORS[op], value))
+
+        compiled.append(CompiledRule(code, rule.get("name", code), conditions, "any" not in rule))
+    return BadgePlan(compiled)
+
+
+# Compiled once at import
+badge_plan = compile_rules(BADGE_RULES)
@@ -1,112 +1,143 @@
 from datetime import datetime, time
 import logging
-from typing import List, Optional
+import os
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Set
 from app.models.calendar import HealthSummary
+from app.services.badge_rules import badge_plan
+from app.services.metrics import BADGE_CHECK_SECONDS
+from app.services.repositories import AchievementRepository
+
+# Number of users whose badge codes are remembered per worker
+BADGE_CACHE_MAX_USERS = int(os.environ.get("BADGE_CACHE_MAX_USERS", "10000"))
+
+
+class BadgeCodeCache:
+    """
+    In-memory LRU of badge codes each user is known to hold.
+    
+    Badges are never revoked, so an entry can only ever miss codes (e.g. one
+    awarded by another worker). A miss just means the code is sent in the next
+    bulk upsert, where UNIQUE(user_id, badge_code) turns it into a no-op.
+    """
+    
+    def __init__(self, max_users: int = BADGE_CACHE_MAX_USERS):
+        self.max_users = max_users
+        self._codes: "OrderedDict[str, Set[str]]" = OrderedDict()
+    
+    def get(self, user_id: str) -> Set[str]:
+        codes = self._codes.get(user_id)
+        if codes is None:
+            return set()
+        self._codes.move_to_end(user_id)
+        return set(codes)
+    
+    def add(self, user_id: str, codes: Iterable[str]):
+        """Record codes as held (call after they were awarded)"""
+        self._codes.setdefault(user_id, set()).update(codes)
+        self._codes.move_to_end(user_id)
+        while len(self._codes) > self.max_users:
+            self._codes.popitem(last=False)
+
+
+# Singleton instance
+badge_code_cache = BadgeCodeCache()
+
 
 class BadgeService:
     """
     Service to evaluate and award badges based on user activity.
     """
     
-    BADGES = {
-        "FIRST_STEP": "Ghi nhật ký lần đầu tiên",
-        "STREAK_3": "Chuỗi 3 ngày liên tiếp",
-        "STREAK_7": "Chuỗi 7 ngày liên tiếp",
-        "STREAK_30": "Chuỗi 30 ngày liên tiếp",
-        "EARLY_BIRD": "Thức dậy sớm (5:00 - 8:00)",
-        "NIGHT_OWL": "Cú đêm (23:00 - 4:00)",
-        "BALANCE_MASTER": "Cân bằng hoàn hảo (Mood tốt + Ngủ đủ)",
-        "ACTIVE_SOUL": "Tâm hồn năng động (5000+ bước chân)"
-    }
+    # Badge rules live in badge_rules.BADGE_RULES
+    BADGES = dict(badge_plan.names)
 
-    def __init__(self, supabase_client):
+    def __init__(self, supabase_client, code_cache: Optional[BadgeCodeCache] = None):
         self.supabase = supabase_client
+        self.achievements = AchievementRepository(supabase_client)
+        self.code_cache = code_cache or badge_code_cache
+        self.plan = badge_plan
 
-    async def check_new_badges(self, user_id: str, new_log: dict, current_profile: dict) -> List[dict]:
+    async def check_new_badges(
+        self, user_id: str, new_log: dict, current_profile: dict, raise_errors: bool = False
+    ) -> List[dict]:
         """
-        Evaluate rules and return list of newly earned badges.
+        Evaluate rules and return list of newly earned badges (timed on /metrics).
         
         Args:
             user_id: User UUID
             new_log: Dict containing the new mood log data
             current_profile: Dict containing profile data (streak, logs count, etc.)
+            raise_errors: Re-raise award failures instead of returning [] (so a job can retry)
             
         Returns:
             List of new badge objects: [{'code': 'STREAK_3', 'name': '...'}]
         """
-        newly_earned = []
-        
-        # 1. Get existing badges to avoid duplicates
-        existing_badges_response = self.supabase.table("user_achievements")\
-            .select("badge_code").eq("user_id", user_id).execute()
-        existing_codes = {b['badge_code'] for b in existing_badges_response.data}
+        with BADGE_CHECK_SECONDS.time():
+            return await self._check_new_badges(user_id, new_log, current_profile, raise_errors)
 
-        # 2. Define Rules
-        potential_badges = []
+    async def _check_new_badges(
+        self, user_id: str, new_log: dict, current_profile: dict, raise_errors: bool
+    ) -> List[dict]:
+        """
+        Evaluate rules and award candidates (see check_new_badges)
+        """
+        # 1. Badges already known to be held (no DB read; see BadgeCodeCache)
+        existing_codes = self.code_cache.get(user_id)
 
-        # --- Rule: FIRST_STEP ---
-        # If this is the first log (conceptually), but profile might not be updated yet appropriately depending on trigger timing.
-        # A safer check is if 'longest_streak' is 0 or 1 and no logs existed before.
-        # But simplify: if not in existing_codes
-        potential_badges.append("FIRST_STEP")
+        # 2. Evaluate the compiled rules (rules for held badges are skipped)
+        potential_badges = self.plan.evaluate(new_log, current_profile, held=existing_codes)
 
-        # --- Rule: STREAK Badges ---
-        streak = current_profile.get('current_streak', 0)
-        # Note: The trigger usually updates streak AFTER insert. 
-        # If we call this AFTER insert, we should fetch the updated profile first.
-        # For simplicity, we assume we pass the *updated* profile or handle offset.
+        # 3. Award all candidates in one bulk upsert (duplicates ignored by the DB)
+        candidates = potential_badges
+        if not candidates:
+            return []
         
-        if streak >= 3: potential_badges.append("STREAK_3")
-        if streak >= 7: potential_badges.append("STREAK_7")
-        if streak >= 30: potential_badges.append("STREAK_30")
-
-        # --- Rule: Time Based ---
-        # Parse created_at (which is usually UTC in DB, but let's check local time if possible or rely on simple hour check)
-        # Assuming new_log['created_at'] is ISO string or datetime
-        # For MVP, we'll check the current server time if created_at isn't passed explicitly or parse it.
-        created_at = datetime.fromisoformat(new_log['created_at'].replace('Z', '+00:00')) if isinstance(new_log.get('created_at'), str) else datetime.now()
+        try:
+            awarded = set(await self.achievements.insert_many(
+                user_id, candidates, datetime.now().isoformat()
+            ))
+        except Exception as e:
+            logging.error(f"Error awarding badges {candidates}: {e}")
+            if raise_errors:
+                raise
+            return []
         
-        # Simple hour check (UTC adjustment needed if we want local user time, but ignoring for MVP simplification)
-        # Let's assume input log might have 'local_time' or we use strict UTC windows.
-        # Logic: Early Bird 5-8 AM, Night Owl 23-4
-        hour = created_at.hour
-        if 5 <= hour < 8:
-            potential_badges.append("EARLY_BIRD")
-        elif hour >= 23 or hour < 4:
-            potential_badges.append("NIGHT_OWL")
-
-        # --- Rule: Health & Mood (BALANCE_MASTER) ---
-        mood = new_log.get('mood_score', 0)
-        health = new_log.get('health_metrics') or {}
-        sleep = health.get('sleep_hours', 0)
-        steps = health.get('steps', 0) # Support 'steps' or 'total_steps' key
+        # Every candidate is held now, whether awarded here or earlier
+        self.code_cache.add(user_id, candidates)
+        
+        return [
+            {
+                "code": code,
+                "name": self.BADGES.get(code, code),
+                "description": "Bạn đã mở khóa thành tựu mới!"
+            }
+            for code in candidates if code in awarded
+        ]
 
-        if mood >= 7 and sleep >= 7:
-            potential_badges.append("BALANCE_MASTER")
+    async def backfill_badges(self, user_id: str, logs: List[dict]) -> List[str]:
+        """
+        Award every badge a user's history qualifies for, in one upsert.
+        
+        Replays the logs through the compiled rule plan (streaks are rebuilt
+        as it goes) and stamps each badge with the log that earned it.
+        Run from the command line with backend/backfill_badges.py.
+        
+        Args:
+            user_id: User UUID
+            logs: The user's mood logs, oldest first
             
-        if steps >= 5000:
-            potential_badges.append("ACTIVE_SOUL")
-
-        # 3. Filter and Insert New Badges
-        for code in potential_badges:
-            if code not in existing_codes:
-                try:
-                    # Insert into DB
-                    data = {
-                        "user_id": user_id,
-                        "badge_code": code,
-                        "earned_at": datetime.now().isoformat()
-                    }
-                    self.supabase.table("user_achievements").insert(data).execute()
-                    
-                    # Add to result
-                    newly_earned.append({
-                        "code": code,
-                        "name": self.BADGES.get(code, code),
-                        "description": "Bạn đã mở khóa thành tựu mới!"
-                    })
-                    existing_codes.add(code) # Prevent double add in same loop
-                except Exception as e:
-                    logging.error(f"Error awarding badge {code}: {e}")
-
-        return newly_earned
+        Returns:
+            Codes that were newly awarded
+        """
+        earned = self.plan.evaluate_history(logs, held=self.code_cache.get(user_id))
+        if not earned:
+            return []
+        
+        earned_at = {code: str(log.get('created_at') or datetime.now().isoformat()) for code, log in earned}
+        codes = [code for code, _ in earned]
+        awarded = await self.achievements.insert_many(
+            user_id, codes, datetime.now().isoformat(), earned_at_by_code=earned_at
+        )
+        self.code_cache.add(user_id, codes)
+        return awarded
@@ -0,0 +1,148 @@
+"""
+Calendar helpers - daily summaries and the monthly insight cache
+
+The database keeps one pre-aggregated row per user per day (migration 007),
+so building a month only touches at most 31 rows however many logs were written.
+
+Monthly insights are cached in monthly_insights (migration 008), keyed by a
+fingerprint of the month's day summaries:
+- fingerprint matches -> stored insight, no Gemini call, no rate-limit token
+- month changed since  -> stored insight now, fresh one generated in the background
+- nothing stored       -> generated inline, then stored
+"""
+import hashlib
+import json
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from fastapi import BackgroundTasks
+from app.models.calendar import DaySummary, HealthSummary
+from app.services.ai_manager import InsightAgent
+from app.services.metrics import INSIGHT_CACHE_LOOKUPS
+from app.services.repositories import Repositories
+
+# Months currently being regenerated on this worker (user_id, year, month)
+_revalidating: Set[Tuple[str, int, int]] = set()
+
+
+def _top_keys(counts: Dict[str, float], limit: int) -> List[str]:
+    """Keys with the highest counts (ties broken alphabetically)"""
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return [key for key, _ in ranked[:limit]]
+
+
+def _health_summary(sums: Dict[str, float], counts: Dict[str, float]) -> Optional[HealthSummary]:
+    """Daily totals/averages from per-metric sums and report counts"""
+    if not counts:
+        return None
+
+    def total(metric: str) -> Optional[int]:
+        return int(sums[metric]) if counts.get(metric) else None
+
+    def average(metric: str) -> Optional[float]:
+        return round(sums[metric] / counts[metric], 1) if counts.get(metric) else None
+
+    return HealthSummary(
+        total_steps=total("steps"),
+        avg_sleep_hours=average("sleep_hours"),
+        total_meditation_min=total("meditation_min"),
+        avg_water_glasses=average("water_glasses"),
+        total_exercise_min=total("exercise_min")
+    )
+
+
+def day_summary_from_row(row: dict) -> DaySummary:
+    """
+    Build a DaySummary from one daily_mood_summaries row
+
+    Args:
+        row: Row with log_date, log_count, mood_score_sum/count and the
+             avatar_state_counts, activity_counts, health_sums, health_counts maps
+
+    Returns:
+        DaySummary for the calendar response
+    """
+    score_count = row.get("mood_score_count") or 0
+    avg_mood = row["mood_score_sum"] / score_count if score_count else 5.0
+    states = row.get("avatar_state_counts") or {}
+
+    return DaySummary(
+        date=str(row["log_date"])[:10],
+        average_mood_score=round(avg_mood, 1),
+        primary_avatar_state=_top_keys(states, 1)[0] if states else "STATE_NEUTRAL",
+        top_activities=_top_keys(row.get("activity_counts") or {}, 3),
+        log_count=row["log_count"],
+        health_summary=_health_summary(row.get("health_sums") or {}, row.get("health_counts") or {})
+    )
+
+
+def insight_fingerprint(insight_data: list) -> str:
+    """Stable hash of the insight input; changes whenever the month's data does"""
+    payload = json.dumps(insight_data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def _store_insight(
+    repos: Repositories, user_id: str, year: int, month: int, fingerprint: str, insight: Optional[str]
+) -> None:
+    # Canned fallbacks (Gemini errors) are not worth keeping
+    if not insight or insight == InsightAgent.HOLISTIC_FALLBACK:
+        return
+    try:
+        await repos.monthly_insights.upsert(user_id, year, month, fingerprint, insight)
+    except Exception as e:
+        print(f"Insight Cache Write Error: {e}")
+
+
+async def get_cached_insight(
+    repos: Repositories,
+    user_id: str,
+    year: int,
+    month: int,
+    insight_data: list,
+    generate: Callable[[], Awaitable[Optional[str]]],
+    background_tasks: BackgroundTasks
+) -> Optional[str]:
+    """
+    Monthly insight with persistent stale-while-revalidate caching
+
+    Args:
+        repos: Request-scoped repositories
+        user_id: User UUID
+        year, month: Calendar month
+        insight_data: Day summaries passed to the insight agent
+        generate: Produces a fresh insight (None if rate limited)
+        background_tasks: Used to revalidate stale entries after the response
+
+    Returns:
+        Insight text, or None if there is no stored insight and generate() declined
+    """
+    fingerprint = insight_fingerprint(insight_data)
+    try:
+        cached = await repos.monthly_insights.get(user_id, year, month)
+    except Exception as e:
+        print(f"Insight Cache Read Error: {e}")
+        cached = None
+
+    if cached and cached.get("fingerprint") == fingerprint:
+        INSIGHT_CACHE_LOOKUPS.inc("fresh")
+        return cached["insight"]
+
+    if cached:
+        INSIGHT_CACHE_LOOKUPS.inc("stale")
+        key = (user_id, year, month)
+        if key not in _revalidating:
+            _revalidating.add(key)
+
+            async def revalidate():
+                try:
+                    insight = await generate()
+                    await _store_insight(repos, user_id, year, month, fingerprint, insight)
+                finally:
+                    _revalidating.discard(key)
+
+            background_tasks.add_task(revalidate)
+        return cached["insight"]
+
+    INSIGHT_CACHE_LOOKUPS.inc("miss")
+    insight = await generate()
+    await _store_insight(repos, user_id, year, month, fingerprint, insight)
+    return insight
@@ -0,0 +1,157 @@
+"""
+Chat context builder - packs conversation history into a token budget
+
+Instead of a fixed number of messages, the chat prompt gets:
+- the user's rolling summary of older messages (chat_summaries, migration 009)
+- the newest messages after that summary, verbatim, as many as fit in
+  CHAT_CONTEXT_TOKEN_BUDGET
+
+Messages that are newer than the summary but do not fit are returned as
+`overflow`; the chat router folds them into the summary in the background,
+so each message is summarized once and the summary is reused afterwards.
+
+Token counts are estimated locally (no tokenizer round trip). The estimate
+is deliberately conservative for Vietnamese text.
+"""
+import math
+import os
+from datetime import datetime
+from typing import List, Optional
+
+# Tokens of history (summary + messages) allowed in a chat prompt
+CHAT_CONTEXT_TOKEN_BUDGET: int = int(os.environ.get("CHAT_CONTEXT_TOKEN_BUDGET", "1200"))
+
+# Average characters per token used for estimates
+CHARS_PER_TOKEN: float = 3.0
+
+# Per-message overhead ("User: ", newline)
+MESSAGE_OVERHEAD_TOKENS: int = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate Gemini token count of `text`"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _timestamp(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return None
+
+
+def _is_after(created_at, until: datetime) -> bool:
+    timestamp = _timestamp(created_at)
+    # Unknown timestamps are treated as new rather than silently dropped
+    return timestamp is None or timestamp > until
+
+
+class ChatContext:
+    """Packed history for one chat prompt"""
+
+    def __init__(self, summary: Optional[str], messages: List[dict], overflow: List[dict], tokens: int):
+        self.summary = summary
+        self.messages = messages
+        self.overflow = overflow
+        self.tokens = tokens
+        # Set by the agent once the prompt is sent (Gemini's count when reported)
+        self.prompt_tokens: Optional[int] = None
+        self.prompt_tokens_estimated = True
+
+    def render(self) -> str:
+        """History section of the prompt"""
+        parts = []
+        if self.summary:
+            parts.append(f"Tóm tắt hội thoại trước đó: {self.summary}\n")
+        for msg in self.messages:
+            role = "User" if msg['role'] == 'user' else "Aura"
+            parts.append(f"{role}: {msg['content']}\n")
+        return "".join(parts)
+
+    def record_prompt(self, prompt: str, response=None):
+        """Store the prompt token count: Gemini's usage_metadata if present, else the estimate"""
+        count = getattr(getattr(response, "usage_metadata", None), "prompt_token_count", None)
+        if isinstance(count, int) and count > 0:
+            self.prompt_tokens = count
+            self.prompt_tokens_estimated = False
+        else:
+            self.prompt_tokens = estimate_tokens(prompt)
+            self.prompt_tokens_estimated = True
+
+    def usage(self) -> dict:
+        """Per-call report returned with chat replies"""
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "estimated": self.prompt_tokens_estimated,
+            "history_tokens": self.tokens,
+            "history_messages": len(self.messages),
+            "summarized": bool(self.summary),
+        }
+
+
+class ContextBuilder:
+    """
+    Packs a summary and recent messages into a token budget
+
+    Usage:
+        builder = ContextBuilder(budget=1200)
+        context = builder.build(history, summary_row)
+        prompt = f"...{context.render()}..."
+    """
+
+    def __init__(self, budget: int = CHAT_CONTEXT_TOKEN_BUDGET, max_messages: Optional[int] = None):
+        """
+        Initialize builder
+
+        Args:
+            budget: Maximum estimated tokens for summary + messages
+            max_messages: Optional cap on verbatim messages (so messages reach
+                          the summary before they leave a bounded history buffer)
+        """
+        self.budget = budget
+        self.max_messages = max_messages
+
+    @staticmethod
+    def message_tokens(message: dict) -> int:
+        return estimate_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS
+
+    def build(self, history: List[dict], summary: Optional[dict] = None) -> ChatContext:
+        """
+        Select what goes into the prompt
+
+        Args:
+            history: Previous messages, oldest first ({"role", "content", "created_at"})
+            summary: chat_summaries row ({"summary", "summarized_until"}) or None
+
+        Returns:
+            ChatContext with the summary, packed messages and overflow
+        """
+        summary_text = (summary or {}).get("summary") or None
+        until = _timestamp((summary or {}).get("summarized_until")) if summary_text else None
+
+        # Messages already covered by the summary are not repeated verbatim
+        pending = [
+            msg for msg in history
+            if until is None or _is_after(msg.get("created_at"), until)
+        ]
+
+        used = estimate_tokens(summary_text) if summary_text else 0
+        packed: List[dict] = []
+        for msg in reversed(pending):
+            cost = self.message_tokens(msg)
+            if packed and used + cost > self.budget:
+                break
+            if self.max_messages is not None and len(packed) >= self.max_messages:
+                break
+            packed.append(msg)
+            used += cost
+        packed.reverse()
+
+        overflow = pending[:len(pending) - len(packed)]
+        return ChatContext(summary_text, packed, overflow, used)
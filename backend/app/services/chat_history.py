@@ -0,0 +1,282 @@
+"""
+Chat history cache - per-user ring buffer of recent chat messages
+
+Each chat turn needs the recent messages (and the rolling summary of older
+ones, see chat_context) as context. Instead of reading them back every turn,
+each worker keeps the last CHAT_HISTORY_SIZE messages and the summary per
+user in memory:
+
+- first turn (or after eviction/expiry) -> messages + summary read, buffer filled
+- every turn after that                -> one-row check of the newest message's
+                                          created_at; the turn is appended
+
+The buffers are per worker with no cross-worker invalidation, so before a
+buffer is served its newest created_at is compared with the database's: a
+turn stored through another uvicorn worker makes the buffer stale and it is
+re-read. Both messages of a turn are written in a single insert after the reply.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+from app.services.chat_context import ChatContext, _timestamp
+from app.services.repositories import Repositories
+
+# Users whose recent messages are kept per worker (least recently used evicted)
+CHAT_HISTORY_CACHE_MAX_USERS: int = int(os.environ.get("CHAT_HISTORY_CACHE_MAX_USERS", "10000"))
+
+# Messages kept per user (user + assistant messages); how many of them reach
+# the prompt is decided by the token budget in chat_context
+CHAT_HISTORY_SIZE: int = int(os.environ.get("CHAT_HISTORY_SIZE", "20"))
+
+# Seconds before a user's buffer is re-read from the database (upper bound;
+# buffers made stale by another worker are re-read on the next turn anyway)
+CHAT_HISTORY_TTL_SECONDS: float = float(os.environ.get("CHAT_HISTORY_TTL_SECONDS", "600"))
+
+
+class ChatHistoryCache:
+    """
+    LRU of per-user message ring buffers
+
+    Messages are stored as {"role", "content", "created_at"}, oldest first,
+    the same shape ChatMessageRepository.recent() returns. Each entry also
+    holds the user's chat_summaries row (or None).
+    """
+
+    def __init__(
+        self,
+        max_users: int = CHAT_HISTORY_CACHE_MAX_USERS,
+        size: int = CHAT_HISTORY_SIZE,
+        ttl: float = CHAT_HISTORY_TTL_SECONDS
+    ):
+        self.max_users = max_users
+        self.size = size
+        self.ttl = ttl
+        self._buffers: "OrderedDict[str, list]" = OrderedDict()  # [messages, expires_at, summary]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+
+    def get(self, user_id: str) -> Optional[List[dict]]:
+        """The user's recent messages, or None if not cached (or expired)"""
+        now = time.time()
+        with self._lock:
+            entry = self._buffers.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._buffers.move_to_end(user_id)
+                self.hits += 1
+                return list(entry[0])
+            if entry is not None:
+                del self._buffers[user_id]
+            self.misses += 1
+            return None
+
+    def summary(self, user_id: str) -> Optional[dict]:
+        """The cached summary row (None if none stored or not cached)"""
+        with self._lock:
+            entry = self._buffers.get(user_id)
+            return dict(entry[2]) if entry is not None and entry[2] else None
+
+    def fill(self, user_id: str, messages: List[dict], summary: Optional[dict] = None) -> List[dict]:
+        """
+        Replace the user's buffer with messages (and summary) read from the database
+
+        Returns:
+            The buffered messages, as get() would return them
+        """
+        buffer = deque((self._message(m) for m in messages), maxlen=self.size)
+        with self._lock:
+            self._buffers[user_id] = [buffer, time.time() + self.ttl, summary]
+            self._buffers.move_to_end(user_id)
+            while len(self._buffers) > self.max_users:
+                self._buffers.popitem(last=False)
+                self.evictions += 1
+        return list(buffer)
+
+    def append(self, user_id: str, messages: List[dict]):
+        """Add freshly stored messages (no-op if the user is not cached)"""
+        with self._lock:
+            entry = self._buffers.get(user_id)
+            if entry is not None:
+                entry[0].extend(self._message(m) for m in messages)
+
+    def set_summary(self, user_id: str, summary: dict):
+        """Record a newly stored summary (no-op if the user is not cached)"""
+        with self._lock:
+            entry = self._buffers.get(user_id)
+            if entry is not None:
+                entry[2] = summary
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._buffers.pop(user_id, None)
+
+    def discard_stale(self, user_id: str):
+        """Drop a buffer that missed messages stored through another worker"""
+        with self._lock:
+            if self._buffers.pop(user_id, None) is not None:
+                # get() counted it as a hit
+                self.hits -= 1
+                self.misses += 1
+                self.stale += 1
+
+    def clear(self):
+        with self._lock:
+            self._buffers.clear()
+
+    @staticmethod
+    def _message(message: dict) -> dict:
+        return {
+            "role": message["role"],
+            "content": message["content"],
+            "created_at": message.get("created_at"),
+        }
+
+    def stats(self) -> dict:
+        """Snapshot of cache counters for diagnostics"""
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._buffers),
+            "max_users": self.max_users,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale": self.stale,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Singleton instance
+chat_history_cache = ChatHistoryCache()
+
+
+async def _read_summary(repos: Repositories, user_id: str) -> Optional[dict]:
+    try:
+        return await repos.chat_summaries.get(user_id)
+    except Exception as e:
+        # e.g. migration 009 not applied yet: chat works without a summary
+        print(f"Chat Summary Read Error: {e}")
+        return None
+
+
+def _is_current(history: List[dict], latest: Optional[str]) -> bool:
+    """True if the buffer ends with the newest message in the database"""
+    if not history:
+        return latest is None
+    cached = _timestamp(history[-1].get("created_at"))
+    return cached is not None and cached == _timestamp(latest)
+
+
+async def load_history(
+    repos: Repositories, user_id: str, cache: Optional[ChatHistoryCache] = None
+) -> Tuple[List[dict], Optional[dict]]:
+    """
+    Conversation context for a new user message
+
+    Args:
+        repos: Request-scoped repositories
+        user_id: User UUID
+        cache: History cache (defaults to the worker singleton)
+
+    Returns:
+        (previous messages oldest first, chat_summaries row or None)
+    """
+    cache = cache or chat_history_cache
+    history = cache.get(user_id)
+    if history is not None:
+        latest = await repos.chat_messages.latest_created_at(user_id)
+        if _is_current(history, latest):
+            return history, cache.summary(user_id)
+        cache.discard_stale(user_id)
+
+    history, summary = await asyncio.gather(
+        repos.chat_messages.recent(user_id, limit=cache.size),
+        _read_summary(repos, user_id)
+    )
+    return cache.fill(user_id, history, summary), summary
+
+
+async def save_turn(
+    repos: Repositories,
+    user_id: str,
+    message: str,
+    sent_at: str,
+    reply: str,
+    avatar_state: str,
+    cache: Optional[ChatHistoryCache] = None
+) -> None:
+    """
+    Store a user message and its reply in one insert, then append them to the cache
+
+    Args:
+        repos: Request-scoped repositories
+        user_id: User UUID
+        message: User message
+        sent_at: ISO time the user message was received (keeps ordering stable)
+        reply: Assistant reply
+        avatar_state: Avatar state returned with the reply
+        cache: History cache (defaults to the worker singleton)
+    """
+    cache = cache or chat_history_cache
+    messages = [
+        {"role": "user", "content": message, "avatar_state": None, "created_at": sent_at},
+        {
+            "role": "assistant",
+            "content": reply,
+            "avatar_state": avatar_state,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        },
+    ]
+    try:
+        await repos.chat_messages.insert_many(user_id, messages)
+    except Exception:
+        # Unknown what was stored: re-read on the next turn
+        cache.invalidate(user_id)
+        raise
+    cache.append(user_id, messages)
+
+
+# Users whose summary is being updated on this worker
+_summarizing: Set[str] = set()
+
+
+async def update_summary(
+    repos: Repositories,
+    user_id: str,
+    context: ChatContext,
+    summarize: Callable[[Optional[str], List[dict]], Awaitable[Optional[str]]],
+    cache: Optional[ChatHistoryCache] = None
+) -> None:
+    """
+    Fold messages that no longer fit the prompt into the rolling summary
+
+    Runs after the response (BackgroundTasks). At most one update per user
+    runs at a time; overflow skipped here is picked up by a later turn.
+
+    Args:
+        repos: Request-scoped repositories
+        user_id: User UUID
+        context: The turn's ChatContext (its summary and overflow)
+        summarize: async (previous_summary, messages) -> new summary or None
+        cache: History cache (defaults to the worker singleton)
+    """
+    cache = cache or chat_history_cache
+    if not context.overflow or user_id in _summarizing:
+        return
+    _summarizing.add(user_id)
+    try:
+        summary = await summarize(context.summary, context.overflow)
+        until = context.overflow[-1].get("created_at")
+        if not summary or not until:
+            return
+        await repos.chat_summaries.upsert(user_id, summary, until)
+        cache.set_summary(user_id, {"summary": summary, "summarized_until": until})
+    except Exception as e:
+        print(f"Chat Summary Update Error: {e}")
+    finally:
+        _summarizing.discard(user_id)
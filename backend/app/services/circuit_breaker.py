@@ -0,0 +1,201 @@
+"""
+Circuit breaker - stop calling an agent's model while the provider is failing
+
+Without it, every request during a Gemini incident waits for its full
+timeout before the agent returns its canned fallback, so slow failures pile
+up on the worker. Each agent gets one breaker (see LLMExecutor):
+
+    closed     calls go through; the last `window_size` outcomes are kept.
+               Opens when, over at least `min_calls` calls, the failure rate
+               (errors + timeouts) or the slow-call rate reaches its threshold.
+    open       calls are refused at once (CircuitOpenError), so the agent
+               serves its fallback immediately. After `open_seconds`:
+    half_open  up to `half_open_probes` calls go through as probes; the rest
+               are still refused. All probes succeeding closes the circuit,
+               any failed or slow probe opens it again. Only the probes'
+               results count: a slow call admitted before the circuit opened
+               may finish while half-open, and is ignored.
+
+Cancelled calls (client disconnects) say nothing about the provider and are
+ignored.
+"""
+import os
+from collections import deque
+from time import monotonic
+from typing import Callable, Deque, Optional, Tuple
+
+# Failure rate (0-1) over the window that opens the circuit
+CIRCUIT_FAILURE_THRESHOLD: float = float(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "0.5"))
+
+# Slow-call rate (0-1) over the window that opens the circuit
+CIRCUIT_SLOW_CALL_THRESHOLD: float = float(os.environ.get("CIRCUIT_SLOW_CALL_THRESHOLD", "0.8"))
+
+# Number of recent calls considered, and the minimum before the circuit may open
+CIRCUIT_WINDOW_SIZE: int = int(os.environ.get("CIRCUIT_WINDOW_SIZE", "20"))
+CIRCUIT_MIN_CALLS: int = int(os.environ.get("CIRCUIT_MIN_CALLS", "10"))
+
+# Seconds the circuit stays open before probing
+CIRCUIT_OPEN_SECONDS: float = float(os.environ.get("CIRCUIT_OPEN_SECONDS", "30"))
+
+# Calls let through while half-open
+CIRCUIT_HALF_OPEN_PROBES: int = int(os.environ.get("CIRCUIT_HALF_OPEN_PROBES", "2"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit is open"""
+
+
+class Permit:
+    """Returned by CircuitBreaker.allow(); identifies half-open probes"""
+
+    __slots__ = ("probe", "generation")
+
+    def __init__(self, probe: bool, generation: int):
+        self.probe = probe
+        self.generation = generation
+
+
+class CircuitBreaker:
+    """
+    Failure/latency circuit breaker for one agent
+
+    Usage:
+        permit = breaker.allow()
+        if permit is None:
+            raise CircuitOpenError(...)
+        ...call...
+        breaker.record(permit, ok=..., slow=...)      # or breaker.cancelled(permit)
+
+    Every permit must be passed back to exactly one record() or cancelled().
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: float = CIRCUIT_FAILURE_THRESHOLD,
+        slow_call_threshold: float = CIRCUIT_SLOW_CALL_THRESHOLD,
+        window_size: int = CIRCUIT_WINDOW_SIZE,
+        min_calls: int = CIRCUIT_MIN_CALLS,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES,
+        clock: Callable[[], float] = monotonic
+    ):
+        """
+        Initialize breaker (closed)
+
+        Args:
+            name: Agent name (for logs)
+            failure_threshold: Failure rate that opens the circuit
+            slow_call_threshold: Slow-call rate that opens the circuit
+            window_size: Recent calls considered
+            min_calls: Calls needed in the window before the circuit may open
+            open_seconds: Time spent open before probing
+            half_open_probes: Successful probes needed to close again
+            clock: Time source (tests)
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.min_calls = max(1, min(min_calls, window_size))
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self.clock = clock
+        self.state = CLOSED
+        # (failed, slow) per recent call
+        self._window: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)
+        self._opened_at = 0.0
+        # Bumped each time the circuit opens, so late probes of an earlier
+        # half-open period are not mistaken for current ones
+        self._generation = 0
+        self._probes_in_flight = 0
+        self._probes_passed = 0
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self) -> Optional[Permit]:
+        """
+        Admit a call (reserving a probe when half-open)
+
+        Returns:
+            Permit to pass to record()/cancelled(), or None if the call is refused
+        """
+        if self.state == OPEN:
+            if self.clock() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                return None
+            self.state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probes_passed = 0
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight + self._probes_passed >= self.half_open_probes:
+                self.rejected += 1
+                return None
+            self._probes_in_flight += 1
+            return Permit(True, self._generation)
+        return Permit(False, self._generation)
+
+    def _is_probe(self, permit: Permit) -> bool:
+        return self.state == HALF_OPEN and permit.probe and permit.generation == self._generation
+
+    def record(self, permit: Permit, ok: bool, slow: bool = False) -> None:
+        """
+        Record the outcome of an allowed call
+
+        Args:
+            permit: The call's permit from allow()
+            ok: False for errors and timeouts
+            slow: True if the call took longer than the agent's slow-call limit
+        """
+        if self.state == HALF_OPEN:
+            if not self._is_probe(permit):
+                # Admitted before the circuit opened: says nothing about recovery
+                return
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            if not ok or slow:
+                self._open()
+                return
+            self._probes_passed += 1
+            if self._probes_passed >= self.half_open_probes:
+                self.state = CLOSED
+                self._window.clear()
+                print(f"Circuit closed: {self.name}")
+            return
+        if self.state == OPEN:
+            # A call allowed before the circuit opened
+            return
+
+        self._window.append((not ok, slow))
+        calls = len(self._window)
+        if calls < self.min_calls:
+            return
+        failures = sum(failed for failed, _ in self._window)
+        slow_calls = sum(slow for _, slow in self._window)
+        if failures / calls >= self.failure_threshold or slow_calls / calls >= self.slow_call_threshold:
+            self._open()
+
+    def cancelled(self, permit: Permit) -> None:
+        """Release an allowed call that was cancelled without an outcome"""
+        if self._is_probe(permit):
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _open(self):
+        if self.state != OPEN:
+            print(f"Circuit opened: {self.name}")
+        self.state = OPEN
+        self._opened_at = self.clock()
+        self._generation += 1
+        self._window.clear()
+        self.opened += 1
+
+    def stats(self) -> dict:
+        """Snapshot for diagnostics"""
+        return {
+            "state": self.state,
+            "open": int(self.state != CLOSED),
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,356 @@
+"""
+Job Queue - In-process background jobs with a durable local spool
+
+Used for work that must happen after a request but should not delay its
+response (e.g. the post-log profile/streak/badge flow).
+
+- Jobs are written to a SQLite spool before the request returns, so they
+  survive restarts and crashes; a worker claims a job with a lease, and jobs
+  whose worker died are picked up again once the lease expires.
+- Each worker process runs `JOB_CONCURRENCY` asyncio workers.
+- Failed jobs are retried with exponential backoff up to `JOB_MAX_ATTEMPTS`.
+- Job results are kept for `JOB_RESULT_TTL_SECONDS` so clients can poll them.
+- Payloads may carry user tokens, so the spool and its -wal/-shm files are
+  readable by the owner only.
+- Spool I/O can wait up to 5s on another worker's write lock, so JobQueue runs
+  every spool call in a thread (asyncio.to_thread), never on the event loop.
+
+All uvicorn workers on a host share the spool file, so a result can be read
+from any worker.
+"""
+import os
+import asyncio
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# asyncio workers per process
+JOB_CONCURRENCY: int = int(os.environ.get("JOB_CONCURRENCY", "4"))
+
+# Attempts before a job is marked failed
+JOB_MAX_ATTEMPTS: int = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+
+# Spool file shared by all workers on the host
+JOB_SPOOL_PATH: str = os.environ.get(
+    "JOB_SPOOL_PATH", os.path.join(tempfile.gettempdir(), "auramind_jobs.sqlite3")
+)
+
+# Seconds a claimed job may run before another worker may take it over
+JOB_LEASE_SECONDS: float = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+
+# How long finished job results stay pollable
+JOB_RESULT_TTL_SECONDS: float = float(os.environ.get("JOB_RESULT_TTL_SECONDS", "3600"))
+
+# How often (seconds) to look for orphaned or delayed jobs
+JOB_SWEEP_INTERVAL: float = 5.0
+
+JobHandler = Callable[[dict], Awaitable[Any]]
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobSpool:
+    """
+    SQLite persistence for jobs (WAL mode, shared across processes)
+
+    Methods are synchronous and thread-safe: each calling thread opens its own
+    connection, and the file is only touched on first use.
+    """
+
+    def __init__(self, path: str = JOB_SPOOL_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._ready = False
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not self._ready:
+                self._make_private()
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS jobs ("
+                    " id TEXT PRIMARY KEY, kind TEXT NOT NULL, owner TEXT, payload TEXT NOT NULL,"
+                    " status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,"
+                    " run_at REAL NOT NULL, lease_until REAL, result TEXT, error TEXT,"
+                    " updated_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_run_at ON jobs (status, run_at)")
+                self._ready = True
+            self._local.conn = conn
+        return conn
+
+    def _make_private(self):
+        """
+        Create the spool file 0600 before SQLite opens it
+
+        SQLite gives the -wal and -shm files the mode of the database file, so
+        they must not be created before it is private. Files left by an older
+        build are tightened too.
+        """
+        try:
+            os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600))
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self.path + suffix):
+                    os.chmod(self.path + suffix, 0o600)
+        except OSError as e:
+            print(f"Job spool permission error: {e}")
+
+    def add(self, job_id: str, kind: str, payload: dict, owner: Optional[str], now: float):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO jobs (id, kind, owner, payload, status, attempts, run_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, 0, ?, ?)",
+            (job_id, kind, owner, json.dumps(payload, default=str), PENDING, now, now)
+        )
+
+    def claim(self, job_id: str, now: float, lease: float) -> Optional[dict]:
+        """Atomically take a due job (or one whose lease expired); None if not claimable"""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, updated_at = ?"
+            " WHERE id = ? AND ((status = ? AND run_at <= ?) OR (status = ? AND lease_until < ?))",
+            (RUNNING, now + lease, now, job_id, PENDING, now, RUNNING, now)
+        )
+        if cursor.rowcount != 1:
+            return None
+        row = self.conn.execute(
+            "SELECT kind, payload, attempts FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return {"id": job_id, "kind": row[0], "payload": json.loads(row[1]), "attempts": row[2]}
+
+    def due(self, now: float, limit: int = 100) -> List[str]:
+        """Ids of jobs that are ready to run or were orphaned by a dead worker"""
+        rows = self.conn.execute(
+            "SELECT id FROM jobs WHERE (status = ? AND run_at <= ?) OR (status = ? AND lease_until < ?)"
+            " ORDER BY run_at LIMIT ?",
+            (PENDING, now, RUNNING, now, limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def finish(self, job_id: str, status: str, now: float, result: Any = None, error: str = None):
+        # Drop the payload once the job is settled; only the result is still needed
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, payload = '{}', lease_until = NULL,"
+            " updated_at = ? WHERE id = ?",
+            (status, json.dumps(result, default=str), error, now, job_id)
+        )
+
+    def reschedule(self, job_id: str, run_at: float, now: float, error: str = None):
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, run_at = ?, error = ?, lease_until = NULL, updated_at = ?"
+            " WHERE id = ?",
+            (PENDING, run_at, error, now, job_id)
+        )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self.conn.execute(
+            "SELECT kind, owner, status, attempts, result, error FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": job_id,
+            "kind": row[0],
+            "owner": row[1],
+            "status": row[2],
+            "attempts": row[3],
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+        }
+
+    def purge(self, before: float) -> int:
+        """Delete settled jobs last updated before `before`"""
+        return self.conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (DONE, FAILED, before)
+        ).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+class JobQueue:
+    """
+    Bounded-concurrency async job queue backed by a JobSpool
+
+    Usage:
+        job_queue.register("post_log", handler)      # async handler(payload) -> result
+        await job_queue.enqueue("post_log", payload, job_id=log_id, owner=user_id)
+        await job_queue.status(log_id)               # {"status": "done", "result": ...}
+    """
+
+    def __init__(
+        self,
+        spool_path: str = JOB_SPOOL_PATH,
+        concurrency: int = JOB_CONCURRENCY,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        lease: float = JOB_LEASE_SECONDS,
+        retry_base: float = 1.0,
+        result_ttl: float = JOB_RESULT_TTL_SECONDS,
+        sweep_interval: float = JOB_SWEEP_INTERVAL
+    ):
+        """
+        Initialize queue
+
+        Args:
+            spool_path: SQLite file for durable job storage
+            concurrency: Number of asyncio workers
+            max_attempts: Attempts before a job is marked failed
+            lease: Seconds a claimed job may run before it counts as orphaned
+            retry_base: First retry delay in seconds (doubles each attempt)
+            result_ttl: Seconds finished results are kept
+            sweep_interval: Seconds between scans for delayed/orphaned jobs
+        """
+        self.spool_path = spool_path
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.retry_base = retry_base
+        self.result_ttl = result_ttl
+        self.sweep_interval = sweep_interval
+        self.handlers: Dict[str, JobHandler] = {}
+        self._spool: Optional[JobSpool] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def spool(self) -> JobSpool:
+        if self._spool is None:
+            self._spool = JobSpool(self.spool_path)
+        return self._spool
+
+    def register(self, kind: str, handler: JobHandler):
+        """Register the async handler for a job kind"""
+        self.handlers[kind] = handler
+
+    async def enqueue(self, kind: str, payload: dict, job_id: Optional[str] = None, owner: Optional[str] = None) -> str:
+        """
+        Persist a job and schedule it on this worker
+
+        Args:
+            kind: Registered job kind
+            payload: JSON-serializable handler input
+            job_id: Optional id (e.g. the mood log id, so clients can poll by it)
+            owner: User the job belongs to (checked when results are read)
+
+        Returns:
+            The job id
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind: {kind}")
+        job_id = job_id or str(uuid.uuid4())
+        await asyncio.to_thread(self.spool.add, job_id, kind, payload, owner, time.time())
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+        return job_id
+
+    async def status(self, job_id: str) -> Optional[dict]:
+        """Job state and result (None if unknown or expired)"""
+        return await asyncio.to_thread(self.spool.get, job_id)
+
+    async def start(self):
+        """Start workers and the sweeper (call once per process, e.g. in lifespan)"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self):
+        """Stop workers; unfinished jobs stay in the spool and are resumed later"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    async def run_pending(self) -> int:
+        """Run every due job now, in this task (tests and maintenance scripts)"""
+        ran = 0
+        for job_id in await asyncio.to_thread(self.spool.due, time.time()):
+            if await self._run(job_id):
+                ran += 1
+        return ran
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"Job Worker Error: {e}")
+
+    async def _sweeper(self):
+        while True:
+            try:
+                now = time.time()
+                for job_id in await asyncio.to_thread(self.spool.due, now):
+                    self._queue.put_nowait(job_id)
+                await asyncio.to_thread(self.spool.purge, now - self.result_ttl)
+            except Exception as e:
+                print(f"Job Sweeper Error: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    async def _run(self, job_id: str) -> bool:
+        """Claim and execute one job. Returns False if another worker has it."""
+        job = await asyncio.to_thread(self.spool.claim, job_id, time.time(), self.lease)
+        if job is None:
+            return False
+
+        handler = self.handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job kind: {job['kind']}")
+            result = await asyncio.wait_for(handler(job["payload"]), timeout=self.lease)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back for the next process
+            await asyncio.to_thread(self.spool.reschedule, job_id, time.time(), time.time())
+            raise
+        except Exception as e:
+            now = time.time()
+            if job["attempts"] >= self.max_attempts:
+                self.failed += 1
+                await asyncio.to_thread(self.spool.finish, job_id, FAILED, now, error=str(e))
+                print(f"Job {job['kind']} {job_id} failed after {job['attempts']} attempts: {e}")
+            else:
+                self.retried += 1
+                delay = self.retry_base * (2 ** (job["attempts"] - 1))
+                await asyncio.to_thread(self.spool.reschedule, job_id, now + delay, now, error=str(e))
+                if self._queue is not None:
+                    asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, job_id)
+            return True
+
+        self.completed += 1
+        await asyncio.to_thread(self.spool.finish, job_id, DONE, time.time(), result=result)
+        return True
+
+    def stats(self) -> dict:
+        """Snapshot of queue state for diagnostics"""
+        return {
+            "workers": self.concurrency if self._tasks else 0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+# Singleton instance
+job_queue = JobQueue()
+
+def get_job_queue() -> JobQueue:
+    """Dependency injection for FastAPI"""
+    return job_queue
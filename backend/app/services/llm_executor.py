@@ -0,0 +1,375 @@
+"""
+LLM Executor - Non-blocking execution layer for Gemini calls
+
+Every agent in ai_manager.py goes through this executor instead of calling
+`GenerativeModel.generate_content` directly. It provides:
+- Native async generation (`generate_content_async`) so the event loop is never blocked
+- A concurrency limit shared by all agents on this worker, which adapts to
+  provider latency (AIMD, see adaptive_limit) and bounds the queue wait
+- A circuit breaker per agent: while Gemini fails or crawls, calls are refused
+  at once so agents serve their fallbacks immediately (see circuit_breaker)
+- Per-agent timeouts
+- Cancellation when the HTTP client disconnects
+- Per-agent latency and queue-wait histograms (see metrics)
+- Token usage, latency and outcome of every call in the usage ledger
+"""
+import os
+import asyncio
+from time import perf_counter
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+from fastapi import HTTPException, Request
+from app.services.adaptive_limit import AdaptiveLimiter, LLMOverloadedError
+from app.services.circuit_breaker import CLOSED, CircuitBreaker, CircuitOpenError, Permit
+from app.services.metrics import LLM_CALL_SECONDS, LLM_QUEUE_SECONDS, LLM_REJECTIONS
+from app.services.usage_ledger import UsageLedger, model_name, usage_ledger
+
+T = TypeVar("T")
+
+# Maximum number of Gemini calls in flight on one worker
+LLM_MAX_CONCURRENCY: int = int(os.environ.get("LLM_MAX_CONCURRENCY", "200"))
+
+# Floor for the adaptive limit when Gemini slows down
+LLM_MIN_CONCURRENCY: int = int(os.environ.get("LLM_MIN_CONCURRENCY", "4"))
+
+# Maximum seconds a call waits for a slot before the agent falls back
+LLM_QUEUE_TIMEOUT: float = float(os.environ.get("LLM_QUEUE_TIMEOUT_SECONDS", "5"))
+
+# A call slower than this fraction of its agent's timeout counts as slow
+# (shrinks the concurrency limit, counts towards opening the circuit)
+LLM_SLOW_CALL_RATIO: float = float(os.environ.get("LLM_SLOW_CALL_RATIO", "0.5"))
+
+# Fallback timeout (seconds) for agents without a specific setting
+LLM_DEFAULT_TIMEOUT: float = float(os.environ.get("LLM_TIMEOUT_SECONDS", "15"))
+
+# Per-agent timeouts (seconds). Override with LLM_TIMEOUT_<AGENT>, e.g. LLM_TIMEOUT_ANALYZER=8
+DEFAULT_AGENT_TIMEOUTS: Dict[str, float] = {
+    "analyzer": 10.0,
+    "empathy": 10.0,
+    "fused": 15.0,
+    "chat": 15.0,
+    "insight": 20.0,
+    "summary": 20.0,
+}
+
+# How often (seconds) to check whether the HTTP client is still connected
+DISCONNECT_POLL_INTERVAL: float = 0.25
+
+
+class LLMTimeoutError(Exception):
+    """Raised when a Gemini call exceeds its agent's timeout"""
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """True for provider errors that mean "slow down" (HTTP 429 / 503)"""
+    code = getattr(error, "code", None)
+    if not isinstance(code, int):
+        code = getattr(getattr(error, "response", None), "status_code", None)
+    return code in (429, 503)
+
+
+class LLMExecutor:
+    """
+    Bounded async executor for Gemini generation calls.
+
+    Agents never block the event loop: calls use the SDK's native async API and
+    wait for a slot when the worker already has `concurrency_limit` calls in
+    flight. The limit moves between `min_concurrency` and `max_concurrency`.
+
+    Besides LLMTimeoutError, calls may fail fast with CircuitOpenError or
+    LLMOverloadedError; agents treat both like any other failure and return
+    their fallback.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        default_timeout: float = LLM_DEFAULT_TIMEOUT,
+        agent_timeouts: Optional[Dict[str, float]] = None,
+        ledger: Optional[UsageLedger] = None,
+        min_concurrency: int = LLM_MIN_CONCURRENCY,
+        queue_timeout: Optional[float] = LLM_QUEUE_TIMEOUT,
+        slow_call_ratio: float = LLM_SLOW_CALL_RATIO,
+        breaker_factory: Callable[[str], CircuitBreaker] = CircuitBreaker
+    ):
+        """
+        Initialize executor
+
+        Args:
+            max_concurrency: Maximum number of concurrent LLM calls
+            default_timeout: Timeout in seconds for agents without a specific setting
+            agent_timeouts: Optional mapping of agent name -> timeout in seconds
+            ledger: Usage ledger (defaults to the worker singleton)
+            min_concurrency: Lowest concurrency limit under congestion
+            queue_timeout: Seconds to wait for a slot (None: no limit)
+            slow_call_ratio: Fraction of the agent timeout above which a call is slow
+            breaker_factory: Builds the circuit breaker of an agent from its name
+        """
+        self.max_concurrency = max_concurrency
+        self.default_timeout = default_timeout
+        self.agent_timeouts = dict(DEFAULT_AGENT_TIMEOUTS)
+        for agent in self.agent_timeouts:
+            env_value = os.environ.get(f"LLM_TIMEOUT_{agent.upper()}")
+            if env_value:
+                self.agent_timeouts[agent] = float(env_value)
+        if agent_timeouts:
+            self.agent_timeouts.update(agent_timeouts)
+
+        self.ledger = ledger or usage_ledger
+        self.limiter = AdaptiveLimiter(max_concurrency, min_concurrency, queue_timeout=queue_timeout)
+        self.slow_call_ratio = slow_call_ratio
+        self.breaker_factory = breaker_factory
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.timeouts = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self.limiter.in_flight
+
+    @property
+    def waiting(self) -> int:
+        return self.limiter.waiting
+
+    def timeout_for(self, agent: str) -> float:
+        """Return the timeout (seconds) configured for an agent"""
+        return self.agent_timeouts.get(agent, self.default_timeout)
+
+    def breaker_for(self, agent: str) -> CircuitBreaker:
+        """The agent's circuit breaker (created on first use)"""
+        breaker = self.breakers.get(agent)
+        if breaker is None:
+            breaker = self.breakers[agent] = self.breaker_factory(agent)
+        return breaker
+
+    async def generate(
+        self,
+        model: Any,
+        prompt: Any,
+        *,
+        agent: str,
+        timeout: Optional[float] = None,
+        **kwargs: Any
+    ) -> Any:
+        """
+        Run one generation call without blocking the event loop.
+
+        Args:
+            model: genai.GenerativeModel (or any object with generate_content_async)
+            prompt: Prompt contents
+            agent: Agent name, used to pick the timeout
+            timeout: Optional timeout override in seconds
+            **kwargs: Forwarded to generate_content_async (e.g. generation_config)
+
+        Returns:
+            The SDK response object
+
+        Raises:
+            LLMTimeoutError: If the call exceeds its timeout
+            CircuitOpenError: If the agent's circuit is open
+            LLMOverloadedError: If no slot freed up within the queue timeout
+            asyncio.CancelledError: If the caller was cancelled (e.g. client disconnected)
+        """
+        limit = timeout if timeout is not None else self.timeout_for(agent)
+
+        permit, ticket = await self._admit(agent)
+        start = perf_counter()
+        outcome = "error"
+        overloaded = False
+        response = None
+        try:
+            response = await asyncio.wait_for(
+                model.generate_content_async(prompt, **kwargs),
+                timeout=limit
+            )
+            outcome = "ok"
+            return response
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            outcome = "timeout"
+            raise LLMTimeoutError(f"{agent} agent timed out after {limit}s")
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            overloaded = is_overload_error(e)
+            raise
+        finally:
+            self._finish(agent, permit, ticket, model, getattr(response, "usage_metadata", None),
+                         start, outcome, limit, overloaded)
+
+    async def _admit(self, agent: str) -> Tuple[Permit, float]:
+        """
+        Pass the agent's circuit breaker, then wait for a concurrency slot
+        (the wait is recorded per agent)
+
+        Returns:
+            (breaker permit, limiter ticket)
+        """
+        breaker = self.breaker_for(agent)
+        permit = breaker.allow()
+        if permit is None:
+            LLM_REJECTIONS.inc(agent, "circuit_open")
+            raise CircuitOpenError(f"{agent} circuit is open")
+
+        start = perf_counter()
+        try:
+            return permit, await self.limiter.acquire()
+        except LLMOverloadedError:
+            LLM_REJECTIONS.inc(agent, "overloaded")
+            breaker.cancelled(permit)
+            raise
+        except asyncio.CancelledError:
+            breaker.cancelled(permit)
+            raise
+        finally:
+            LLM_QUEUE_SECONDS.observe(perf_counter() - start, agent)
+
+    def _finish(
+        self,
+        agent: str,
+        permit: Permit,
+        ticket: float,
+        model: Any,
+        usage: Any,
+        start: float,
+        outcome: str,
+        timeout: float,
+        overloaded: bool = False
+    ):
+        """Record the call, feed the breaker and the limiter, free the slot"""
+        elapsed = perf_counter() - start
+        slow = elapsed >= timeout * self.slow_call_ratio
+        self.limiter.release(ticket, dropped=outcome == "timeout" or overloaded or slow)
+        breaker = self.breaker_for(agent)
+        if outcome == "cancelled":
+            breaker.cancelled(permit)
+        else:
+            breaker.record(permit, ok=outcome == "ok", slow=slow)
+        LLM_CALL_SECONDS.observe(elapsed, agent, outcome)
+        try:
+            self.ledger.record(agent, model_name(model), usage, elapsed * 1000, outcome)
+        except Exception as e:
+            print(f"Usage Ledger Error: {e}")
+
+    async def stream(
+        self,
+        model: Any,
+        prompt: Any,
+        *,
+        agent: str,
+        timeout: Optional[float] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        """
+        Stream one generation call chunk by chunk.
+
+        Holds a concurrency slot for the whole stream. The agent timeout is a
+        deadline for the complete stream, not for each chunk. Closing or
+        cancelling the iterator (e.g. client disconnect) releases the slot.
+
+        Args:
+            model: genai.GenerativeModel (or any object with generate_content_async)
+            prompt: Prompt contents
+            agent: Agent name, used to pick the timeout
+            timeout: Optional timeout override in seconds
+            **kwargs: Forwarded to generate_content_async
+
+        Yields:
+            SDK response chunks (each has .text)
+
+        Raises:
+            LLMTimeoutError: If the stream is not finished before the deadline
+            CircuitOpenError: If the agent's circuit is open
+            LLMOverloadedError: If no slot freed up within the queue timeout
+        """
+        limit = timeout if timeout is not None else self.timeout_for(agent)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + limit
+
+        permit, ticket = await self._admit(agent)
+        start = perf_counter()
+        outcome = "error"
+        overloaded = False
+        usage = None
+        try:
+            response = await asyncio.wait_for(
+                model.generate_content_async(prompt, stream=True, **kwargs),
+                timeout=limit
+            )
+            chunks = response.__aiter__()
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=remaining)
+                except StopAsyncIteration:
+                    break
+                # Gemini reports usage on the chunks; the last one has the totals
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            outcome = "timeout"
+            raise LLMTimeoutError(f"{agent} agent stream timed out after {limit}s")
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            overloaded = is_overload_error(e)
+            raise
+        finally:
+            self._finish(agent, permit, ticket, model, usage, start, outcome, limit, overloaded)
+
+    def stats(self) -> dict:
+        """Snapshot of executor state for diagnostics"""
+        breakers = list(self.breakers.values())
+        return {
+            "max_concurrency": self.max_concurrency,
+            "concurrency_limit": self.limiter.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "timeouts": self.timeouts,
+            "overloaded": self.limiter.rejected,
+            "open_circuits": sum(breaker.state != CLOSED for breaker in breakers),
+            "circuit_rejections": sum(breaker.rejected for breaker in breakers),
+        }
+
+
+async def run_cancellable(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Await `awaitable`, cancelling it if the HTTP client disconnects first.
+
+    Starlette keeps running a handler after the client goes away, so without this
+    an abandoned request would keep holding an LLM slot until Gemini answers.
+
+    Args:
+        request: Incoming Starlette/FastAPI request
+        awaitable: Coroutine to run (usually an AIAgentManager call)
+
+    Returns:
+        The awaitable's result
+
+    Raises:
+        HTTPException: 499 if the client disconnected before completion
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+# Singleton instance
+llm_executor = LLMExecutor()
+
+def get_llm_executor() -> LLMExecutor:
+    """Dependency injection for FastAPI"""
+    return llm_executor
@@ -0,0 +1,291 @@
+"""
+Metrics - in-process counters and latency histograms, exported on /metrics
+
+Answers "where did this slow request spend its time" without a profiler:
+- HTTP requests per route template (MetricsMiddleware)
+- every Gemini call per agent (LLMExecutor), calls refused by the circuit
+  breakers / concurrency limit, and every PostgREST call per table
+- pipeline stages (StageTimer), badge evaluation
+- fallbacks, rate-limit rejections, insight cache lookups
+- the stats() snapshots of the shared singletons (pool, caches, job queue...)
+- event-loop lag (how late a periodic probe wakes up), which shows blocking
+  code on the loop regardless of which request caused it
+
+Everything is rendered in the Prometheus text exposition format (0.0.4), so
+any Prometheus-compatible scraper can read it. Recording is a dict update
+under a lock: cheap enough for every request. Metrics are per worker
+process; the scraper aggregates across workers.
+"""
+import asyncio
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Latency buckets in seconds (Gemini calls can take several seconds)
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+PREFIX = "auramind_"
+
+# Seconds between event-loop lag probes
+EVENT_LOOP_PROBE_INTERVAL: float = 0.1
+
+LAG_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Latency histogram (seconds) with optional labels"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, *labels)
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return entry[2] if entry else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(entry[0]), entry[1], entry[2]) for labels, entry in self._values.items()]
+        bounds = self.buckets + (float("inf"),)
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                le = _labels(self.labelnames, labels, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            suffix = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {_number(total)}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds the metrics of this worker and renders them
+
+    Components that already keep counters expose them through stats(); they
+    are registered as collectors and exported as gauges named
+    auramind_<component>_<key> (non-numeric values are skipped).
+    """
+
+    def __init__(self, prefix: str = PREFIX):
+        self.prefix = prefix
+        self._metrics: Dict[str, object] = {}
+        self._collectors: Dict[str, Callable[[], dict]] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self.prefix + name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(self.prefix + name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def collector(self, component: str, stats: Callable[[], dict]) -> None:
+        """Export a component's stats() snapshot on every scrape"""
+        self._collectors[component] = stats
+
+    def render(self) -> str:
+        """All metrics in the text exposition format"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for component, stats in self._collectors.items():
+            try:
+                snapshot = stats()
+            except Exception as e:
+                print(f"Metrics Collector Error ({component}): {e}")
+                continue
+            for key, value in snapshot.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                name = f"{self.prefix}{component}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Singleton registry and the metrics recorded across the app
+metrics = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status")
+)
+LLM_CALL_SECONDS = metrics.histogram(
+    "llm_call_duration_seconds", "Gemini call latency by agent (excluding queueing)",
+    ("agent", "outcome")
+)
+LLM_QUEUE_SECONDS = metrics.histogram(
+    "llm_queue_wait_seconds", "Time spent waiting for an LLM concurrency slot", ("agent",)
+)
+LLM_REJECTIONS = metrics.counter(
+    "llm_rejections_total", "LLM calls refused without calling Gemini, by reason (circuit_open, overloaded)",
+    ("agent", "reason")
+)
+SUPABASE_CALL_SECONDS = metrics.histogram(
+    "supabase_request_duration_seconds", "PostgREST request latency (until headers) by table",
+    ("method", "table", "status")
+)
+STAGE_SECONDS = metrics.histogram(
+    "pipeline_stage_duration_seconds", "Pipeline stage latency (StageTimer)", ("stage",)
+)
+BADGE_CHECK_SECONDS = metrics.histogram(
+    "badge_check_duration_seconds", "BadgeService.check_new_badges latency"
+)
+AI_FALLBACKS = metrics.counter(
+    "ai_fallbacks_total", "Canned responses returned because an agent failed", ("agent",)
+)
+RATE_LIMIT_REJECTIONS = metrics.counter(
+    "rate_limit_rejections_total", "AI calls refused by the per-user rate limiter"
+)
+INSIGHT_CACHE_LOOKUPS = metrics.counter(
+    "insight_cache_lookups_total", "Monthly insight cache lookups by result (fresh, stale, miss)",
+    ("result",)
+)
+EVENT_LOOP_LAG = metrics.histogram(
+    "event_loop_lag_seconds", "Delay between a probe's scheduled and actual wake-up",
+    buckets=LAG_BUCKETS
+)
+
+
+async def monitor_event_loop(interval: float = EVENT_LOOP_PROBE_INTERVAL, histogram: Histogram = EVENT_LOOP_LAG):
+    """Background task: record how late the loop runs a sleep(interval)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        histogram.observe(max(loop.time() - start - interval, 0.0))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording HTTP_REQUEST_SECONDS
+
+    Requests are labelled with the matched route template (e.g.
+    /mood-logs/{log_id}/achievements), never the raw path, so the number of
+    series stays bounded. Unmatched paths share the "unmatched" label.
+    Streaming responses are timed until the last chunk is sent.
+    """
+
+    def __init__(self, app: ASGIApp, histogram: Histogram = HTTP_REQUEST_SECONDS):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            self.histogram.observe(
+                perf_counter() - start,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status)
+            )
@@ -0,0 +1,102 @@
+"""
+Pipeline - Tiny dependency-graph runner with per-stage timings
+
+Stages declare which earlier stages they depend on; everything else runs
+concurrently. Used by AIAgentManager.analyze_mood so the analyzer call and
+context fetch overlap instead of running back to back. StageTimer alone
+times sequential steps (POST /mood-logs/).
+"""
+import asyncio
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, Iterator, Sequence, Tuple
+from app.services.metrics import STAGE_SECONDS
+
+StageFn = Callable[..., Awaitable[Any]]
+
+
+class StageTimer:
+    """Collects wall-clock durations (milliseconds) per named stage (also fed to /metrics)"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.timings[name] = round(elapsed * 1000, 2)
+            STAGE_SECONDS.observe(elapsed, name)
+
+    def server_timing(self) -> str:
+        """Format timings as an HTTP Server-Timing header value"""
+        return ", ".join(f"{name};dur={duration}" for name, duration in self.timings.items())
+
+
+class StageGraph:
+    """
+    A set of async stages with dependencies.
+
+    Usage:
+        graph = StageGraph()
+        graph.add("analyze", lambda: analyzer.analyze(text))
+        graph.add("context", lambda: fetch_context())
+        graph.add("respond", lambda analyze, context: respond(analyze, context),
+                  deps=("analyze", "context"))
+        results = await graph.run()
+
+    Each stage receives its dependencies' results as keyword arguments.
+    """
+
+    def __init__(self, timer: StageTimer = None):
+        self.timer = timer or StageTimer()
+        self._stages: Dict[str, Tuple[StageFn, Tuple[str, ...]]] = {}
+
+    def add(self, name: str, fn: StageFn, deps: Sequence[str] = ()) -> "StageGraph":
+        """
+        Register a stage
+
+        Args:
+            name: Stage name (also the keyword its result is passed under)
+            fn: Async callable receiving dependency results as keyword arguments
+            deps: Names of stages that must finish first (must already be added)
+        """
+        if name in self._stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+        self._stages[name] = (fn, tuple(deps))
+        return self
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Run all stages, each as soon as its dependencies are done
+
+        Returns:
+            dict mapping stage name -> result
+
+        Raises:
+            The first exception raised by any stage (remaining stages are cancelled)
+        """
+        tasks: Dict[str, asyncio.Future] = {}
+
+        async def run_stage(name: str, fn: StageFn, deps: Tuple[str, ...]) -> Any:
+            inputs = {dep: await tasks[dep] for dep in deps}
+            with self.timer.measure(name):
+                return await fn(**inputs)
+
+        for name, (fn, deps) in self._stages.items():
+            tasks[name] = asyncio.ensure_future(run_stage(name, fn, deps))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        return {name: task.result() for name, task in tasks.items()}
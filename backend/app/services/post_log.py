@@ -0,0 +1,68 @@
+"""
+Post-log processing - profile, streak and badge work run after POST /mood-logs/
+
+Runs on the job queue (app.services.jobs), so the create request only waits
+for the AI pipeline and the insert. The job id is the mood log id; clients
+read the awarded badges from GET /mood-logs/{log_id}/achievements (or from a
+Realtime subscription on user_achievements).
+"""
+from typing import List
+from app.core import supabase_pool
+from app.services.badges import BadgeService
+from app.services.jobs import job_queue
+from app.services.repositories import Repositories
+
+POST_LOG_JOB = "post_log"
+
+
+async def run_post_log(payload: dict) -> List[dict]:
+    """
+    Update the profile and award badges for one new mood log
+
+    Safe to retry: the avatar update is idempotent and badges are upserted.
+
+    Args:
+        payload: {"user_id", "access_token", "log", "avatar_state"}
+
+    Returns:
+        Newly earned badges: [{'code': 'STREAK_3', 'name': '...', 'description': '...'}]
+    """
+    user_id = payload["user_id"]
+    # The user's JWT keeps RLS in force; a job replayed after the token
+    # expired fails with 401 and ends up marked failed.
+    db = supabase_pool.bind(payload["access_token"])
+    repos = Repositories(db)
+
+    # 1. Update basic profile info (avatar state)
+    await repos.profiles.update_avatar_state(user_id, payload["avatar_state"])
+
+    # 2. Read the profile after the insert, so the streak the trigger wrote is included
+    profile = await repos.profiles.get(user_id, columns="current_streak, longest_streak, last_log_date")
+    if not profile:
+        return []
+
+    # 3. Evaluate and award badges
+    return await BadgeService(db).check_new_badges(
+        user_id=user_id,
+        new_log=payload["log"],
+        current_profile=profile,
+        raise_errors=True
+    )
+
+
+async def enqueue_post_log(user_id: str, access_token: str, log: dict, avatar_state: str) -> str:
+    """
+    Queue post-log processing for a freshly inserted log
+
+    Returns:
+        Job id (the log id)
+    """
+    return await job_queue.enqueue(
+        POST_LOG_JOB,
+        {"user_id": user_id, "access_token": access_token, "log": log, "avatar_state": avatar_state},
+        job_id=str(log["id"]),
+        owner=user_id
+    )
+
+
+job_queue.register(POST_LOG_JOB, run_post_log)
@@ -1,118 +1,479 @@
 """
 Rate Limiter for AI API calls
-Simple in-memory rate limiter to prevent abuse on free tier
+Per-user limits with constant memory per user and a pluggable state backend
+
+Algorithms (RATE_LIMIT_ALGORITHM):
+- sliding_window: sliding-window counter (current + weighted previous window)
+- token_bucket: bucket of `max_calls` tokens refilled evenly over the window
+
+Backends (RATE_LIMIT_BACKEND):
+- memory: in-process, sharded locks, idle keys evicted in the background
+- sqlite: one WAL-mode SQLite file shared by all uvicorn workers on a host
+- redis: any Redis-protocol server (atomic Lua scripts, keys expire via TTL),
+  so limits hold across uvicorn workers and hosts. Needs the `redis` package.
 """
-from datetime import datetime, timedelta
-from collections import defaultdict
+import os
+import asyncio
+import math
+import sqlite3
+import tempfile
 import threading
-from typing import Dict, List
+import time
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from app.services.metrics import RATE_LIMIT_REJECTIONS
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # optional dependency, only needed for RATE_LIMIT_BACKEND=redis
+    redis = None
+
+# Limit applied to AI endpoints (calls per window, per user)
+RATE_LIMIT_MAX_CALLS: int = int(os.environ.get("RATE_LIMIT_MAX_CALLS", "20"))
+RATE_LIMIT_WINDOW_MINUTES: int = int(os.environ.get("RATE_LIMIT_WINDOW_MINUTES", "60"))
+
+# "sliding_window" or "token_bucket"
+RATE_LIMIT_ALGORITHM: str = os.environ.get("RATE_LIMIT_ALGORITHM", "sliding_window")
+
+# "memory", "sqlite" or "redis"
+RATE_LIMIT_BACKEND: str = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_SQLITE_PATH: str = os.environ.get(
+    "RATE_LIMIT_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "auramind_ratelimit.sqlite3")
+)
+RATE_LIMIT_REDIS_URL: str = os.environ.get("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+
+# How often (seconds) idle users are dropped (memory and sqlite backends)
+RATE_LIMIT_EVICT_INTERVAL: float = float(os.environ.get("RATE_LIMIT_EVICT_INTERVAL", "60"))
+
+State = Tuple[float, ...]
+
+
+class SlidingWindowCounter:
+    """
+    Sliding-window counter
+
+    State per user: (window_start, current_count, previous_count).
+    The previous window's count is weighted by how much of it still overlaps
+    the sliding window, which approximates a true sliding log in O(1) memory.
+    """
+
+    name = "sliding_window"
+
+    LUA = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local window = tonumber(ARGV[4])
+local s = redis.call('HMGET', KEYS[1], 'a', 'b', 'c')
+local start = math.floor(now / window) * window
+local curr, prev = 0, 0
+local ws = tonumber(s[1])
+if ws == start then
+  curr, prev = tonumber(s[2]), tonumber(s[3])
+elseif ws == start - window then
+  prev = tonumber(s[2])
+end
+local estimated = prev * (1 - (now - start) / window) + curr
+local allowed = 0
+if estimated + cost <= limit then
+  allowed = 1
+  curr = curr + cost
+  estimated = estimated + cost
+end
+if cost > 0 then
+  redis.call('HSET', KEYS[1], 'a', start, 'b', curr, 'c', prev)
+  redis.call('PEXPIRE', KEYS[1], math.ceil(window * 2000))
+end
+return {allowed, math.max(0, math.floor(limit - estimated))}
+"""
+
+    def __init__(self, max_calls: int, window_seconds: float):
+        self.max_calls = max_calls
+        self.window = window_seconds
+
+    def apply(self, state: Optional[State], now: float, cost: int = 1) -> Tuple[State, bool, int]:
+        """
+        Apply `cost` calls at time `now`
+
+        Returns:
+            (new_state, allowed, remaining_calls)
+        """
+        start = math.floor(now / self.window) * self.window
+        curr, prev = 0, 0
+        if state is not None:
+            if state[0] == start:
+                curr, prev = state[1], state[2]
+            elif state[0] == start - self.window:
+                prev = state[1]
+
+        estimated = prev * (1 - (now - start) / self.window) + curr
+        allowed = estimated + cost <= self.max_calls
+        if allowed:
+            curr += cost
+            estimated += cost
+        return (start, curr, prev), allowed, max(0, math.floor(self.max_calls - estimated))
+
+    def expires_at(self, state: State) -> float:
+        """Time after which the state is equivalent to a fresh user"""
+        return state[0] + 2 * self.window
+
+
+class TokenBucket:
+    """
+    Token bucket
+
+    State per user: (tokens, updated_at). Holds at most `max_calls` tokens and
+    refills `max_calls` tokens per window, so short bursts are allowed while the
+    long-run rate stays at max_calls / window.
+    """
+
+    name = "token_bucket"
+
+    LUA = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local window = tonumber(ARGV[4])
+local s = redis.call('HMGET', KEYS[1], 'a', 'b')
+local tokens = tonumber(s[1]) or limit
+local updated = tonumber(s[2]) or now
+tokens = math.min(limit, tokens + math.max(0, now - updated) * limit / window)
+local allowed = 0
+if tokens >= cost then
+  allowed = 1
+  tokens = tokens - cost
+end
+if cost > 0 then
+  redis.call('HSET', KEYS[1], 'a', tokens, 'b', now)
+  redis.call('PEXPIRE', KEYS[1], math.ceil(window * 1000))
+end
+return {allowed, math.floor(tokens)}
+"""
+
+    def __init__(self, max_calls: int, window_seconds: float):
+        self.max_calls = max_calls
+        self.window = window_seconds
+
+    def apply(self, state: Optional[State], now: float, cost: int = 1) -> Tuple[State, bool, int]:
+        """
+        Apply `cost` calls at time `now`
+
+        Returns:
+            (new_state, allowed, remaining_calls)
+        """
+        tokens, updated = state if state is not None else (self.max_calls, now)
+        tokens = min(self.max_calls, tokens + max(0.0, now - updated) * self.max_calls / self.window)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        return (tokens, now), allowed, math.floor(tokens)
+
+    def expires_at(self, state: State) -> float:
+        """Time after which the bucket is full again (same as a fresh user)"""
+        return state[1] + self.window
+
+
+ALGORITHMS = {
+    SlidingWindowCounter.name: SlidingWindowCounter,
+    TokenBucket.name: TokenBucket,
+}
+
+
+class MemoryBackend:
+    """
+    In-process state, split across shards with one lock each
+
+    Requests for different users rarely contend on the same lock, and
+    `evict` only holds one shard's lock at a time. Every call is a few dict
+    operations, so the limiter runs them directly on the event loop.
+    """
+
+    blocking = False
+
+    def __init__(self, shards: int = 16):
+        self._shards: List[Tuple[Dict[str, State], threading.Lock]] = [
+            ({}, threading.Lock()) for _ in range(shards)
+        ]
+
+    def _shard(self, key: str) -> Tuple[Dict[str, State], threading.Lock]:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def hit(self, key: str, algorithm, now: float, cost: int = 1) -> Tuple[bool, int]:
+        states, lock = self._shard(key)
+        with lock:
+            state, allowed, remaining = algorithm.apply(states.get(key), now, cost)
+            states[key] = state
+        return allowed, remaining
+
+    def peek(self, key: str, algorithm, now: float) -> int:
+        states, lock = self._shard(key)
+        with lock:
+            _, _, remaining = algorithm.apply(states.get(key), now, 0)
+        return remaining
+
+    def reset(self, key: str):
+        states, lock = self._shard(key)
+        with lock:
+            states.pop(key, None)
+
+    def evict(self, algorithm, now: float) -> int:
+        removed = 0
+        for states, lock in self._shards:
+            with lock:
+                expired = [key for key, state in states.items() if algorithm.expires_at(state) <= now]
+                for key in expired:
+                    del states[key]
+                removed += len(expired)
+        return removed
+
+    def size(self) -> int:
+        return sum(len(states) for states, _ in self._shards)
+
+
+class SqliteBackend:
+    """
+    State in a SQLite file shared by every worker process on the host
+
+    WAL mode lets readers and the single writer proceed without blocking each
+    other, and each check-and-increment is one short BEGIN IMMEDIATE
+    transaction, so counters stay exact across processes with no extra service.
+    Each thread gets its own connection. A transaction can wait up to
+    `busy_timeout` for another worker's lock, so the limiter runs every call
+    in a worker thread rather than on the event loop.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str = RATE_LIMIT_SQLITE_PATH, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            " key TEXT PRIMARY KEY, s0 REAL, s1 REAL, s2 REAL, expires_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS rate_limits_expires_at ON rate_limits (expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: transactions are opened explicitly below
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Losing the last few counter updates on power loss is acceptable
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, conn: sqlite3.Connection, key: str) -> Optional[State]:
+        row = conn.execute("SELECT s0, s1, s2 FROM rate_limits WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return tuple(value for value in row if value is not None)
+
+    def hit(self, key: str, algorithm, now: float, cost: int = 1) -> Tuple[bool, int]:
+        conn = self._conn()
+        # IMMEDIATE takes the write lock up front, making read-modify-write atomic
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            state, allowed, remaining = algorithm.apply(self._load(conn, key), now, cost)
+            padded = tuple(state) + (None,) * (3 - len(state))
+            conn.execute(
+                "INSERT INTO rate_limits (key, s0, s1, s2, expires_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET s0 = excluded.s0, s1 = excluded.s1,"
+                " s2 = excluded.s2, expires_at = excluded.expires_at",
+                (key, *padded, algorithm.expires_at(state))
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, remaining
+
+    def peek(self, key: str, algorithm, now: float) -> int:
+        _, _, remaining = algorithm.apply(self._load(self._conn(), key), now, 0)
+        return remaining
+
+    def reset(self, key: str):
+        self._conn().execute("DELETE FROM rate_limits WHERE key = ?", (key,))
+
+    def evict(self, algorithm, now: float) -> int:
+        return self._conn().execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,)).rowcount
+
+    def size(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+
+class RedisBackend:
+    """
+    Shared state on a Redis-protocol server (Redis, Valkey, KeyDB, Dragonfly)
+
+    Each check-and-increment is one atomic Lua script; keys carry a TTL so
+    idle users disappear without a cleanup job. Uses the asyncio client, so
+    calls are awaited on the event loop instead of blocking it.
+    """
+
+    blocking = False
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, prefix: str = "auramind:ratelimit:"):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._scripts = {}
+
+    async def _run(self, key: str, algorithm, now: float, cost: int) -> Tuple[bool, int]:
+        script = self._scripts.get(algorithm.name)
+        if script is None:
+            script = self._scripts[algorithm.name] = self.client.register_script(algorithm.LUA)
+        allowed, remaining = await script(
+            keys=[self.prefix + key],
+            args=[now, cost, algorithm.max_calls, algorithm.window]
+        )
+        return bool(allowed), int(remaining)
+
+    async def hit(self, key: str, algorithm, now: float, cost: int = 1) -> Tuple[bool, int]:
+        return await self._run(key, algorithm, now, cost)
+
+    async def peek(self, key: str, algorithm, now: float) -> int:
+        return (await self._run(key, algorithm, now, 0))[1]
+
+    async def reset(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def evict(self, algorithm, now: float) -> int:
+        # Keys expire on their own (PEXPIRE in the scripts)
+        return 0
+
+    def size(self) -> int:
+        return 0
+
 
 class RateLimiter:
     """
-    Simple in-memory rate limiter for AI API calls per user
-    
-    For production, consider using Redis or Supabase Edge Functions
-    for distributed rate limiting across multiple server instances.
+    Per-user rate limiter for AI API calls
+
+    Memory per user is constant (a few numbers), whatever the number of calls.
     """
-    
-    def __init__(self, max_calls: int = 20, window_minutes: int = 60):
+
+    def __init__(
+        self,
+        max_calls: int = 20,
+        window_minutes: int = 60,
+        algorithm: str = SlidingWindowCounter.name,
+        backend=None,
+        clock: Callable[[], float] = time.time
+    ):
         """
         Initialize rate limiter
-        
+
         Args:
             max_calls: Maximum number of calls allowed per window
             window_minutes: Time window in minutes
+            algorithm: "sliding_window" or "token_bucket"
+            backend: State backend (defaults to a new MemoryBackend)
+            clock: Wall-clock source in seconds (shared backends need real time)
         """
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
         self.max_calls = max_calls
         self.window = timedelta(minutes=window_minutes)
-        self.calls: Dict[str, List[datetime]] = defaultdict(list)
-        self.lock = threading.Lock()
-    
-    def is_allowed(self, user_id: str) -> bool:
+        self.algorithm = ALGORITHMS[algorithm](max_calls, self.window.total_seconds())
+        self.backend = backend or MemoryBackend()
+        self.clock = clock
+        self.rejections = 0
+
+    async def _call(self, method, *args):
+        """Run a backend call: awaited if async, in a worker thread if it can block"""
+        if asyncio.iscoroutinefunction(method):
+            return await method(*args)
+        if self.backend.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def is_allowed(self, user_id: str) -> bool:
         """
-        Check if user is allowed to make an AI call
-        
+        Check if user is allowed to make an AI call (and count it if so)
+
         Args:
             user_id: User ID to check
-            
+
         Returns:
             True if allowed, False if rate limited
         """
-        with self.lock:
-            now = datetime.utcnow()
-            
-            # Remove calls outside the current window
-            self.calls[user_id] = [
-                call_time for call_time in self.calls[user_id]
-                if now - call_time < self.window
-            ]
-            
-            # Check if user has exceeded the limit
-            if len(self.calls[user_id]) >= self.max_calls:
-                return False
-            
-            # Record this call
-            self.calls[user_id].append(now)
-            return True
-    
-    def get_remaining_calls(self, user_id: str) -> int:
+        allowed, _ = await self._call(self.backend.hit, user_id, self.algorithm, self.clock())
+        if not allowed:
+            self.rejections += 1
+            RATE_LIMIT_REJECTIONS.inc()
+        return allowed
+
+    async def get_remaining_calls(self, user_id: str) -> int:
         """
         Get number of remaining calls for a user
-        
+
         Args:
             user_id: User ID to check
-            
+
         Returns:
             Number of remaining calls in current window
         """
-        with self.lock:
-            now = datetime.utcnow()
-            
-            # Remove calls outside the current window
-            self.calls[user_id] = [
-                call_time for call_time in self.calls[user_id]
-                if now - call_time < self.window
-            ]
-            
-            return max(0, self.max_calls - len(self.calls[user_id]))
-    
-    def reset_user(self, user_id: str):
+        return await self._call(self.backend.peek, user_id, self.algorithm, self.clock())
+
+    async def reset_user(self, user_id: str):
         """
         Reset rate limit for a specific user
-        
+
         Args:
             user_id: User ID to reset
         """
-        with self.lock:
-            if user_id in self.calls:
-                del self.calls[user_id]
-    
-    def cleanup_old_entries(self):
+        await self._call(self.backend.reset, user_id)
+
+    async def cleanup_old_entries(self) -> int:
         """
-        Remove all expired entries to free memory
-        Should be called periodically
+        Remove users whose state has expired to free memory
+
+        Returns:
+            Number of users removed
         """
-        with self.lock:
-            now = datetime.utcnow()
-            users_to_remove = []
-            
-            for user_id, call_times in self.calls.items():
-                # Remove expired calls
-                self.calls[user_id] = [
-                    call_time for call_time in call_times
-                    if now - call_time < self.window
-                ]
-                
-                # Mark empty users for removal
-                if not self.calls[user_id]:
-                    users_to_remove.append(user_id)
-            
-            # Remove users with no active calls
-            for user_id in users_to_remove:
-                del self.calls[user_id]
+        return await self._call(self.backend.evict, self.algorithm, self.clock())
+
+    def stats(self) -> dict:
+        """Snapshot of limiter state for diagnostics"""
+        return {
+            "max_calls": self.max_calls,
+            "window_seconds": self.window.total_seconds(),
+            "rejections": self.rejections,
+        }
+
+    async def run_eviction(self, interval: float = RATE_LIMIT_EVICT_INTERVAL):
+        """Background task: call cleanup_old_entries every `interval` seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.cleanup_old_entries()
+            except Exception as e:
+                print(f"Rate Limiter Eviction Error: {e}")
+
+
+def create_backend(name: str = RATE_LIMIT_BACKEND):
+    """Build the state backend selected by RATE_LIMIT_BACKEND"""
+    if name == "memory":
+        return MemoryBackend()
+    if name == "sqlite":
+        return SqliteBackend(RATE_LIMIT_SQLITE_PATH)
+    if name == "redis":
+        return RedisBackend(RATE_LIMIT_REDIS_URL)
+    raise ValueError(f"Unknown rate limit backend: {name}")
+
 
 # Singleton instance
-rate_limiter = RateLimiter(max_calls=20, window_minutes=60)
+rate_limiter = RateLimiter(
+    max_calls=RATE_LIMIT_MAX_CALLS,
+    window_minutes=RATE_LIMIT_WINDOW_MINUTES,
+    algorithm=RATE_LIMIT_ALGORITHM,
+    backend=create_backend()
+)
 
 def get_rate_limiter() -> RateLimiter:
     """Dependency injection for FastAPI"""
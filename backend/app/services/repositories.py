@@ -0,0 +1,383 @@
+"""
+Async data-access layer for Supabase tables
+
+Routers and services await these repositories instead of calling the blocking
+supabase-py query builder, so DB round trips overlap with other requests on
+the same worker. All queries run with the caller's JWT (see app.core), so RLS
+still applies; the explicit user_id filters are kept for defense-in-depth.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+from fastapi import Depends
+from postgrest.types import ReturnMethod
+from app.core import SupabaseClient, get_supabase_with_auth
+
+Row = Dict[str, Any]
+
+
+def encode_cursor(cursor: Tuple[str, str]) -> str:
+    """Opaque, URL-safe page token for a (created_at, id) position"""
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[str, str]:
+    """
+    Inverse of encode_cursor
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        # Only ever interpolated into PostgREST filters: validate strictly
+        datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        uuid.UUID(row_id)
+        return created_at, row_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class MoodLogRepository:
+    """Typed access to the mood_logs table"""
+
+    def __init__(self, db: SupabaseClient):
+        self.db = db
+
+    async def insert(self, data: Row) -> Optional[Row]:
+        """Insert one mood log and return the stored row (None if nothing was written)"""
+        response = await self.db.table("mood_logs").insert(data).execute()
+        return response.data[0] if response.data else None
+
+    async def page(
+        self,
+        user_id: str,
+        limit: Optional[int],
+        cursor: Optional[Tuple[str, str]] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        columns: str = "*"
+    ) -> Tuple[List[Row], Optional[Tuple[str, str]]]:
+        """
+        One page of a user's mood logs, newest first (keyset pagination)
+
+        Ordering is (created_at DESC, id DESC), so pages stay stable while new
+        logs are written and each page is an index range scan, not an OFFSET.
+
+        Args:
+            user_id: User UUID
+            limit: Page size (None: every matching log in one page)
+            cursor: (created_at, id) of the last row of the previous page
+            start: Optional inclusive ISO timestamp
+            end: Optional exclusive ISO timestamp
+            columns: PostgREST select list (must include created_at and id)
+
+        Returns:
+            (rows, next_cursor) - next_cursor is None on the last page
+        """
+        query = self.db.table("mood_logs")\
+            .select(columns)\
+            .eq("user_id", user_id)
+        if start:
+            query = query.gte("created_at", start)
+        if end:
+            query = query.lt("created_at", end)
+        if cursor:
+            created_at, log_id = cursor
+            query = query.or_(
+                f'created_at.lt."{created_at}",'
+                f'and(created_at.eq."{created_at}",id.lt.{log_id})'
+            )
+        query = query\
+            .order("created_at", desc=True)\
+            .order("id", desc=True)
+        if limit is not None:
+            # One extra row tells us whether another page exists
+            query = query.limit(limit + 1)
+        response = await query.execute()
+
+        rows = response.data or []
+        if limit is None or len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, (rows[-1]["created_at"], rows[-1]["id"])
+
+    async def list_between(
+        self,
+        user_id: str,
+        start: str,
+        end: str,
+        columns: str = "*"
+    ) -> List[Row]:
+        """
+        Mood logs with start <= created_at < end, oldest first
+
+        Args:
+            user_id: User UUID
+            start: Inclusive ISO timestamp
+            end: Exclusive ISO timestamp
+            columns: PostgREST select list
+        """
+        response = await self.db.table("mood_logs")\
+            .select(columns)\
+            .eq("user_id", user_id)\
+            .gte("created_at", start)\
+            .lt("created_at", end)\
+            .order("created_at", desc=False)\
+            .execute()
+        return response.data or []
+
+    async def list_since(self, user_id: str, since: str, columns: str = "*") -> List[Row]:
+        """Mood logs created at or after `since`, newest first"""
+        response = await self.db.table("mood_logs")\
+            .select(columns)\
+            .eq("user_id", user_id)\
+            .gte("created_at", since)\
+            .order("created_at", desc=True)\
+            .execute()
+        return response.data or []
+
+
+class DailySummaryRepository:
+    """Typed access to the daily_mood_summaries table (migration 007)"""
+
+    def __init__(self, db: SupabaseClient):
+        self.db = db
+
+    async def list_between(self, user_id: str, start_date: str, end_date: str) -> List[Row]:
+        """
+        Summary rows with start_date <= log_date < end_date, oldest first
+
+        Args:
+            user_id: User UUID
+            start_date: Inclusive date (YYYY-MM-DD)
+            end_date: Exclusive date (YYYY-MM-DD)
+        """
+        response = await self.db.table("daily_mood_summaries")\
+            .select("*")\
+            .eq("user_id", user_id)\
+            .gte("log_date", start_date)\
+            .lt("log_date", end_date)\
+            .order("log_date", desc=False)\
+            .execute()
+        return response.data or []
+
+
+class MonthlyInsightRepository:
+    """Typed access to the monthly_insights cache table (migration 008)"""
+
+    def __init__(self, db: SupabaseClient):
+        self.db = db
+
+    async def get(self, user_id: str, year: int, month: int) -> Optional[Row]:
+        """Stored insight for a month (None if never generated)"""
+        response = await self.db.table("monthly_insights")\
+            .select("fingerprint, insight, generated_at")\
+            .eq("user_id", user_id)\
+            .eq("year", year)\
+            .eq("month", month)\
+            .maybe_single()\
+            .execute()
+        return response.data if response else None
+
+    async def upsert(self, user_id: str, year: int, month: int, fingerprint: str, insight: str) -> None:
+        """Store (or replace) the insight for a month"""
+        await self.db.table("monthly_insights").upsert({
+            "user_id": user_id,
+            "year": year,
+            "month": month,
+            "fingerprint": fingerprint,
+            "insight": insight,
+            "generated_at": datetime.now(timezone.utc).isoformat()
+        }, on_conflict="user_id,year,month").execute()
+
+
+class ChatMessageRepository:
+    """Typed access to the chat_messages table"""
+
+    def __init__(self, db: SupabaseClient):
+        self.db = db
+
+    async def insert(
+        self,
+        user_id: str,
+        role: str,
+        content: str,
+        avatar_state: Optional[str] = None
+    ) -> Optional[Row]:
+        """Store one chat message ('user' or 'assistant')"""
+        data: Row = {"user_id": user_id, "role": role, "content": content}
+        if avatar_state is not None:
+            data["avatar_state"] = avatar_state
+        response = await self.db.table("chat_messages").insert(data).execute()
+        return response.data[0] if response.data else None
+
+    async def insert_many(self, user_id: str, messages: List[Row]) -> None:
+        """
+        Store several messages in one request
+
+        Args:
+            user_id: Owner of the messages
+            messages: Rows with role, content, avatar_state and created_at
+                      (explicit timestamps keep their order, as one INSERT
+                      would otherwise give them all the same now())
+        """
+        rows = [{"user_id": user_id, **message} for message in messages]
+        await self.db.table("chat_messages").insert(rows, returning=ReturnMethod.minimal).execute()
+
+    async def recent(self, user_id: str, limit: int = 10) -> List[Row]:
+        """
+        Last `limit` messages in chronological order (oldest first)
+
+        Fetches most recent first, then reverses so the AI reads the
+        conversation in order.
+        """
+        response = await self.db.table("chat_messages")\
+            .select("role, content, created_at")\
+            .eq("user_id", user_id)\
+            .order("created_at", desc=True)\
+            .limit(limit)\
+            .execute()
+        return response.data[::-1] if response.data else []
+
+    async def latest_created_at(self, user_id: str) -> Optional[str]:
+        """created_at of the user's newest message (None if there are none)"""
+        response = await self.db.table("chat_messages")\
+            .select("created_at")\
+            .eq("user_id", user_id)\
+            .order("created_at", desc=True)\
+            .limit(1)\
+            .execute()
+        return response.data[0]["created_at"] if response.data else None
+
+
+class ChatSummaryRepository:
+    """Typed access to the chat_summaries table (migration 009)"""
+
+    def __init__(self, db: SupabaseClient):
+        self.db = db
+
+    async def get(self, user_id: str) -> Optional[Row]:
+        """Rolling summary and the created_at it covers (None if none yet)"""
+        response = await self.db.table("chat_summaries")\
+            .select("summary, summarized_until")\
+            .eq("user_id", user_id)\
+            .maybe_single()\
+            .execute()
+        return response.data if response else None
+
+    async def upsert(self, user_id: str, summary: str, summarized_until: str) -> None:
+        """Store (or replace) the user's rolling summary"""
+        await self.db.table("chat_summaries").upsert({
+            "user_id": user_id,
+            "summary": summary,
+            "summarized_until": summarized_until,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }, on_conflict="user_id").execute()
+
+
+class ProfileRepository:
+    """Typed access to the profiles table"""
+
+    def __init__(self, db: SupabaseClient):
+        self.db = db
+
+    async def get(self, user_id: str, columns: str = "*") -> Optional[Row]:
+        """Fetch a user's profile (None if missing)"""
+        response = await self.db.table("profiles")\
+            .select(columns)\
+            .eq("id", user_id)\
+            .maybe_single()\
+            .execute()
+        return response.data if response else None
+
+    async def update_avatar_state(self, user_id: str, avatar_state: str) -> None:
+        """Persist the latest avatar state for fast dashboard loading"""
+        await self.db.table("profiles")\
+            .update({"avatar_state": avatar_state})\
+            .eq("id", user_id)\
+            .execute()
+
+
+class AchievementRepository:
+    """Typed access to the user_achievements table"""
+
+    def __init__(self, db: SupabaseClient):
+        self.db = db
+
+    async def list_codes(self, user_id: str) -> Set[str]:
+        """Badge codes the user already holds"""
+        response = await self.db.table("user_achievements")\
+            .select("badge_code")\
+            .eq("user_id", user_id)\
+            .execute()
+        return {row['badge_code'] for row in (response.data or [])}
+
+    async def insert(self, user_id: str, badge_code: str, earned_at: str) -> Optional[Row]:
+        """Award one badge"""
+        response = await self.db.table("user_achievements").insert({
+            "user_id": user_id,
+            "badge_code": badge_code,
+            "earned_at": earned_at
+        }).execute()
+        return response.data[0] if response.data else None
+
+    async def insert_many(
+        self,
+        user_id: str,
+        badge_codes: List[str],
+        earned_at: str,
+        earned_at_by_code: Optional[Dict[str, str]] = None
+    ) -> List[str]:
+        """
+        Award several badges in one request
+
+        Relies on UNIQUE(user_id, badge_code): codes the user already holds are
+        skipped by the database (ON CONFLICT DO NOTHING), and only rows that were
+        actually inserted come back.
+
+        Args:
+            user_id: User UUID
+            badge_codes: Codes to award
+            earned_at: Award timestamp
+            earned_at_by_code: Optional per-code timestamps (backfills)
+
+        Returns:
+            Badge codes that were newly awarded
+        """
+        if not badge_codes:
+            return []
+        earned_at_by_code = earned_at_by_code or {}
+        response = await self.db.table("user_achievements").upsert(
+            [
+                {"user_id": user_id, "badge_code": code, "earned_at": earned_at_by_code.get(code, earned_at)}
+                for code in badge_codes
+            ],
+            on_conflict="user_id,badge_code",
+            ignore_duplicates=True
+        ).execute()
+        return [row["badge_code"] for row in (response.data or [])]
+
+
+class Repositories:
+    """All repositories bound to one request's Supabase client"""
+
+    def __init__(self, db: SupabaseClient):
+        self.db = db
+        self.mood_logs = MoodLogRepository(db)
+        self.daily_summaries = DailySummaryRepository(db)
+        self.monthly_insights = MonthlyInsightRepository(db)
+        self.chat_messages = ChatMessageRepository(db)
+        self.chat_summaries = ChatSummaryRepository(db)
+        self.profiles = ProfileRepository(db)
+        self.achievements = AchievementRepository(db)
+
+
+def get_repositories(
+    supabase: SupabaseClient = Depends(get_supabase_with_auth)
+) -> Repositories:
+    """Dependency injection for FastAPI"""
+    return Repositories(supabase)
@@ -0,0 +1,89 @@
+"""
+Single-flight - coalesce concurrent identical async calls
+
+When the app double-fires a request (retry storms, double taps), both
+handlers would start the same Gemini call. With SingleFlight, the second
+caller waits on the first caller's in-flight task and gets the same result
+(or exception); only one call is made.
+
+Only calls that overlap in time are shared: the key is forgotten as soon as
+the call finishes, so nothing is cached. The shared task is cancelled only
+when every caller waiting on it has gone away (e.g. all clients disconnected).
+"""
+import asyncio
+import copy
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+def flight_key(operation: str, *parts: Any) -> str:
+    """Key for one operation on one input (parts are JSON-encoded and hashed)"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{operation}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Per-key deduplication of in-flight coroutines
+
+    Usage:
+        flights = SingleFlight()
+        result = await flights.do(flight_key("analyze_mood", user_id, text), lambda: analyze(text))
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn() unless a call with the same key is already in flight
+
+        Args:
+            key: Identity of the call (see flight_key)
+            fn: Starts the call; only invoked by the first caller
+
+        Returns:
+            The call's result (callers that joined get their own deep copy)
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _task: self._forget(key, flight))
+            self.calls += 1
+        else:
+            self.shared += 1
+
+        flight.waiters += 1
+        try:
+            # shield: one caller being cancelled must not cancel the others' call
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+        return result if leader else copy.deepcopy(result)
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        """Snapshot of coalescing counters for diagnostics"""
+        return {
+            "in_flight": len(self._flights),
+            "calls": self.calls,
+            "shared": self.shared,
+        }
@@ -0,0 +1,71 @@
+"""
+Streak rules shared by the backend and the database
+
+Mirrors the update_user_streak() trigger from migration 006, so streaks can be
+rebuilt in Python when a user's log history is replayed (badge backfill, see
+badge_rules) and by the in-memory database used in tests.
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional, Union
+
+
+def to_log_date(created_at: Union[str, datetime, date, None]) -> date:
+    """UTC calendar date of a log (same as created_at::DATE in the trigger)"""
+    if created_at is None:
+        return datetime.utcnow().date()
+    if isinstance(created_at, datetime):
+        return created_at.date()
+    if isinstance(created_at, date):
+        return created_at
+    return datetime.fromisoformat(created_at.replace('Z', '+00:00')).date()
+
+
+def _parse_date(value: Union[str, date, None]) -> Optional[date]:
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(value[:10])
+
+
+def apply_log_to_streak(profile: dict, log_date: date) -> dict:
+    """
+    Return a copy of `profile` with streak fields updated for a new log
+
+    Rules (same as the trigger):
+    - First log ever: streak = 1
+    - Same day as last log: unchanged
+    - Exactly the next day: streak + 1
+    - After a gap: streak resets to 1
+    - Backfilled (older) log: unchanged
+
+    Args:
+        profile: Profile row with current_streak, longest_streak, last_log_date
+        log_date: UTC date of the new log
+
+    Returns:
+        dict: Updated profile (input is not modified)
+    """
+    updated = dict(profile)
+    last_date = _parse_date(profile.get('last_log_date'))
+    current = profile.get('current_streak') or 0
+    longest = profile.get('longest_streak') or 0
+
+    if last_date is None:
+        current = 1
+        longest = max(longest, 1)
+        last_date = log_date
+    elif log_date == last_date:
+        return updated
+    elif log_date == last_date + timedelta(days=1):
+        current += 1
+        longest = max(longest, current)
+        last_date = log_date
+    elif log_date > last_date:
+        current = 1
+        last_date = log_date
+    else:
+        return updated
+
+    updated['current_streak'] = current
+    updated['longest_streak'] = longest
+    updated['last_log_date'] = last_date.isoformat()
+    return updated
@@ -0,0 +1,353 @@
+"""
+Usage Ledger - token counts, latency and cost of every Gemini call
+
+LLMExecutor records one entry per generation (streams included): agent,
+model, user, prompt/output tokens from Gemini's usage_metadata, latency and
+outcome. Entries are buffered in memory and written to a local SQLite file in
+batches (every USAGE_LEDGER_FLUSH_SIZE entries or USAGE_LEDGER_FLUSH_INTERVAL
+seconds) by the run_flusher task, in a worker thread, so recording never
+waits on disk and the event loop never runs a SQLite transaction.
+
+The user comes from a context variable set by get_current_user, so agents
+do not need to pass it around; usage_user() overrides it for a block.
+
+Queries (also available from the command line):
+    python -m app.services.usage_ledger --hours 1
+    -> calls, p50/p95 latency, tokens and estimated cost per agent, top users
+"""
+import os
+import argparse
+import asyncio
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# SQLite file shared by all workers on the host
+USAGE_LEDGER_PATH: str = os.environ.get(
+    "USAGE_LEDGER_PATH", os.path.join(tempfile.gettempdir(), "auramind_usage.sqlite3")
+)
+
+# Write buffered entries once this many are waiting...
+USAGE_LEDGER_FLUSH_SIZE: int = int(os.environ.get("USAGE_LEDGER_FLUSH_SIZE", "200"))
+
+# ...or at least every N seconds
+USAGE_LEDGER_FLUSH_INTERVAL: float = float(os.environ.get("USAGE_LEDGER_FLUSH_INTERVAL", "5"))
+
+# Entries kept in memory while the store is unavailable (oldest dropped beyond this)
+USAGE_LEDGER_MAX_BUFFER: int = int(os.environ.get("USAGE_LEDGER_MAX_BUFFER", "10000"))
+
+# Days of history kept in the store
+USAGE_LEDGER_RETENTION_DAYS: float = float(os.environ.get("USAGE_LEDGER_RETENTION_DAYS", "30"))
+
+# USD per million tokens (input, output); unknown models are reported without cost
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+}
+
+# User the current request is served for (set by get_current_user)
+_usage_user: ContextVar[Optional[str]] = ContextVar("usage_user", default=None)
+
+Entry = Tuple[float, str, str, Optional[str], int, int, float, str]
+
+
+def set_usage_user(user_id: Optional[str]):
+    """Attribute LLM calls made from the current context to `user_id`"""
+    _usage_user.set(user_id)
+
+
+@contextmanager
+def usage_user(user_id: Optional[str]) -> Iterator[None]:
+    """Attribute LLM calls inside the block to `user_id` (None: no user)"""
+    token = _usage_user.set(user_id)
+    try:
+        yield
+    finally:
+        _usage_user.reset(token)
+
+
+def model_name(model: Any) -> str:
+    """'models/gemini-1.5-flash' -> 'gemini-1.5-flash' (class name for test doubles)"""
+    name = getattr(model, "model_name", None) or type(model).__name__
+    return str(name).split("/")[-1]
+
+
+def token_counts(usage: Any) -> Tuple[int, int]:
+    """(prompt, output) tokens from a response's usage_metadata (0 when absent)"""
+    prompt = getattr(usage, "prompt_token_count", None)
+    output = getattr(usage, "candidates_token_count", None)
+    return (
+        prompt if isinstance(prompt, int) else 0,
+        output if isinstance(output, int) else 0,
+    )
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _cost(model: str, prompt_tokens: int, output_tokens: int) -> Optional[float]:
+    price = MODEL_PRICES.get(model)
+    if price is None:
+        return None
+    return (prompt_tokens * price[0] + output_tokens * price[1]) / 1_000_000
+
+
+class UsageLedger:
+    """
+    Buffered recorder of LLM usage backed by SQLite
+
+    Usage:
+        ledger.record("chat", "gemini-1.5-flash", usage_metadata, latency_ms=850.0)
+        asyncio.create_task(ledger.run_flusher())    # writes in the background
+        ledger.summary(since=time.time() - 3600)     # flushes first
+    """
+
+    def __init__(
+        self,
+        path: str = USAGE_LEDGER_PATH,
+        flush_size: int = USAGE_LEDGER_FLUSH_SIZE,
+        flush_interval: float = USAGE_LEDGER_FLUSH_INTERVAL,
+        max_buffer: int = USAGE_LEDGER_MAX_BUFFER,
+        retention_days: float = USAGE_LEDGER_RETENTION_DAYS
+    ):
+        """
+        Initialize ledger (the SQLite file is opened lazily)
+
+        Args:
+            path: SQLite file
+            flush_size: Buffered entries that wake the flusher early
+            flush_interval: Seconds between background flushes
+            max_buffer: Entries kept while writes fail
+            retention_days: Days of history kept
+        """
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.retention = retention_days * 86400
+        self._buffer: List[Entry] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ready = False
+        # Set by record() to wake run_flusher (bound to the flusher's loop)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.recorded = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_usage ("
+                    " ts REAL NOT NULL, agent TEXT NOT NULL, model TEXT NOT NULL, user_id TEXT,"
+                    " prompt_tokens INTEGER NOT NULL, output_tokens INTEGER NOT NULL,"
+                    " latency_ms REAL NOT NULL, outcome TEXT NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS llm_usage_ts ON llm_usage (ts)")
+                self._ready = True
+            self._local.conn = conn
+        return conn
+
+    def record(
+        self,
+        agent: str,
+        model: str,
+        usage: Any = None,
+        latency_ms: float = 0.0,
+        outcome: str = "ok",
+        user_id: Optional[str] = None
+    ):
+        """
+        Buffer one call (written on the next flush; never touches disk)
+
+        Args:
+            agent: Agent name (executor label)
+            model: Model name
+            usage: Response usage_metadata (None if not reported)
+            latency_ms: Call duration
+            outcome: ok, timeout, error or cancelled
+            user_id: User served (defaults to the current request's user)
+        """
+        prompt_tokens, output_tokens = token_counts(usage)
+        entry = (
+            time.time(), agent, model, user_id if user_id is not None else _usage_user.get(),
+            prompt_tokens, output_tokens, round(latency_ms, 2), outcome
+        )
+        with self._lock:
+            self._buffer.append(entry)
+            self.recorded += 1
+            overflow = len(self._buffer) - self.max_buffer
+            if overflow > 0:
+                del self._buffer[:overflow]
+                self.dropped += overflow
+            full = len(self._buffer) >= self.flush_size
+        if full and self._wakeup is not None:
+            # Thread-safe, and works from the loop itself
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def flush(self) -> int:
+        """Write buffered entries in one transaction; returns the number written"""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany("INSERT INTO llm_usage VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Usage Ledger Write Error: {e}")
+            # Keep the entries for the next attempt (bounded by max_buffer)
+            with self._lock:
+                self._buffer = (batch + self._buffer)[-self.max_buffer:]
+            return 0
+        self.flushed += len(batch)
+        return len(batch)
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Delete entries older than the retention period"""
+        now = time.time() if now is None else now
+        return self._conn().execute("DELETE FROM llm_usage WHERE ts < ?", (now - self.retention,)).rowcount
+
+    async def run_flusher(self):
+        """
+        Background task: flush every flush_interval seconds, or as soon as
+        flush_size entries are buffered; prune hourly. Writes run in a thread.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        last_prune = 0.0
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                try:
+                    await asyncio.to_thread(self.flush)
+                    if time.time() - last_prune > 3600:
+                        await asyncio.to_thread(self.prune)
+                        last_prune = time.time()
+                except Exception as e:
+                    print(f"Usage Ledger Flush Error: {e}")
+        finally:
+            self._wakeup = None
+
+    def summary(self, since: float, until: Optional[float] = None) -> List[dict]:
+        """
+        Per-agent usage between `since` and `until` (epoch seconds)
+
+        Returns:
+            One dict per agent and model: calls, errors, p50/p95 latency (ms),
+            prompt/output tokens and estimated cost (USD, None for unknown models),
+            highest token total first
+        """
+        self.flush()
+        until = time.time() if until is None else until
+        rows = self._conn().execute(
+            "SELECT agent, model, prompt_tokens, output_tokens, latency_ms, outcome"
+            " FROM llm_usage WHERE ts >= ? AND ts <= ?", (since, until)
+        ).fetchall()
+
+        groups: Dict[Tuple[str, str], dict] = {}
+        for agent, model, prompt_tokens, output_tokens, latency_ms, outcome in rows:
+            group = groups.setdefault((agent, model), {
+                "agent": agent, "model": model, "calls": 0, "errors": 0,
+                "prompt_tokens": 0, "output_tokens": 0, "latencies": [],
+            })
+            group["calls"] += 1
+            group["errors"] += outcome != "ok"
+            group["prompt_tokens"] += prompt_tokens
+            group["output_tokens"] += output_tokens
+            group["latencies"].append(latency_ms)
+
+        result = []
+        for group in groups.values():
+            latencies = sorted(group.pop("latencies"))
+            group["p50_latency_ms"] = _percentile(latencies, 0.50)
+            group["p95_latency_ms"] = _percentile(latencies, 0.95)
+            group["total_tokens"] = group["prompt_tokens"] + group["output_tokens"]
+            group["cost_usd"] = _cost(group["model"], group["prompt_tokens"], group["output_tokens"])
+            result.append(group)
+        result.sort(key=lambda group: group["total_tokens"], reverse=True)
+        return result
+
+    def top_users(self, since: float, limit: int = 10) -> List[dict]:
+        """Users with the most tokens since `since` (calls without a user excluded)"""
+        self.flush()
+        rows = self._conn().execute(
+            "SELECT user_id, COUNT(*), SUM(prompt_tokens), SUM(output_tokens)"
+            " FROM llm_usage WHERE ts >= ? AND user_id IS NOT NULL"
+            " GROUP BY user_id ORDER BY SUM(prompt_tokens) + SUM(output_tokens) DESC LIMIT ?",
+            (since, limit)
+        ).fetchall()
+        return [
+            {
+                "user_id": user_id,
+                "calls": calls,
+                "prompt_tokens": prompt_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": prompt_tokens + output_tokens,
+            }
+            for user_id, calls, prompt_tokens, output_tokens in rows
+        ]
+
+    def stats(self) -> dict:
+        """Snapshot of ledger counters for diagnostics"""
+        return {
+            "buffered": len(self._buffer),
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+# Singleton instance
+usage_ledger = UsageLedger()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM usage per agent and top users")
+    parser.add_argument("--hours", type=float, default=1.0, help="Look-back window (default 1)")
+    parser.add_argument("--top", type=int, default=10, help="Number of users to list")
+    args = parser.parse_args()
+
+    since = time.time() - args.hours * 3600
+    print(f"{'agent':<14}{'model':<20}{'calls':>7}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'in tok':>10}{'out tok':>10}{'cost $':>10}")
+    for row in usage_ledger.summary(since):
+        cost = f"{row['cost_usd']:.4f}" if row["cost_usd"] is not None else "-"
+        print(f"{row['agent']:<14}{row['model']:<20}{row['calls']:>7}{row['errors']:>5}"
+              f"{row['p50_latency_ms']:>9.0f}{row['p95_latency_ms']:>9.0f}"
+              f"{row['prompt_tokens']:>10}{row['output_tokens']:>10}{cost:>10}")
+    print()
+    print(f"{'user':<40}{'calls':>7}{'tokens':>10}")
+    for row in usage_ledger.top_users(since, args.top):
+        print(f"{row['user_id']:<40}{row['calls']:>7}{row['total_tokens']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import threading
+import pytest
+from app.services.analysis_cache import analysis_cache
+from app.services.jobs import JobSpool, job_queue
+from app.services.usage_ledger import usage_ledger
+
+
+@pytest.fixture(autouse=True)
+def no_shared_analysis_cache(monkeypatch):
+    # Agents built without an explicit cache would otherwise read and write the
+    # host-wide cache file in /tmp; tests that need a cache pass their own
+    monkeypatch.setattr(analysis_cache, "max_entries", 0)
+
+
+@pytest.fixture(autouse=True)
+def private_state_files(monkeypatch, tmp_path):
+    # Jobs queued by the routers would otherwise land in the host-wide spool,
+    # where a server started later would pick them up and run them
+    path = str(tmp_path / "jobs.sqlite3")
+    monkeypatch.setattr(job_queue, "spool_path", path)
+    monkeypatch.setattr(job_queue, "_spool", JobSpool(path))
+    # Same for usage the executor records into the shared ledger
+    monkeypatch.setattr(usage_ledger, "path", str(tmp_path / "usage.sqlite3"))
+    monkeypatch.setattr(usage_ledger, "_local", threading.local())
+    monkeypatch.setattr(usage_ledger, "_ready", False)
+    monkeypatch.setattr(usage_ledger, "_buffer", [])
@@ -0,0 +1,382 @@
+"""
+In-memory Supabase (PostgREST) stand-in for hermetic tests and benchmarks
+
+The production client code runs unchanged: FakeSupabase is an httpx handler
+plugged into a SupabasePool through httpx.MockTransport, so repositories build
+and send the same PostgREST requests they send to Supabase, and the fake
+answers them from in-memory tables. No network, no sockets.
+
+Supported (what the backend uses):
+- select with column lists, eq/neq/gt/gte/lt/lte/in/is filters, or=(...) and
+  nested and(...), order (multiple columns), limit, offset
+- single objects (.single()) and maybe_single()
+- insert (one row or a list, Prefer: return=minimal), upsert with on_conflict
+  and ignore/merge duplicates, update
+- the triggers the backend relies on: update_user_streak (migration 006) and
+  add_log_to_daily_summary (migration 007) run on every mood_logs insert
+- RLS: requests carrying a user's JWT only see and write that user's rows
+  (no signature check; requests without a user JWT are unrestricted, like the
+  service role)
+
+Usage in a test module:
+    fake = FakeSupabase()
+    fake.db.seed_profile(USER_ID)
+    app.dependency_overrides[get_supabase_with_auth] = fake.dependency(USER_ID)
+"""
+import json
+import re
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import jwt
+
+from app.core import SupabaseClient, SupabasePool
+from app.services.streaks import apply_log_to_streak, to_log_date
+
+FAKE_URL = "https://fake.supabase.co"
+FAKE_ANON_KEY = "fake-anon-key"
+
+# Only used to sign the fake's user tokens, which are never verified
+_TOKEN_KEY = "fake-supabase-token-signing-key!"
+
+# Conflict targets / generated columns per table
+PRIMARY_KEYS: Dict[str, Tuple[str, ...]] = {
+    "profiles": ("id",),
+    "mood_logs": ("id",),
+    "chat_messages": ("id",),
+    "user_achievements": ("user_id", "badge_code"),
+    "daily_mood_summaries": ("user_id", "log_date"),
+    "monthly_insights": ("user_id", "year", "month"),
+    "chat_summaries": ("user_id",),
+}
+
+# Column compared with auth.uid() by each table's RLS policies
+OWNER_COLUMNS: Dict[str, str] = {"profiles": "id"}
+
+HEALTH_METRICS = ("steps", "sleep_hours", "meditation_min", "water_glasses", "exercise_min")
+
+
+class UniqueViolation(Exception):
+    """Insert conflicting with a unique constraint (PostgreSQL 23505)"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _coerce(stored: Any, raw: str) -> Any:
+    """Convert a filter value to the stored value's type for comparison"""
+    if raw.startswith('"') and raw.endswith('"'):
+        raw = raw[1:-1]
+    if isinstance(stored, bool):
+        return raw == "true"
+    if isinstance(stored, (int, float)):
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+}
+
+
+def _compare(row: dict, column: str, operator: str, raw: str) -> bool:
+    value = row.get(column)
+    if operator == "is":
+        return value is None if raw == "null" else str(value).lower() == raw
+    if value is None:
+        return False
+    if operator == "in":
+        options = [item.strip().strip('"') for item in raw.strip("()").split(",")]
+        return str(value) in options
+    if operator not in OPERATORS:
+        raise ValueError(f"Unsupported operator: {operator}")
+    other = _coerce(value, raw)
+    if isinstance(other, float) and not isinstance(value, str):
+        value = float(value)
+    elif isinstance(value, (int, float)) and isinstance(other, str):
+        value = str(value)
+    return OPERATORS[operator](value, other)
+
+
+def _split_top_level(expression: str) -> List[str]:
+    """Split on commas outside parentheses and quotes"""
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in expression:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        if char == "," and depth == 0 and not quoted:
+            parts.append(current)
+            current = ""
+        else:
+            current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _logic(expression: str) -> Callable[[dict], bool]:
+    """Predicate for an or=(...) / and(...) expression"""
+    match = re.fullmatch(r"(and|or)\((.*)\)", expression, re.S)
+    if match:
+        combine = all if match.group(1) == "and" else any
+        terms = [_logic(term) for term in _split_top_level(match.group(2))]
+        return lambda row: combine(term(row) for term in terms)
+    column, operator, raw = expression.split(".", 2)
+    return lambda row: _compare(row, column, operator, raw)
+
+
+def _project(rows: List[dict], select: Optional[str]) -> List[dict]:
+    if not select or select.strip() == "*":
+        return rows
+    columns = [column.strip() for column in select.split(",") if column.strip()]
+    return [{column: row.get(column) for column in columns} for row in rows]
+
+
+class FakeDatabase:
+    """
+    In-memory tables with the triggers the backend relies on
+
+    Rows are plain dicts; each table is a dict keyed by primary key. Methods
+    called directly (seeding, assertions) bypass RLS.
+    """
+
+    def __init__(self):
+        self.tables: Dict[str, Dict[tuple, dict]] = {name: {} for name in PRIMARY_KEYS}
+        self._lock = threading.Lock()
+
+    def _key(self, table: str, row: dict, columns: Optional[Tuple[str, ...]] = None) -> tuple:
+        return tuple(row.get(column) for column in (columns or PRIMARY_KEYS.get(table, ("id",))))
+
+    def seed_profile(self, user_id: str, **fields) -> dict:
+        """Create the profile Supabase's signup trigger would create"""
+        profile = {"id": user_id, "current_streak": 0, "longest_streak": 0, "last_log_date": None,
+                   "avatar_state": "STATE_NEUTRAL", "created_at": _now(), **fields}
+        self.tables["profiles"][(user_id,)] = profile
+        return profile
+
+    def rows(self, table: str, **equals) -> List[dict]:
+        """Rows of a table matching all column=value pairs (for assertions)"""
+        return [dict(row) for row in self.tables.get(table, {}).values()
+                if all(row.get(column) == value for column, value in equals.items())]
+
+    def select(self, table: str, predicates: List[Callable[[dict], bool]],
+               order: List[Tuple[str, bool]], limit: Optional[int], offset: int) -> List[dict]:
+        rows = [dict(row) for row in self.tables.setdefault(table, {}).values()
+                if all(predicate(row) for predicate in predicates)]
+        for column, desc in reversed(order):
+            # None sorts last ascending, first descending (PostgreSQL default)
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        rows = rows[offset:]
+        return rows[:limit] if limit is not None else rows
+
+    def insert(self, table: str, rows: List[dict], on_conflict: Optional[str] = None,
+               resolution: Optional[str] = None) -> List[dict]:
+        """
+        Insert rows (upsert when resolution is ignore-/merge-duplicates)
+
+        Raises:
+            UniqueViolation: On a conflict without a resolution
+        """
+        conflict = tuple(on_conflict.split(",")) if on_conflict else PRIMARY_KEYS.get(table, ("id",))
+        written = []
+        with self._lock:
+            store = self.tables.setdefault(table, {})
+            for incoming in rows:
+                row = self._defaults(table, incoming)
+                existing = next((r for r in store.values() if self._key(table, r, conflict) == self._key(table, row, conflict)), None)
+                if existing is not None:
+                    if resolution == "ignore-duplicates":
+                        continue
+                    if resolution != "merge-duplicates":
+                        raise UniqueViolation(f'duplicate key value violates unique constraint on "{table}"')
+                    existing.update(incoming)
+                    written.append(dict(existing))
+                    continue
+                store[self._key(table, row)] = row
+                written.append(dict(row))
+                if table == "mood_logs":
+                    self._after_mood_log(row)
+        return written
+
+    def update(self, table: str, predicates: List[Callable[[dict], bool]], values: dict) -> List[dict]:
+        with self._lock:
+            rows = [row for row in self.tables.setdefault(table, {}).values()
+                    if all(predicate(row) for predicate in predicates)]
+            for row in rows:
+                row.update(values)
+            return [dict(row) for row in rows]
+
+    def _defaults(self, table: str, incoming: dict) -> dict:
+        row = dict(incoming)
+        if PRIMARY_KEYS.get(table, ("id",)) == ("id",) and not row.get("id"):
+            row["id"] = str(uuid.uuid4())
+        if table in ("mood_logs", "chat_messages") and not row.get("created_at"):
+            row["created_at"] = _now()
+        if table == "user_achievements" and not row.get("earned_at"):
+            row["earned_at"] = _now()
+        return row
+
+    def _after_mood_log(self, log: dict):
+        """update_user_streak (migration 006) and add_log_to_daily_summary (007)"""
+        log_date = to_log_date(log.get("created_at"))
+        profile = self.tables["profiles"].get((log["user_id"],))
+        if profile is not None:
+            updated = apply_log_to_streak(profile, log_date)
+            if updated.get("last_log_date") is not None:
+                updated["last_log_date"] = str(updated["last_log_date"])[:10]
+            profile.update(updated)
+
+        key = (log["user_id"], log_date.isoformat())
+        summaries = self.tables["daily_mood_summaries"]
+        day = summaries.setdefault(key, {
+            "user_id": log["user_id"], "log_date": log_date.isoformat(), "log_count": 0,
+            "mood_score_sum": 0, "mood_score_count": 0, "avatar_state_counts": {},
+            "activity_counts": {}, "health_sums": {}, "health_counts": {},
+        })
+        day["log_count"] += 1
+        if log.get("mood_score") is not None:
+            day["mood_score_sum"] += log["mood_score"]
+            day["mood_score_count"] += 1
+        if log.get("avatar_state"):
+            counts = day["avatar_state_counts"]
+            counts[log["avatar_state"]] = counts.get(log["avatar_state"], 0) + 1
+        for activity in log.get("activities") or []:
+            day["activity_counts"][activity] = day["activity_counts"].get(activity, 0) + 1
+        health = log.get("health_metrics") if isinstance(log.get("health_metrics"), dict) else {}
+        for metric in HEALTH_METRICS:
+            value = health.get(metric)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                day["health_sums"][metric] = day["health_sums"].get(metric, 0) + value
+                day["health_counts"][metric] = day["health_counts"].get(metric, 0) + 1
+        day["updated_at"] = _now()
+
+
+def _error(status: int, code: str, message: str) -> httpx.Response:
+    return httpx.Response(status, json={"message": message, "code": code, "details": None, "hint": None})
+
+
+class FakeSupabase:
+    """
+    PostgREST request handling over a FakeDatabase
+
+    `handle` is an httpx handler; `pool` is a SupabasePool whose transport
+    calls it, so clients bound from it behave like production ones (JWT
+    headers, pool metrics). Every handled request is kept in `requests`.
+    """
+
+    RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns", "or", "and"}
+
+    def __init__(self, db: Optional[FakeDatabase] = None):
+        self.db = db or FakeDatabase()
+        self.requests: List[httpx.Request] = []
+        self.pool = SupabasePool(FAKE_URL, FAKE_ANON_KEY, transport=httpx.MockTransport(self.handle))
+
+    @staticmethod
+    def token(user_id: str) -> str:
+        """Unverified JWT whose sub is user_id (what auth.uid() returns)"""
+        return jwt.encode({"sub": user_id, "role": "authenticated"}, _TOKEN_KEY, algorithm="HS256")
+
+    def client(self, user_id: Optional[str] = None) -> SupabaseClient:
+        """Table-API client acting as user_id (None: no user, RLS off)"""
+        return self.pool.bind(self.token(user_id) if user_id else None)
+
+    def dependency(self, user_id: str) -> Callable[[], SupabaseClient]:
+        """Override for get_supabase_with_auth acting as user_id"""
+        return lambda: self.client(user_id)
+
+    def requests_to(self, table: str, method: Optional[str] = None) -> List[httpx.Request]:
+        """Handled requests for one table (optionally one HTTP method)"""
+        return [request for request in self.requests
+                if request.url.path.rsplit("/", 1)[-1] == table and method in (None, request.method)]
+
+    @staticmethod
+    def _auth_uid(request: httpx.Request) -> Optional[str]:
+        token = request.headers.get("authorization", "").removeprefix("Bearer ")
+        try:
+            return jwt.decode(token, options={"verify_signature": False}).get("sub")
+        except jwt.PyJWTError:
+            return None
+
+    def _predicates(self, params: httpx.QueryParams) -> List[Callable[[dict], bool]]:
+        predicates = []
+        for name, value in params.multi_items():
+            if name in ("or", "and"):
+                predicates.append(_logic(f"{name}{value}"))
+            elif name not in self.RESERVED:
+                operator, _, raw = value.partition(".")
+                predicates.append(lambda row, c=name, o=operator, r=raw: _compare(row, c, o, r))
+        return predicates
+
+    @staticmethod
+    def _order(params: httpx.QueryParams) -> List[Tuple[str, bool]]:
+        order = []
+        for term in filter(None, params.get("order", "").split(",")):
+            column, *modifiers = term.split(".")
+            order.append((column, "desc" in modifiers))
+        return order
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        """Answer one PostgREST request"""
+        self.requests.append(request)
+        table = request.url.path.rsplit("/", 1)[-1]
+        prefer = request.headers.get("prefer", "")
+        params = request.url.params
+        owner = OWNER_COLUMNS.get(table, "user_id")
+        uid = self._auth_uid(request)
+
+        try:
+            predicates = self._predicates(params)
+            if uid is not None:
+                predicates.append(lambda row: row.get(owner) == uid)
+
+            if request.method == "GET":
+                rows = self.db.select(
+                    table, predicates, self._order(params),
+                    int(params["limit"]) if "limit" in params else None,
+                    int(params.get("offset", 0))
+                )
+                rows = _project(rows, params.get("select"))
+            elif request.method == "POST":
+                body = json.loads(request.read())
+                body = body if isinstance(body, list) else [body]
+                if uid is not None and any(row.get(owner) != uid for row in body):
+                    return httpx.Response(403, json={
+                        "message": f'new row violates row-level security policy for table "{table}"',
+                        "code": "42501", "details": None, "hint": None
+                    })
+                resolution = next((p.split("=", 1)[1] for p in prefer.split(",") if p.startswith("resolution=")), None)
+                rows = self.db.insert(table, body, params.get("on_conflict"), resolution)
+            elif request.method == "PATCH":
+                values = json.loads(request.read())
+                rows = self.db.update(table, predicates, values)
+            else:
+                return _error(405, "PGRST000", f"{request.method} not supported by the fake")
+        except UniqueViolation as e:
+            return _error(409, "23505", str(e))
+        except ValueError as e:
+            return _error(400, "PGRST100", str(e))
+
+        status = 201 if request.method == "POST" else 200
+        if "return=minimal" in prefer:
+            return httpx.Response(status)
+        if "application/vnd.pgrst.object+json" in request.headers.get("accept", ""):
+            if len(rows) != 1:
+                return _error(406, "PGRST116", "JSON object requested, multiple (or no) rows returned")
+            return httpx.Response(status, json=rows[0])
+        return httpx.Response(status, json=rows)
@@ -2,9 +2,11 @@
 Tests for Enhanced AI Agent System
 Tests for validation, context awareness, rate limiting, and new avatar states
 """
+import threading
 import pytest
 from app.services.ai_manager import AnalyzerAgent, EmpathyAgent, AvatarOrchestratorAgent, AIAgentManager
-from app.services.rate_limiter import RateLimiter
+from app.services.analysis_cache import AnalysisCache, analysis_key, normalize_text
+from app.services.rate_limiter import MemoryBackend, RateLimiter, SqliteBackend
 
 class TestAnalyzerAgentEnhancements:
     """Test Analyzer Agent enhancements"""
@@ -32,6 +34,83 @@ class TestAnalyzerAgentEnhancements:
         assert result['primary_emotion'] == 'neutral'
 
 
+class CountingModel:
+    """Stand-in for the analyzer's Gemini model that counts calls"""
+    model_name = "models/test-analyzer"
+
+    def __init__(self, text: str):
+        self.text = text
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.calls += 1
+        return type("Response", (), {"text": self.text})()
+
+
+class TestAnalysisCache:
+    """Test the content-addressed analyzer cache"""
+
+    def test_key_ignores_whitespace_only_differences(self):
+        assert normalize_text("  Hôm nay\n\tmình   vui ") == "Hôm nay mình vui"
+        assert analysis_key("Hôm nay mình vui", "m", "1") == analysis_key(" Hôm nay  mình\nvui", "m", "1")
+        assert analysis_key("Hôm nay mình vui", "m", "1") != analysis_key("Hôm nay mình vui", "m", "2")
+        assert analysis_key("Hôm nay mình vui", "m", "1") != analysis_key("Hôm nay mình buồn", "m", "1")
+
+    @pytest.mark.asyncio
+    async def test_duplicate_note_skips_llm(self, tmp_path):
+        cache = AnalysisCache(path=str(tmp_path / "analyses.sqlite3"))
+        analyzer = AnalyzerAgent(cache=cache)
+        analyzer.model = CountingModel('{"mood_score": 8, "activities": ["gym", ""]}')
+
+        first = await analyzer.analyze("Đi gym xong thấy khỏe")
+        second = await analyzer.analyze("  Đi gym   xong thấy khỏe\n")
+
+        assert analyzer.model.calls == 1
+        assert second == first == {"mood_score": 8, "activities": ["gym"], "primary_emotion": "neutral"}
+        assert cache.stats()["hit_rate"] == 0.5
+
+    @pytest.mark.asyncio
+    async def test_fallback_not_cached(self, tmp_path):
+        cache = AnalysisCache(path=str(tmp_path / "analyses.sqlite3"))
+        analyzer = AnalyzerAgent(cache=cache)
+        analyzer.model = CountingModel("not json")
+
+        await analyzer.analyze("abc")
+        await analyzer.analyze("abc")
+
+        assert analyzer.model.calls == 2
+        assert cache.size() == 0
+
+    def test_ttl_and_size_bound(self, tmp_path):
+        path = str(tmp_path / "analyses.sqlite3")
+        expired = AnalysisCache(path=path, ttl=-1)
+        expired.put("k", {"a": 1})
+        assert expired.get("k") is None
+
+        cache = AnalysisCache(path=path, max_entries=2)
+        for key in ("k1", "k2", "k3"):
+            cache.put(key, {"key": key})
+        cache.get("k1")  # most recently used survives
+        cache.prune()
+
+        assert cache.size() == 2
+        assert cache.get("k1") == {"key": "k1"}
+        assert cache.get("k3") == {"key": "k3"}
+        assert cache.get("k2") is None
+
+    def test_hits_save_last_use_in_batches(self, tmp_path):
+        cache = AnalysisCache(path=str(tmp_path / "analyses.sqlite3"))
+        cache.put("k", {"a": 1})
+        cache._conn().execute("UPDATE analyses SET used_at = 0")
+
+        cache.get("k")
+        # A hit does not write...
+        assert cache._conn().execute("SELECT used_at FROM analyses").fetchone()[0] == 0
+        cache.save_touched()
+        # ...until the batch is saved
+        assert cache._conn().execute("SELECT used_at FROM analyses").fetchone()[0] > 0
+
+
 class TestEmpathyAgentEnhancements:
     """Test Empathy Agent context awareness"""
     
@@ -116,56 +195,190 @@ class TestAvatarOrchestratorEnhancements:
 class TestRateLimiter:
     """Test Rate Limiter functionality"""
     
-    def test_allows_calls_within_limit(self):
+    @pytest.mark.asyncio
+    async def test_allows_calls_within_limit(self):
         """Test that calls within limit are allowed"""
         limiter = RateLimiter(max_calls=3, window_minutes=60)
         user_id = "test_user_1"
         
-        assert limiter.is_allowed(user_id) == True
-        assert limiter.is_allowed(user_id) == True
-        assert limiter.is_allowed(user_id) == True
+        assert await limiter.is_allowed(user_id) == True
+        assert await limiter.is_allowed(user_id) == True
+        assert await limiter.is_allowed(user_id) == True
     
-    def test_blocks_calls_over_limit(self):
+    @pytest.mark.asyncio
+    async def test_blocks_calls_over_limit(self):
         """Test that calls over limit are blocked"""
         limiter = RateLimiter(max_calls=2, window_minutes=60)
         user_id = "test_user_2"
         
-        assert limiter.is_allowed(user_id) == True
-        assert limiter.is_allowed(user_id) == True
-        assert limiter.is_allowed(user_id) == False  # Over limit
+        assert await limiter.is_allowed(user_id) == True
+        assert await limiter.is_allowed(user_id) == True
+        assert await limiter.is_allowed(user_id) == False  # Over limit
     
-    def test_get_remaining_calls(self):
+    @pytest.mark.asyncio
+    async def test_get_remaining_calls(self):
         """Test getting remaining calls"""
         limiter = RateLimiter(max_calls=5, window_minutes=60)
         user_id = "test_user_3"
         
-        limiter.is_allowed(user_id)
-        limiter.is_allowed(user_id)
+        await limiter.is_allowed(user_id)
+        await limiter.is_allowed(user_id)
         
-        remaining = limiter.get_remaining_calls(user_id)
+        remaining = await limiter.get_remaining_calls(user_id)
         assert remaining == 3
     
-    def test_reset_user(self):
+    @pytest.mark.asyncio
+    async def test_reset_user(self):
         """Test resetting a user's limit"""
         limiter = RateLimiter(max_calls=2, window_minutes=60)
         user_id = "test_user_4"
         
-        limiter.is_allowed(user_id)
-        limiter.is_allowed(user_id)
-        assert limiter.is_allowed(user_id) == False
+        await limiter.is_allowed(user_id)
+        await limiter.is_allowed(user_id)
+        assert await limiter.is_allowed(user_id) == False
         
-        limiter.reset_user(user_id)
-        assert limiter.is_allowed(user_id) == True
+        await limiter.reset_user(user_id)
+        assert await limiter.is_allowed(user_id) == True
     
-    def test_different_users_independent(self):
+    @pytest.mark.asyncio
+    async def test_different_users_independent(self):
         """Test that different users have independent limits"""
         limiter = RateLimiter(max_calls=2, window_minutes=60)
         
-        limiter.is_allowed("user_a")
-        limiter.is_allowed("user_a")
+        await limiter.is_allowed("user_a")
+        await limiter.is_allowed("user_a")
         
         # user_a is at limit, but user_b should still be allowed
-        assert limiter.is_allowed("user_b") == True
+        assert await limiter.is_allowed("user_b") == True
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestRateLimitAlgorithms:
+    """Constant-memory algorithms and idle-key eviction"""
+
+    @pytest.mark.asyncio
+    async def test_sliding_window_weights_previous_window(self):
+        clock = FakeClock(3600 * 1000)  # start of a window
+        limiter = RateLimiter(max_calls=4, window_minutes=60, clock=clock)
+        for _ in range(4):
+            assert await limiter.is_allowed("u") == True
+        assert await limiter.is_allowed("u") == False
+
+        # Halfway into the next window, half of the previous 4 calls still count
+        clock.now += 3600 * 1.5
+        assert await limiter.get_remaining_calls("u") == 2
+        assert await limiter.is_allowed("u") == True
+        assert await limiter.is_allowed("u") == True
+        assert await limiter.is_allowed("u") == False
+
+    @pytest.mark.asyncio
+    async def test_token_bucket_refills(self):
+        clock = FakeClock()
+        limiter = RateLimiter(max_calls=2, window_minutes=60, algorithm="token_bucket", clock=clock)
+        assert await limiter.is_allowed("u") == True
+        assert await limiter.is_allowed("u") == True
+        assert await limiter.is_allowed("u") == False
+
+        clock.now += 1800  # half a window refills one token
+        assert await limiter.is_allowed("u") == True
+        assert await limiter.is_allowed("u") == False
+
+    @pytest.mark.asyncio
+    async def test_idle_users_evicted(self):
+        clock = FakeClock()
+        limiter = RateLimiter(max_calls=2, window_minutes=1, clock=clock)
+        await limiter.is_allowed("idle")
+        clock.now += 90
+        await limiter.is_allowed("active")
+
+        clock.now += 60
+        assert await limiter.cleanup_old_entries() == 1
+        assert limiter.backend.size() == 1
+
+    def test_unknown_algorithm_rejected(self):
+        with pytest.raises(ValueError):
+            RateLimiter(algorithm="leaky")
+
+
+class TestSqliteRateLimitBackend:
+    """Shared state for several uvicorn workers on one host"""
+
+    @pytest.mark.parametrize("algorithm", ["sliding_window", "token_bucket"])
+    @pytest.mark.asyncio
+    async def test_workers_share_counters(self, tmp_path, algorithm):
+        path = str(tmp_path / "ratelimit.sqlite3")
+        clock = FakeClock()
+        # Two limiters on the same file stand in for two worker processes
+        worker_a = RateLimiter(max_calls=3, algorithm=algorithm, backend=SqliteBackend(path), clock=clock)
+        worker_b = RateLimiter(max_calls=3, algorithm=algorithm, backend=SqliteBackend(path), clock=clock)
+
+        assert await worker_a.is_allowed("u") == True
+        assert await worker_b.is_allowed("u") == True
+        assert await worker_a.is_allowed("u") == True
+        assert await worker_b.is_allowed("u") == False
+        assert await worker_a.get_remaining_calls("u") == 0
+
+        await worker_b.reset_user("u")
+        assert await worker_a.is_allowed("u") == True
+
+    @pytest.mark.asyncio
+    async def test_eviction(self, tmp_path):
+        clock = FakeClock()
+        limiter = RateLimiter(max_calls=2, window_minutes=1,
+                              backend=SqliteBackend(str(tmp_path / "rl.sqlite3")), clock=clock)
+        await limiter.is_allowed("idle")
+        clock.now += 150
+        assert await limiter.cleanup_old_entries() == 1
+        assert limiter.backend.size() == 0
+
+    @pytest.mark.asyncio
+    async def test_transactions_off_event_loop(self, tmp_path):
+        backend = SqliteBackend(str(tmp_path / "rl.sqlite3"))
+        limiter = RateLimiter(max_calls=2, backend=backend)
+        threads = []
+        hit, evict = backend.hit, backend.evict
+        backend.hit = lambda *args: threads.append(threading.get_ident()) or hit(*args)
+        backend.evict = lambda *args: threads.append(threading.get_ident()) or evict(*args)
+
+        await limiter.is_allowed("u")
+        await limiter.cleanup_old_entries()
+
+        assert len(threads) == 2
+        assert threading.get_ident() not in threads
+
+
+class AsyncMemoryBackend(MemoryBackend):
+    """Stands in for RedisBackend: coroutine methods, awaited on the loop"""
+
+    async def hit(self, *args):
+        return super().hit(*args)
+
+    async def peek(self, *args):
+        return super().peek(*args)
+
+    async def reset(self, key):
+        super().reset(key)
+
+
+class TestAsyncRateLimitBackend:
+    """Backends with an asyncio client (redis) are awaited directly"""
+
+    @pytest.mark.asyncio
+    async def test_async_backend_awaited(self):
+        limiter = RateLimiter(max_calls=1, backend=AsyncMemoryBackend())
+
+        assert await limiter.is_allowed("u") == True
+        assert await limiter.is_allowed("u") == False
+        assert await limiter.get_remaining_calls("u") == 0
+        await limiter.reset_user("u")
+        assert await limiter.get_remaining_calls("u") == 1
 
 
 class TestAIAgentManagerEnhancements:
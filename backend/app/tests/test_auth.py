@@ -10,7 +10,7 @@ TEST_JWT_SECRET = "test-secret-key-for-unit-tests"
 os.environ["SUPABASE_JWT_SECRET"] = TEST_JWT_SECRET
 
 # Now import auth module (it will use the TEST_JWT_SECRET)
-from app.auth import verify_jwt_token, get_current_user
+from app.auth import verify_jwt_token, get_current_user, token_cache, VerifiedTokenCache
 
 
 def create_test_token(user_id: str, exp_delta: timedelta = timedelta(hours=1)) -> str:
@@ -143,3 +143,53 @@ async def test_get_current_user_none_credentials():
     
     assert exc_info.value.status_code == 401
     assert "missing" in exc_info.value.detail.lower()
+
+
+def test_repeat_token_served_from_cache(monkeypatch):
+    """Test that a repeat token skips jwt.decode"""
+    token_cache.clear()
+    token = create_test_token("550e8400-e29b-41d4-a716-446655440000")
+    hits_before = token_cache.hits
+    
+    first = verify_jwt_token(token)
+    
+    def fail_decode(*args, **kwargs):
+        raise AssertionError("jwt.decode should not run for a cached token")
+    monkeypatch.setattr(jwt, "decode", fail_decode)
+    
+    assert verify_jwt_token(token) == first
+    assert token_cache.hits == hits_before + 1
+
+
+def test_cache_entry_bounded_by_exp(monkeypatch):
+    """Test that a cached token is re-verified (and rejected) once exp passes"""
+    token_cache.clear()
+    token = create_test_token("550e8400-e29b-41d4-a716-446655440000", exp_delta=timedelta(seconds=30))
+    verify_jwt_token(token)
+    
+    import app.auth as auth
+    real_time = auth.time.time
+    monkeypatch.setattr(auth.time, "time", lambda: real_time() + 60)
+    assert token_cache.get(token) is None
+
+
+def test_invalid_token_not_cached():
+    """Test that failed verifications are never cached"""
+    token_cache.clear()
+    token = jwt.encode({"sub": "x"}, "wrong-secret", algorithm="HS256")
+    with pytest.raises(HTTPException):
+        verify_jwt_token(token)
+    assert token_cache.stats()["size"] == 0
+
+
+def test_cache_lru_size_limit():
+    """Test that the least recently used entry is evicted first"""
+    cache = VerifiedTokenCache(max_size=2, ttl=60)
+    cache.put("a", {"sub": "a"})
+    cache.put("b", {"sub": "b"})
+    cache.get("a")
+    cache.put("c", {"sub": "c"})
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == {"sub": "a"}
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,118 @@
+"""
+Tests for batched badge awarding
+"""
+import pytest
+from app.services.badges import BadgeCodeCache, BadgeService
+from app.services.badge_rules import badge_plan, compile_rules
+
+
+class FakeAchievements:
+    def __init__(self, held=()):
+        self.held = set(held)
+        self.calls = []
+
+    async def insert_many(self, user_id, badge_codes, earned_at, earned_at_by_code=None):
+        self.calls.append(list(badge_codes))
+        self.earned_at_by_code = earned_at_by_code
+        new = [code for code in badge_codes if code not in self.held]
+        self.held.update(new)
+        return new
+
+
+def make_service(held=()) -> BadgeService:
+    service = BadgeService(supabase_client=None, code_cache=BadgeCodeCache())
+    service.achievements = FakeAchievements(held)
+    return service
+
+
+LOG = {"created_at": "2026-01-26T12:00:00Z", "mood_score": 8, "health_metrics": {"steps": 6000}}
+
+
+class TestBadgeService:
+    """One upsert per evaluation, none once badges are cached"""
+
+    @pytest.mark.asyncio
+    async def test_awards_in_single_round_trip(self):
+        service = make_service(held={"FIRST_STEP"})
+        earned = await service.check_new_badges("u1", LOG, {"current_streak": 3})
+
+        assert service.achievements.calls == [["FIRST_STEP", "STREAK_3", "ACTIVE_SOUL"]]
+        assert [badge["code"] for badge in earned] == ["STREAK_3", "ACTIVE_SOUL"]
+
+    @pytest.mark.asyncio
+    async def test_cached_codes_skip_database(self):
+        service = make_service()
+        await service.check_new_badges("u1", LOG, {"current_streak": 3})
+        earned = await service.check_new_badges("u1", LOG, {"current_streak": 3})
+
+        assert earned == []
+        assert len(service.achievements.calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_award_not_cached(self):
+        service = make_service()
+
+        async def fail(*args):
+            raise RuntimeError("db down")
+        service.achievements.insert_many = fail
+
+        assert await service.check_new_badges("u1", LOG, {}) == []
+        assert service.code_cache.get("u1") == set()
+
+    def test_cache_is_lru_bounded(self):
+        cache = BadgeCodeCache(max_users=2)
+        cache.add("a", ["FIRST_STEP"])
+        cache.add("b", ["FIRST_STEP"])
+        cache.get("a")
+        cache.add("c", ["FIRST_STEP"])
+        assert cache.get("b") == set()
+        assert cache.get("a") == {"FIRST_STEP"}
+
+
+class TestBadgeRules:
+    """Declarative rules compiled into a plan"""
+
+    def test_held_badges_are_skipped(self):
+        log = {"created_at": "2026-01-26T06:30:00Z", "mood_score": 8,
+               "health_metrics": {"sleep_hours": 8}}
+        assert badge_plan.evaluate(log, {"current_streak": 1}) == ["FIRST_STEP", "EARLY_BIRD", "BALANCE_MASTER"]
+        assert badge_plan.evaluate(log, {"current_streak": 1}, held={"FIRST_STEP", "EARLY_BIRD"}) == ["BALANCE_MASTER"]
+
+    def test_any_rule(self):
+        late = {"created_at": "2026-01-26T23:30:00Z"}
+        early = {"created_at": "2026-01-27T02:00:00Z"}
+        assert "NIGHT_OWL" in badge_plan.evaluate(late, {})
+        assert "NIGHT_OWL" in badge_plan.evaluate(early, {})
+
+    def test_missing_health_values_do_not_crash(self):
+        log = {"created_at": "2026-01-26T12:00:00Z", "mood_score": 9,
+               "health_metrics": {"sleep_hours": None, "steps": None}}
+        assert badge_plan.evaluate(log, {}) == ["FIRST_STEP"]
+
+    def test_invalid_rules_rejected(self):
+        with pytest.raises(ValueError):
+            compile_rules([{"code": "X", "all": [("heart_rate", ">=", 1)]}])
+        with pytest.raises(ValueError):
+            compile_rules([{"code": "X", "all": [("mood", "~", 1)]}])
+        with pytest.raises(ValueError):
+            compile_rules([{"code": "X", "all": []}, {"code": "X", "all": []}])
+
+    def test_history_replay_rebuilds_streaks(self):
+        logs = [{"created_at": f"2026-01-{day:02d}T12:00:00Z"} for day in (1, 2, 3, 4)]
+        earned = badge_plan.evaluate_history(logs)
+
+        assert [(code, log["created_at"][:10]) for code, log in earned] == [
+            ("FIRST_STEP", "2026-01-01"),
+            ("STREAK_3", "2026-01-03"),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_backfill_is_one_upsert(self):
+        service = make_service()
+        logs = [{"created_at": f"2026-01-{day:02d}T12:00:00Z"} for day in (1, 2, 3)]
+
+        awarded = await service.backfill_badges("u1", logs)
+
+        assert awarded == ["FIRST_STEP", "STREAK_3"]
+        assert len(service.achievements.calls) == 1
+        assert service.achievements.earned_at_by_code["STREAK_3"] == "2026-01-03T12:00:00Z"
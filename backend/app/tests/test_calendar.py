@@ -0,0 +1,137 @@
+"""
+Tests for the persistent monthly insight cache and holistic insights
+"""
+import asyncio
+import re
+import pytest
+from fastapi import BackgroundTasks
+from app.services.ai_manager import InsightAgent
+from app.services.calendar import get_cached_insight, insight_fingerprint
+
+INSIGHT_DATA = [{"date": "2026-01-26", "avg_mood": 6.7, "activities": ["gym"], "health": None}]
+
+
+class FakeInsightRepository:
+    def __init__(self, row=None):
+        self.row = row
+        self.writes = []
+
+    async def get(self, user_id, year, month):
+        return self.row
+
+    async def upsert(self, user_id, year, month, fingerprint, insight):
+        self.writes.append((fingerprint, insight))
+
+
+class FakeRepos:
+    def __init__(self, row=None):
+        self.monthly_insights = FakeInsightRepository(row)
+
+
+class CountingGenerator:
+    def __init__(self, result="Ngủ đủ giấc giúp mood của bạn tốt hơn."):
+        self.result = result
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return self.result
+
+
+class TestInsightCache:
+    """Fresh hits skip Gemini; stale entries are served then revalidated"""
+
+    @pytest.mark.asyncio
+    async def test_fresh_hit_skips_generation(self):
+        repos = FakeRepos({"fingerprint": insight_fingerprint(INSIGHT_DATA), "insight": "cached"})
+        generate = CountingGenerator()
+
+        insight = await get_cached_insight(repos, "u", 2026, 1, INSIGHT_DATA, generate, BackgroundTasks())
+
+        assert insight == "cached"
+        assert generate.calls == 0
+
+    @pytest.mark.asyncio
+    async def test_stale_entry_served_then_revalidated(self):
+        repos = FakeRepos({"fingerprint": "old", "insight": "stale"})
+        generate = CountingGenerator("fresh")
+        background = BackgroundTasks()
+
+        insight = await get_cached_insight(repos, "u", 2026, 1, INSIGHT_DATA, generate, background)
+
+        assert insight == "stale"
+        assert generate.calls == 0
+        await background()
+        assert generate.calls == 1
+        assert repos.monthly_insights.writes == [(insight_fingerprint(INSIGHT_DATA), "fresh")]
+
+    @pytest.mark.asyncio
+    async def test_miss_generates_and_stores(self):
+        repos = FakeRepos()
+        generate = CountingGenerator("new")
+
+        insight = await get_cached_insight(repos, "u", 2026, 1, INSIGHT_DATA, generate, BackgroundTasks())
+
+        assert insight == "new"
+        assert len(repos.monthly_insights.writes) == 1
+
+    @pytest.mark.asyncio
+    async def test_fallback_and_rate_limited_not_stored(self):
+        for result in (InsightAgent.HOLISTIC_FALLBACK, None):
+            repos = FakeRepos()
+            insight = await get_cached_insight(
+                repos, "u", 2026, 1, INSIGHT_DATA, CountingGenerator(result), BackgroundTasks()
+            )
+            assert insight == result
+            assert repos.monthly_insights.writes == []
+
+    def test_fingerprint_changes_with_data(self):
+        changed = [dict(INSIGHT_DATA[0], avg_mood=7.0)]
+        assert insight_fingerprint(INSIGHT_DATA) != insight_fingerprint(changed)
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeInsightExecutor:
+    """Echoes each prompt's mood back"""
+
+    def __init__(self, fail_moods=()):
+        self.prompts = []
+        self.fail_moods = set(fail_moods)
+
+    async def generate(self, model, prompt, agent=None, generation_config=None):
+        self.prompts.append(prompt)
+        mood = re.search(r"Mood=(\d+)", prompt).group(1)
+        if int(mood) in self.fail_moods:
+            raise RuntimeError("boom")
+        return FakeResponse(f"insight {mood}")
+
+
+def month(mood):
+    return [{"date": "2026-01-26", "avg_mood": mood, "activities": [], "health": None}]
+
+
+class TestHolisticInsight:
+    """One prompt per user's month"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_keep_separate_prompts(self):
+        executor = FakeInsightExecutor()
+        agent = InsightAgent(executor=executor)
+
+        results = await asyncio.gather(*(agent.analyze_monthly_correlation(month(m)) for m in (5, 6, 7)))
+
+        assert results == ["insight 5", "insight 6", "insight 7"]
+        # No prompt carries another user's data
+        assert [prompt.count("Mood=") for prompt in executor.prompts] == [1, 1, 1]
+
+    @pytest.mark.asyncio
+    async def test_failure_only_affects_its_caller(self):
+        agent = InsightAgent(executor=FakeInsightExecutor(fail_moods={6}))
+
+        results = await asyncio.gather(*(agent.analyze_monthly_correlation(month(m)) for m in (5, 6)))
+
+        assert results == ["insight 5", InsightAgent.HOLISTIC_FALLBACK]
@@ -20,24 +20,253 @@ app.dependency_overrides[get_ai_manager] = get_mock_ai_manager
 
 from app.auth import get_current_user
 from app.core import get_supabase_with_auth
+from app.tests.fake_supabase import FakeSupabase
 
 MOCK_USER_ID = "550e8400-e29b-41d4-a716-446655440001"
 
 async def override_get_current_user():
     return MOCK_USER_ID
 
-mock_supabase = MagicMock()
-mock_table = MagicMock()
-mock_supabase.table.return_value = mock_table
+# In-memory Supabase, recreated for every test
+fake = FakeSupabase()
 
-def override_get_supabase():
-    return mock_supabase
-
-app.dependency_overrides[get_current_user] = override_get_current_user
-app.dependency_overrides[get_supabase_with_auth] = override_get_supabase
+def setup_function():
+    # Other test modules share `app`; re-apply this module's overrides
+    global fake
+    fake = FakeSupabase()
+    fake.db.seed_profile(MOCK_USER_ID)
+    app.dependency_overrides[get_ai_manager] = get_mock_ai_manager
+    app.dependency_overrides[get_current_user] = override_get_current_user
+    app.dependency_overrides[get_supabase_with_auth] = fake.dependency(MOCK_USER_ID)
 
 def test_chat_endpoint():
     payload = {"message": "I am feeling sad today."}
     response = client.post("/chat/", json=payload)
     assert response.status_code == 200
     assert response.json()["reply"] == "I understand completely."
+
+
+async def _fake_chat_stream(message, history, summary=None):
+    yield ("avatar_state", "STATE_SAD")
+    yield ("token", "Mình ")
+    yield ("token", "hiểu mà.")
+
+def test_chat_stream_endpoint():
+    mock_manager.chat_stream = _fake_chat_stream
+    payload = {"message": "I am feeling sad today."}
+    with client.stream("POST", "/chat/stream", json=payload) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        body = "".join(response.iter_text())
+
+    events = [block.split("\n")[0] for block in body.strip().split("\n\n")]
+    assert events == ["event: avatar_state", "event: token", "event: token", "event: done"]
+    assert '"reply": "Mình hiểu mà."' in body
+    assert '"avatar_state": "STATE_SAD"' in body
+
+
+async def _failing_chat_stream(message, history, summary=None):
+    yield ("avatar_state", "STATE_SAD")
+    yield ("token", "Mình ")
+    yield ("error", "Reply interrupted")
+
+def test_chat_stream_interrupted_not_stored():
+    mock_manager.chat_stream = _failing_chat_stream
+    with client.stream("POST", "/chat/stream", json={"message": "I am feeling sad today."}) as response:
+        body = "".join(response.iter_text())
+
+    events = [block.split("\n")[0] for block in body.strip().split("\n\n")]
+    assert events == ["event: avatar_state", "event: token", "event: error"]
+    assert '"reply": "Mình"' in body
+    assert not fake.requests_to("chat_messages", "POST")
+
+
+def test_chat_history_read_once_and_turn_written_once():
+    from app.services.chat_history import chat_history_cache
+    chat_history_cache.clear()
+    mock_manager.chat.reset_mock()
+
+    client.post("/chat/", json={"message": "first"})
+    client.post("/chat/", json={"message": "second"})
+
+    # History is read from the DB on the first turn only; later turns just
+    # check the newest message's created_at
+    reads = fake.requests_to("chat_messages", "GET")
+    assert len(reads) == 2
+    assert reads[1].url.params["limit"] == "1"
+    # One insert per turn, carrying both messages
+    assert len(fake.requests_to("chat_messages", "POST")) == 2
+    rows = sorted(fake.db.rows("chat_messages"), key=lambda row: row["created_at"])
+    assert [row["role"] for row in rows] == ["user", "assistant", "user", "assistant"]
+    assert [row["content"] for row in rows[2:]] == ["second", "I understand completely."]
+    # Second turn sees the first turn from the cache
+    history = mock_manager.chat.call_args_list[1].args[1]
+    assert [m["content"] for m in history] == ["first", "I understand completely."]
+
+
+def test_chat_history_reread_after_turn_on_other_worker():
+    from datetime import datetime, timezone
+    from app.services.chat_history import chat_history_cache
+    chat_history_cache.clear()
+    mock_manager.chat.reset_mock()
+
+    client.post("/chat/", json={"message": "first"})
+    stale = chat_history_cache.stale
+    # Another uvicorn worker stores a turn this worker's cache never saw
+    fake.db.insert("chat_messages", [{
+        "user_id": MOCK_USER_ID, "role": "user", "content": "elsewhere",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }])
+    client.post("/chat/", json={"message": "second"})
+
+    history = mock_manager.chat.call_args_list[1].args[1]
+    assert [m["content"] for m in history] == ["first", "I understand completely.", "elsewhere"]
+    assert chat_history_cache.stale == stale + 1
+
+
+class TestChatHistoryCache:
+    """Test the per-user ring buffers"""
+
+    def test_ring_buffer_keeps_last_messages(self):
+        from app.services.chat_history import ChatHistoryCache
+        cache = ChatHistoryCache(max_users=10, size=3)
+        cache.fill("u1", [{"role": "user", "content": "a"}])
+        cache.append("u1", [{"role": "assistant", "content": c, "created_at": "x"} for c in "bcd"])
+
+        assert [m["content"] for m in cache.get("u1")] == ["b", "c", "d"]
+        assert cache.get("u1")[0] == {"role": "assistant", "content": "b", "created_at": "x"}
+
+    def test_append_without_fill_is_ignored(self):
+        from app.services.chat_history import ChatHistoryCache
+        cache = ChatHistoryCache()
+        cache.append("u1", [{"role": "user", "content": "a"}])
+        # A partial buffer would hide older DB messages
+        assert cache.get("u1") is None
+
+    def test_lru_eviction_and_expiry(self):
+        from app.services.chat_history import ChatHistoryCache
+        cache = ChatHistoryCache(max_users=2, size=5)
+        cache.fill("u1", [])
+        cache.fill("u2", [])
+        cache.get("u1")
+        cache.fill("u3", [])
+
+        assert cache.get("u2") is None
+        assert cache.get("u1") == []
+        assert cache.stats()["evictions"] == 1
+
+        expired = ChatHistoryCache(ttl=0)
+        expired.fill("u1", [])
+        assert expired.get("u1") is None
+
+
+class TestContextBuilder:
+    """Test token-budgeted history packing"""
+
+    @staticmethod
+    def _history(n, length=30):
+        return [
+            {
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": f"{i:02d}" + "x" * (length - 2),
+                "created_at": f"2026-01-26T12:{i:02d}:00+00:00",
+            }
+            for i in range(n)
+        ]
+
+    def test_packs_newest_messages_within_budget(self):
+        from app.services.chat_context import ContextBuilder
+        history = self._history(10)  # 30 chars -> 10 + 3 tokens each
+        context = ContextBuilder(budget=40).build(history)
+
+        assert [m["content"][:2] for m in context.messages] == ["07", "08", "09"]
+        assert [m["content"][:2] for m in context.overflow] == [f"{i:02d}" for i in range(7)]
+        assert context.tokens <= 40
+
+    def test_summary_replaces_covered_messages(self):
+        from app.services.chat_context import ContextBuilder
+        history = self._history(10)
+        summary = {"summary": "Bạn hay làm việc khuya.", "summarized_until": "2026-01-26T12:06:00+00:00"}
+        context = ContextBuilder(budget=1000).build(history, summary)
+
+        assert [m["content"][:2] for m in context.messages] == ["07", "08", "09"]
+        assert context.overflow == []
+        assert context.render().startswith("Tóm tắt hội thoại trước đó: Bạn hay làm việc khuya.")
+
+    def test_max_messages_cap(self):
+        from app.services.chat_context import ContextBuilder
+        context = ContextBuilder(budget=10000, max_messages=4).build(self._history(6))
+        assert len(context.messages) == 4
+        assert len(context.overflow) == 2
+
+    def test_prompt_tokens_prefer_reported_usage(self):
+        from app.services.chat_context import ContextBuilder
+        context = ContextBuilder().build([])
+        context.record_prompt("x" * 300)
+        assert context.usage()["prompt_tokens"] == 100
+        assert context.usage()["estimated"] is True
+
+        context.record_prompt("x" * 300, MagicMock(usage_metadata=MagicMock(prompt_token_count=87)))
+        assert context.usage()["prompt_tokens"] == 87
+        assert context.usage()["estimated"] is False
+
+
+@pytest.mark.asyncio
+async def test_update_summary_stores_and_caches():
+    from app.services.chat_context import ContextBuilder
+    from app.services.chat_history import ChatHistoryCache, update_summary
+    history = TestContextBuilder._history(6)
+    context = ContextBuilder(budget=30).build(history)
+    repos = MagicMock()
+    repos.chat_summaries.upsert = AsyncMock()
+    summarize = AsyncMock(return_value="Tóm tắt mới")
+    cache = ChatHistoryCache()
+    cache.fill("u1", history)
+
+    await update_summary(repos, "u1", context, summarize, cache)
+
+    summarize.assert_awaited_once_with(None, context.overflow)
+    repos.chat_summaries.upsert.assert_awaited_once_with("u1", "Tóm tắt mới", context.overflow[-1]["created_at"])
+    assert cache.summary("u1") == {"summary": "Tóm tắt mới", "summarized_until": context.overflow[-1]["created_at"]}
+
+
+@pytest.mark.asyncio
+async def test_load_history_miss_with_zero_ttl():
+    from app.services.chat_history import ChatHistoryCache, load_history
+    repos = MagicMock()
+    repos.chat_messages.recent = AsyncMock(return_value=[{"role": "user", "content": "a", "created_at": "x"}])
+    repos.chat_summaries.get = AsyncMock(return_value=None)
+    cache = ChatHistoryCache(ttl=0)
+
+    history, _ = await load_history(repos, "u1", cache)
+
+    # The freshly read messages are used even though the entry expires at once
+    assert [m["content"] for m in history] == ["a"]
+    assert cache.stats()["hits"] == 0
+
+
+def test_chat_stream_summarizes_overflow_after_response(monkeypatch):
+    from app.routers import chat
+    events = []
+
+    async def overflowing_stream(message, history, summary=None):
+        yield ("avatar_state", "STATE_NEUTRAL")
+        yield ("token", "ok")
+        yield ("context", MagicMock(overflow=[{"role": "user", "content": "old"}], prompt_tokens=10))
+
+    async def fake_update_summary(*args):
+        events.append("summary")
+
+    def recording_sse(event, data):
+        events.append(event)
+        return sse(event, data)
+
+    sse = chat._sse
+    mock_manager.chat_stream = overflowing_stream
+    monkeypatch.setattr(chat, "update_summary", fake_update_summary)
+    monkeypatch.setattr(chat, "_sse", recording_sse)
+    response = client.post("/chat/stream", json={"message": "hi"})
+
+    assert response.status_code == 200
+    # Run as the response's background task, once the stream has ended
+    assert events == ["avatar_state", "token", "done", "summary"]
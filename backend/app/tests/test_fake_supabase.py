@@ -0,0 +1,140 @@
+"""
+Tests for the in-memory Supabase stand-in, driven through the real repositories
+"""
+import pytest
+from postgrest.exceptions import APIError
+from app.services.repositories import Repositories
+from app.tests.fake_supabase import FakeSupabase
+
+USER = "11111111-1111-1111-1111-111111111111"
+OTHER = "22222222-2222-2222-2222-222222222222"
+
+
+@pytest.fixture
+def fake():
+    fake = FakeSupabase()
+    fake.db.seed_profile(USER)
+    fake.db.seed_profile(OTHER)
+    return fake
+
+
+def repos_for(fake: FakeSupabase, user_id: str = USER) -> Repositories:
+    return Repositories(fake.client(user_id))
+
+
+def log(day: int, hour: int = 12, **fields) -> dict:
+    return {"user_id": USER, "mood_score": 5, "activities": [],
+            "created_at": f"2026-01-{day:02d}T{hour:02d}:00:00+00:00", **fields}
+
+
+class TestQueries:
+    """The PostgREST subset used by the repositories"""
+
+    @pytest.mark.asyncio
+    async def test_keyset_pages_cover_every_row_once(self, fake):
+        repos = repos_for(fake)
+        for day in (1, 2, 2, 3, 4):
+            await repos.mood_logs.insert(log(day))
+
+        seen, cursor = [], None
+        while True:
+            rows, cursor = await repos.mood_logs.page(USER, 2, cursor=cursor)
+            seen.extend(rows)
+            if cursor is None:
+                break
+
+        assert len({row["id"] for row in seen}) == 5
+        assert [row["created_at"][:10] for row in seen] == [
+            "2026-01-04", "2026-01-03", "2026-01-02", "2026-01-02", "2026-01-01"
+        ]
+
+    @pytest.mark.asyncio
+    async def test_range_projection_and_order(self, fake):
+        repos = repos_for(fake)
+        for day in (3, 1, 5):
+            await repos.mood_logs.insert(log(day, note="secret"))
+
+        rows = await repos.mood_logs.list_between(
+            USER, "2026-01-01T00:00:00+00:00", "2026-01-05T00:00:00+00:00", columns="id, created_at"
+        )
+
+        assert [row["created_at"][:10] for row in rows] == ["2026-01-01", "2026-01-03"]
+        assert set(rows[0]) == {"id", "created_at"}
+
+    @pytest.mark.asyncio
+    async def test_maybe_single_missing_returns_none(self, fake):
+        assert await repos_for(fake).chat_summaries.get(USER) is None
+
+    @pytest.mark.asyncio
+    async def test_single_requires_exactly_one_row(self, fake):
+        with pytest.raises(APIError) as error:
+            await fake.client(USER).table("mood_logs").select("*").single().execute()
+        assert error.value.code == "PGRST116"
+
+    @pytest.mark.asyncio
+    async def test_upserts(self, fake):
+        repos = repos_for(fake)
+
+        assert await repos.achievements.insert_many(USER, ["FIRST_STEP"], "2026-01-01") == ["FIRST_STEP"]
+        assert await repos.achievements.insert_many(USER, ["FIRST_STEP", "STREAK_3"], "2026-01-02") == ["STREAK_3"]
+        await repos.monthly_insights.upsert(USER, 2026, 1, "a", "old")
+        await repos.monthly_insights.upsert(USER, 2026, 1, "b", "new")
+
+        assert (await repos.monthly_insights.get(USER, 2026, 1))["insight"] == "new"
+        assert len(fake.db.rows("monthly_insights")) == 1
+
+    @pytest.mark.asyncio
+    async def test_duplicate_insert_conflicts(self, fake):
+        repos = repos_for(fake)
+        await repos.achievements.insert(USER, "FIRST_STEP", "2026-01-01")
+
+        with pytest.raises(APIError) as error:
+            await repos.achievements.insert(USER, "FIRST_STEP", "2026-01-02")
+        assert error.value.code == "23505"
+
+
+class TestTriggersAndRLS:
+    """Database-side behaviour the API relies on"""
+
+    @pytest.mark.asyncio
+    async def test_streak_trigger(self, fake):
+        repos = repos_for(fake)
+        for day, hour in ((1, 9), (2, 9), (2, 21), (3, 9), (6, 9)):
+            await repos.mood_logs.insert(log(day, hour))
+            if day == 3:
+                assert (await repos.profiles.get(USER))["current_streak"] == 3
+
+        profile = await repos.profiles.get(USER)
+        assert profile["current_streak"] == 1
+        assert profile["longest_streak"] == 3
+        assert profile["last_log_date"] == "2026-01-06"
+
+    @pytest.mark.asyncio
+    async def test_daily_summary_trigger(self, fake):
+        repos = repos_for(fake)
+        await repos.mood_logs.insert(log(1, mood_score=8, activities=["gym"], health_metrics={"steps": 4000}))
+        await repos.mood_logs.insert(log(1, mood_score=4, activities=["gym"]))
+
+        day, = await repos.daily_summaries.list_between(USER, "2026-01-01", "2026-02-01")
+        assert day["log_count"] == 2
+        assert day["mood_score_sum"] == 12
+        assert day["activity_counts"] == {"gym": 2}
+        assert day["health_sums"] == {"steps": 4000}
+
+    @pytest.mark.asyncio
+    async def test_rows_scoped_to_jwt_user(self, fake):
+        await repos_for(fake, OTHER).chat_messages.insert(OTHER, "user", "xin chào")
+
+        # Even without the defensive user_id filter
+        response = await fake.client(USER).table("chat_messages").select("*").execute()
+        assert response.data == []
+        assert len(await repos_for(fake, OTHER).chat_messages.recent(OTHER)) == 1
+
+    @pytest.mark.asyncio
+    async def test_writing_other_users_rows_rejected(self, fake):
+        with pytest.raises(APIError) as error:
+            await repos_for(fake).mood_logs.insert({**log(1), "user_id": OTHER})
+        assert error.value.code == "42501"
+
+        await repos_for(fake).profiles.update_avatar_state(OTHER, "STATE_SAD")
+        assert fake.db.rows("profiles", id=OTHER)[0]["avatar_state"] == "STATE_NEUTRAL"
@@ -0,0 +1,198 @@
+"""
+Tests for the background job queue and the post-log job
+"""
+import asyncio
+import os
+import threading
+import time
+import httpx
+import pytest
+from unittest.mock import patch
+from app.core import SupabasePool
+from app.services.jobs import JobQueue
+from app.services.post_log import run_post_log
+
+
+def make_queue(tmp_path, **kwargs) -> JobQueue:
+    kwargs.setdefault("retry_base", 0.01)
+    return JobQueue(spool_path=str(tmp_path / "jobs.sqlite3"), **kwargs)
+
+
+class TestJobQueue:
+    """Test spooling, retries and recovery"""
+
+    @pytest.mark.asyncio
+    async def test_runs_job_and_stores_result(self, tmp_path):
+        queue = make_queue(tmp_path)
+
+        async def handler(payload):
+            return {"doubled": payload["n"] * 2}
+
+        queue.register("double", handler)
+        await queue.start()
+        try:
+            job_id = await queue.enqueue("double", {"n": 21}, owner="u1")
+            for _ in range(100):
+                if (await queue.status(job_id))["status"] == "done":
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await queue.stop()
+
+        status = await queue.status(job_id)
+        assert status["status"] == "done"
+        assert status["owner"] == "u1"
+        assert status["result"] == {"doubled": 42}
+
+    @pytest.mark.asyncio
+    async def test_retries_then_succeeds(self, tmp_path):
+        queue = make_queue(tmp_path, max_attempts=3)
+        calls = []
+
+        async def flaky(payload):
+            calls.append(1)
+            if len(calls) < 3:
+                raise RuntimeError("temporary")
+            return "ok"
+
+        queue.register("flaky", flaky)
+        await queue.start()
+        try:
+            job_id = await queue.enqueue("flaky", {})
+            for _ in range(200):
+                if (await queue.status(job_id))["status"] == "done":
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await queue.stop()
+
+        assert len(calls) == 3
+        assert (await queue.status(job_id))["result"] == "ok"
+        assert queue.stats()["retried"] == 2
+
+    @pytest.mark.asyncio
+    async def test_marks_failed_after_max_attempts(self, tmp_path):
+        queue = make_queue(tmp_path, max_attempts=2, retry_base=0)
+
+        async def broken(payload):
+            raise RuntimeError("boom")
+
+        queue.register("broken", broken)
+        job_id = await queue.enqueue("broken", {})
+        await queue.run_pending()
+        await queue.run_pending()
+
+        status = await queue.status(job_id)
+        assert status["status"] == "failed"
+        assert status["attempts"] == 2
+        assert status["error"] == "boom"
+        # Settled jobs are not picked up again
+        assert await queue.run_pending() == 0
+
+    @pytest.mark.asyncio
+    async def test_spooled_jobs_survive_restart(self, tmp_path):
+        first = make_queue(tmp_path)
+        first.register("echo", lambda payload: asyncio.sleep(0, result=payload))
+        job_id = await first.enqueue("echo", {"value": 1})
+
+        # A new process over the same spool picks the job up
+        second = make_queue(tmp_path)
+        second.register("echo", lambda payload: asyncio.sleep(0, result=payload))
+        assert await second.run_pending() == 1
+        assert (await second.status(job_id))["result"] == {"value": 1}
+
+    @pytest.mark.asyncio
+    async def test_orphaned_job_is_taken_over_after_lease(self, tmp_path):
+        queue = make_queue(tmp_path, lease=30)
+        queue.register("echo", lambda payload: asyncio.sleep(0, result="done"))
+        job_id = await queue.enqueue("echo", {})
+
+        # Claimed by a worker that then died
+        assert queue.spool.claim(job_id, time.time(), 30) is not None
+        assert queue.spool.claim(job_id, time.time(), 30) is None
+        assert queue.spool.due(time.time()) == []
+
+        assert queue.spool.due(time.time() + 31) == [job_id]
+        assert queue.spool.claim(job_id, time.time() + 31, 30)["attempts"] == 2
+
+    @pytest.mark.asyncio
+    async def test_spool_io_off_event_loop(self, tmp_path):
+        queue = make_queue(tmp_path)
+        queue.register("echo", lambda payload: asyncio.sleep(0, result=payload))
+        threads = []
+        add, get = queue.spool.add, queue.spool.get
+        queue.spool.add = lambda *args: threads.append(threading.get_ident()) or add(*args)
+        queue.spool.get = lambda *args: threads.append(threading.get_ident()) or get(*args)
+
+        await queue.status(await queue.enqueue("echo", {}))
+
+        assert len(threads) == 2
+        assert threading.get_ident() not in threads
+
+    @pytest.mark.asyncio
+    async def test_spool_files_private(self, tmp_path):
+        queue = make_queue(tmp_path)
+        queue.register("echo", lambda payload: asyncio.sleep(0, result=payload))
+        await queue.enqueue("echo", {"access_token": "secret"})
+
+        path = queue.spool_path
+        # Tokens are also in the WAL until a checkpoint
+        for suffix in ("", "-wal", "-shm"):
+            assert os.stat(path + suffix).st_mode & 0o777 == 0o600
+
+    @pytest.mark.asyncio
+    async def test_unknown_kind_rejected(self, tmp_path):
+        queue = make_queue(tmp_path)
+        with pytest.raises(ValueError):
+            await queue.enqueue("missing", {})
+
+
+class TestPostLogJob:
+    """Test the post-log job against a mocked PostgREST"""
+
+    @pytest.mark.asyncio
+    async def test_updates_profile_and_awards_badges(self):
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append((request.method, request.url.path))
+            assert request.headers["authorization"] == "Bearer user-jwt"
+            if request.url.path == "/rest/v1/profiles" and request.method == "GET":
+                return httpx.Response(200, json=[{"current_streak": 3}])
+            if request.url.path == "/rest/v1/user_achievements":
+                return httpx.Response(201, json=[{"badge_code": "FIRST_STEP"}, {"badge_code": "STREAK_3"}])
+            return httpx.Response(200, json=[])
+
+        pool = SupabasePool("https://example.supabase.co", "anon-key", transport=httpx.MockTransport(handler))
+        payload = {
+            "user_id": "u-post-log",
+            "access_token": "user-jwt",
+            "log": {"id": "log-1", "created_at": "2026-01-26T12:00:00Z", "mood_score": 6},
+            "avatar_state": "STATE_JOYFUL",
+        }
+        with patch("app.services.post_log.supabase_pool", pool):
+            badges = await run_post_log(payload)
+
+        assert [badge["code"] for badge in badges] == ["FIRST_STEP", "STREAK_3"]
+        assert requests[0] == ("PATCH", "/rest/v1/profiles")
+        assert ("POST", "/rest/v1/user_achievements") in requests
+
+    @pytest.mark.asyncio
+    async def test_award_failure_raises_for_retry(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path == "/rest/v1/profiles" and request.method == "GET":
+                return httpx.Response(200, json=[{"current_streak": 1}])
+            if request.url.path == "/rest/v1/user_achievements":
+                return httpx.Response(500, json={"message": "down"})
+            return httpx.Response(200, json=[])
+
+        pool = SupabasePool("https://example.supabase.co", "anon-key", transport=httpx.MockTransport(handler))
+        payload = {
+            "user_id": "u-post-log-fail",
+            "access_token": "user-jwt",
+            "log": {"id": "log-2", "created_at": "2026-01-26T12:00:00Z"},
+            "avatar_state": "STATE_NEUTRAL",
+        }
+        with patch("app.services.post_log.supabase_pool", pool):
+            with pytest.raises(Exception):
+                await run_post_log(payload)
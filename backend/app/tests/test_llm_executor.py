@@ -0,0 +1,361 @@
+"""
+Tests for the non-blocking LLM execution layer
+"""
+import asyncio
+import pytest
+from app.services.adaptive_limit import AdaptiveLimiter, LLMOverloadedError
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.llm_executor import LLMExecutor, LLMTimeoutError
+from app.services.ai_manager import AnalyzerAgent, ChatAgent
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """Stand-in for genai.GenerativeModel with a configurable delay"""
+
+    def __init__(self, text: str = "ok", delay: float = 0.0):
+        self.text = text
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            return FakeResponse(self.text)
+        finally:
+            self.active -= 1
+
+
+class FailingModel:
+    """Model whose calls fail like an overloaded provider"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.calls += 1
+        raise RuntimeError("503 The model is overloaded")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeStreamModel:
+    """Stand-in for a streaming generate_content_async(stream=True) call"""
+
+    def __init__(self, chunks, delay: float = 0.0):
+        self.chunks = chunks
+        self.delay = delay
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        async def iterate():
+            for chunk in self.chunks:
+                await asyncio.sleep(self.delay)
+                yield FakeResponse(chunk)
+        return iterate()
+
+
+class TestLLMExecutor:
+    """Test bounded async execution"""
+
+    @pytest.mark.asyncio
+    async def test_generate_returns_response(self):
+        executor = LLMExecutor(max_concurrency=2)
+        response = await executor.generate(FakeModel("hello"), "prompt", agent="chat")
+        assert response.text == "hello"
+        assert executor.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_timeout_raises(self):
+        executor = LLMExecutor(max_concurrency=2, agent_timeouts={"analyzer": 0.01})
+        with pytest.raises(LLMTimeoutError):
+            await executor.generate(FakeModel(delay=1), "prompt", agent="analyzer")
+        assert executor.timeouts == 1
+        assert executor.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_bounded(self):
+        executor = LLMExecutor(max_concurrency=3)
+        model = FakeModel(delay=0.02)
+        await asyncio.gather(*[
+            executor.generate(model, "prompt", agent="chat") for _ in range(10)
+        ])
+        assert model.peak == 3
+
+    @pytest.mark.asyncio
+    async def test_calls_do_not_block_event_loop(self):
+        """Slow LLM calls must overlap instead of running back to back"""
+        executor = LLMExecutor(max_concurrency=50)
+        model = FakeModel(delay=0.05)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await asyncio.gather(*[
+            executor.generate(model, "prompt", agent="chat") for _ in range(20)
+        ])
+        assert loop.time() - start < 0.5
+
+    @pytest.mark.asyncio
+    async def test_cancellation_releases_slot(self):
+        executor = LLMExecutor(max_concurrency=1)
+        task = asyncio.ensure_future(
+            executor.generate(FakeModel(delay=5), "prompt", agent="chat")
+        )
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert executor.in_flight == 0
+        # Slot is free again
+        response = await executor.generate(FakeModel("next"), "prompt", agent="chat")
+        assert response.text == "next"
+
+
+class TestAgentTimeoutFallback:
+    """Agents fall back to canned responses when the executor times out"""
+
+    @pytest.mark.asyncio
+    async def test_analyzer_fallback_on_timeout(self):
+        executor = LLMExecutor(agent_timeouts={"analyzer": 0.01})
+        analyzer = AnalyzerAgent(executor)
+        analyzer.model = FakeModel('{"mood_score": 9}', delay=1)
+
+        result = await analyzer.analyze("Hôm nay mình rất vui")
+
+        assert result['primary_emotion'] == 'neutral'
+        assert result['mood_score'] == 5
+
+
+class TestStreaming:
+    """Streaming generation and avatar-state parsing"""
+
+    @pytest.mark.asyncio
+    async def test_stream_yields_chunks_and_releases_slot(self):
+        executor = LLMExecutor(max_concurrency=1)
+        chunks = [c.text async for c in executor.stream(FakeStreamModel(["a", "b"]), "p", agent="chat")]
+        assert chunks == ["a", "b"]
+        assert executor.stats()["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_stream_deadline(self):
+        executor = LLMExecutor(agent_timeouts={"chat": 0.05})
+        model = FakeStreamModel(["a", "b", "c"], delay=0.03)
+        with pytest.raises(LLMTimeoutError):
+            async for _ in executor.stream(model, "p", agent="chat"):
+                pass
+        assert executor.timeouts == 1
+
+    @pytest.mark.asyncio
+    async def test_chat_stream_sends_state_first(self):
+        agent = ChatAgent(LLMExecutor())
+        agent.model = FakeStreamModel(["STATE_S", "AD\nMình ", "hiểu ", "mà."])
+        events = [event async for event in agent.chat_stream("buồn quá", [])]
+        assert events[0] == ("avatar_state", "STATE_SAD")
+        assert "".join(text for kind, text in events[1:-1]) == "Mình hiểu mà."
+        # Last event reports the prompt size
+        kind, context = events[-1]
+        assert kind == "context"
+        assert context.prompt_tokens > 0
+
+    @pytest.mark.asyncio
+    async def test_chat_stream_fallback_on_timeout(self):
+        agent = ChatAgent(LLMExecutor(agent_timeouts={"chat": 0.01}))
+        agent.model = FakeStreamModel(["STATE_SAD\n", "..."], delay=1)
+        events = [event async for event in agent.chat_stream("buồn quá", [])]
+        assert events[:-1] == [("avatar_state", "STATE_NEUTRAL"), ("token", ChatAgent.FALLBACK_REPLY)]
+
+    @pytest.mark.asyncio
+    async def test_chat_stream_reports_truncated_reply(self):
+        agent = ChatAgent(LLMExecutor(agent_timeouts={"chat": 0.05}))
+        agent.model = FakeStreamModel(["STATE_SAD\nMình ", "hiểu ", "mà."], delay=0.03)
+        events = [event async for event in agent.chat_stream("buồn quá", [])]
+        assert events[0] == ("avatar_state", "STATE_SAD")
+        # No fallback appended to the partial reply, an error marker instead
+        assert ("token", ChatAgent.FALLBACK_REPLY) not in events
+        assert events[-2][0] == "error"
+
+
+class TestCircuitBreaker:
+    """Open on failures or slowness, probe while half-open"""
+
+    @staticmethod
+    def make(clock):
+        return CircuitBreaker("chat", window_size=4, min_calls=4, open_seconds=10, half_open_probes=2, clock=clock)
+
+    def test_opens_on_failure_rate(self):
+        breaker = self.make(FakeClock())
+        for ok in (True, False, True, False):
+            permit = breaker.allow()
+            assert permit
+            breaker.record(permit, ok=ok)
+
+        assert breaker.state == "open"
+        assert breaker.allow() is None
+        assert breaker.stats()["rejected"] == 1
+
+    def test_opens_on_slow_calls(self):
+        breaker = CircuitBreaker("chat", window_size=4, min_calls=4, slow_call_threshold=0.75)
+        for slow in (True, True, False, True):
+            breaker.record(breaker.allow(), ok=True, slow=slow)
+        assert breaker.state == "open"
+
+    def test_half_open_probes_close_or_reopen(self):
+        clock = FakeClock()
+        breaker = self.make(clock)
+        breaker._open()
+        clock.now = 10
+
+        first, second = breaker.allow(), breaker.allow()
+        assert first and second
+        # Only two probes at a time
+        assert breaker.allow() is None
+        breaker.record(first, ok=True)
+        breaker.record(second, ok=True)
+        assert breaker.state == "closed"
+
+        breaker._open()
+        clock.now = 20
+        breaker.record(breaker.allow(), ok=True, slow=True)
+        assert breaker.state == "open"
+        assert breaker.allow() is None
+
+    def test_cancelled_probe_frees_its_slot(self):
+        clock = FakeClock()
+        breaker = self.make(clock)
+        breaker._open()
+        clock.now = 10
+        probe = breaker.allow()
+        breaker.allow()
+        breaker.cancelled(probe)
+        assert breaker.allow()
+
+    def test_pre_open_call_ignored_while_half_open(self):
+        clock = FakeClock()
+        breaker = self.make(clock)
+        # Admitted while closed, still running when the circuit opens
+        straggler = breaker.allow()
+        breaker._open()
+        clock.now = 10
+        probe = breaker.allow()
+
+        # The slow straggler finishes during the probe: it neither reopens
+        # the circuit nor counts as a passed probe
+        breaker.record(straggler, ok=False, slow=True)
+        assert breaker.state == "half_open"
+        breaker.record(probe, ok=True)
+        assert breaker.state == "half_open"
+        breaker.record(breaker.allow(), ok=True)
+        assert breaker.state == "closed"
+
+    def test_probe_of_earlier_half_open_period_ignored(self):
+        clock = FakeClock()
+        breaker = self.make(clock)
+        breaker._open()
+        clock.now = 10
+        late_probe = breaker.allow()
+        breaker.record(breaker.allow(), ok=False)  # reopens
+        clock.now = 20
+        first = breaker.allow()
+
+        breaker.cancelled(late_probe)
+        # The late probe did not free a slot of the new half-open period
+        assert breaker.allow()
+        assert breaker.allow() is None
+        breaker.record(late_probe, ok=True)
+        breaker.record(first, ok=True)
+        assert breaker.state == "half_open"
+
+
+class TestAdaptiveLimiter:
+    """AIMD limit and bounded queueing"""
+
+    @pytest.mark.asyncio
+    async def test_drops_cut_limit_once_per_round(self):
+        limiter = AdaptiveLimiter(max_limit=10, min_limit=2)
+        tickets = [await limiter.acquire() for _ in range(5)]
+        for ticket in tickets:
+            limiter.release(ticket, dropped=True)
+
+        # Five simultaneous timeouts are one congestion event
+        assert limiter.limit == 9
+        ticket = await limiter.acquire()
+        limiter.release(ticket, dropped=True)
+        assert limiter.limit == 8
+
+    @pytest.mark.asyncio
+    async def test_successes_raise_limit_back(self):
+        limiter = AdaptiveLimiter(max_limit=10, initial_limit=4)
+        for _ in range(20):
+            tickets = [await limiter.acquire() for _ in range(limiter.limit)]
+            for ticket in tickets:
+                limiter.release(ticket)
+        assert limiter.limit == 10
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout_and_cancellation(self):
+        limiter = AdaptiveLimiter(max_limit=1, queue_timeout=0.02)
+        ticket = await limiter.acquire()
+
+        with pytest.raises(LLMOverloadedError):
+            await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        limiter.release(ticket)
+        assert limiter.stats() == {"limit": 1, "in_flight": 0, "waiting": 0, "decreases": 0, "rejected": 1}
+
+
+class TestExecutorProtection:
+    """Failing or slow agents stop costing a full timeout per request"""
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_skips_model(self):
+        executor = LLMExecutor(breaker_factory=lambda agent: CircuitBreaker(agent, window_size=3, min_calls=3))
+        model = FailingModel()
+        for _ in range(3):
+            with pytest.raises(RuntimeError):
+                await executor.generate(model, "p", agent="analyzer")
+
+        with pytest.raises(CircuitOpenError):
+            await executor.generate(model, "p", agent="analyzer")
+        assert model.calls == 3
+        assert executor.stats()["open_circuits"] == 1
+        # Other agents keep their own circuit
+        assert (await executor.generate(FakeModel("ok"), "p", agent="chat")).text == "ok"
+
+    @pytest.mark.asyncio
+    async def test_agent_falls_back_immediately_when_open(self):
+        executor = LLMExecutor()
+        executor.breaker_for("analyzer")._open()
+        analyzer = AnalyzerAgent(executor)
+        analyzer.model = FakeModel('{"mood_score": 9}', delay=1)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        result = await analyzer.analyze("Hôm nay mình rất vui")
+
+        assert result["mood_score"] == 5
+        assert loop.time() - start < 0.1
+
+    @pytest.mark.asyncio
+    async def test_slow_calls_shrink_concurrency(self):
+        executor = LLMExecutor(max_concurrency=8, min_concurrency=2, agent_timeouts={"chat": 0.04})
+        for _ in range(3):
+            await executor.generate(FakeModel(delay=0.025), "p", agent="chat")
+
+        assert executor.stats()["concurrency_limit"] < 8
+        assert executor.in_flight == 0
@@ -1,29 +1,35 @@
 from fastapi.testclient import TestClient
 from app.main import app
-from app.core import get_supabase, get_supabase_with_auth
+from app.core import get_supabase_with_auth, get_access_token
 from app.auth import get_current_user
-from unittest.mock import MagicMock
+from app.tests.fake_supabase import FakeSupabase
+from unittest.mock import AsyncMock
+import uuid
 import pytest
 
 client = TestClient(app)
 
-# Mock Supabase
-mock_supabase = MagicMock()
-mock_table = MagicMock()
-mock_supabase.table.return_value = mock_table
-
-def override_get_supabase():
-    return mock_supabase
-
 # Mock authentication - return a test user ID
 MOCK_USER_ID = "550e8400-e29b-41d4-a716-446655440001"
 
+# In-memory Supabase, recreated for every test
+fake = FakeSupabase()
+
 async def override_get_current_user():
     return MOCK_USER_ID
 
-app.dependency_overrides[get_supabase] = override_get_supabase
-app.dependency_overrides[get_supabase_with_auth] = override_get_supabase
-app.dependency_overrides[get_current_user] = override_get_current_user
+def setup_function():
+    # Other test modules share `app`; re-apply this module's overrides
+    global fake
+    fake = FakeSupabase()
+    fake.db.seed_profile(MOCK_USER_ID)
+    app.dependency_overrides[get_supabase_with_auth] = fake.dependency(MOCK_USER_ID)
+    app.dependency_overrides[get_current_user] = override_get_current_user
+    app.dependency_overrides[get_access_token] = lambda: fake.token(MOCK_USER_ID)
+
+def seed_logs(*logs):
+    # Rows as the API writes them (activities is never NULL)
+    return fake.db.insert("mood_logs", [{"user_id": MOCK_USER_ID, "activities": [], **log} for log in logs])
 
 def test_read_main():
     response = client.get("/")
@@ -35,47 +41,130 @@ def test_health_check():
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
 
-def test_create_mood_log():
-    # Setup mock return
-    mock_data = [{
-        "id": "550e8400-e29b-41d4-a716-446655440000",
-        "user_id": MOCK_USER_ID,  # Use mocked user ID
-        "mood_score": 7,
-        "stress_level": 3,
-        "energy_level": 5,
-        "note": "Feeling good",
-        "activities": ["coding"],
-        "voice_transcript": None,
-        "ai_feedback": None,
-        "created_at": "2026-01-26T12:00:00Z"
-    }]
-    mock_table.insert.return_value.execute.return_value.data = mock_data
-    
+def test_create_mood_log(monkeypatch):
+    from app.services.ai_manager import ai_manager
+    monkeypatch.setattr(ai_manager, "analyze_mood", AsyncMock(return_value={
+        "mood_score": 7, "activities": ["coding"], "ai_feedback": "Tuyệt vời!", "avatar_state": "STATE_JOYFUL"
+    }))
+
     payload = {
-        "mood_score": 7,
+        "mood_score": 5,
         "stress_level": 3,
         "energy_level": 5,
         "note": "Feeling good",
-        "activities": ["coding"]
+        "activities": []
     }
     response = client.post("/mood-logs/", json=payload)
     assert response.status_code == 200
     data = response.json()
     assert data["mood_score"] == 7
-    assert data["id"] == "550e8400-e29b-41d4-a716-446655440000"
+    assert data["ai_feedback"] == "Tuyệt vời!"
+    # Badges are awarded by the post-log job, not inline
+    assert data["new_achievements"] == []
+
+    stored = fake.db.rows("mood_logs", id=data["id"])
+    assert stored[0]["user_id"] == MOCK_USER_ID
+    # The streak and daily summary triggers ran on insert
+    assert fake.db.rows("profiles", id=MOCK_USER_ID)[0]["current_streak"] == 1
+    assert fake.db.rows("daily_mood_summaries", user_id=MOCK_USER_ID)[0]["activity_counts"] == {"coding": 1}
+
+    status = client.get(f"/mood-logs/{data['id']}/achievements")
+    assert status.status_code == 200
+    assert status.json()["status"] == "pending"
+
+@pytest.mark.asyncio
+async def test_post_log_job_awards_badges(monkeypatch):
+    from app.services import post_log
+    user_id = str(uuid.uuid4())
+    fake.db.seed_profile(user_id, current_streak=2, last_log_date="2026-01-25")
+    log = fake.db.insert("mood_logs", [{"user_id": user_id, "mood_score": 8, "created_at": "2026-01-26T12:00:00+00:00"}])[0]
+    monkeypatch.setattr(post_log, "supabase_pool", fake.pool)
+
+    earned = await post_log.run_post_log({
+        "user_id": user_id, "access_token": fake.token(user_id), "log": log, "avatar_state": "STATE_JOYFUL"
+    })
+
+    assert {badge["code"] for badge in earned} >= {"FIRST_STEP", "STREAK_3"}
+    assert {row["badge_code"] for row in fake.db.rows("user_achievements", user_id=user_id)} == {
+        badge["code"] for badge in earned
+    }
+    assert fake.db.rows("profiles", id=user_id)[0]["avatar_state"] == "STATE_JOYFUL"
+
+def test_log_achievements_unknown_log():
+    response = client.get("/mood-logs/00000000-0000-0000-0000-000000000000/achievements")
+    assert response.status_code == 404
 
 def test_get_mood_logs():
-    mock_data = [{
-        "id": "550e8400-e29b-41d4-a716-446655440000",
-        "user_id": "550e8400-e29b-41d4-a716-446655440001",
-        "mood_score": 8,
-        "stress_level": 2,
-        "energy_level": 8,
-        "created_at": "2026-01-26T12:00:00Z"
-    }]
-    mock_table.select.return_value.eq.return_value.execute.return_value.data = mock_data
-    
+    seed_logs({"mood_score": 8, "stress_level": 2, "energy_level": 8, "created_at": "2026-01-26T12:00:00Z"})
+    # RLS: other users' logs are invisible
+    fake.db.insert("mood_logs", [{"user_id": str(uuid.uuid4()), "mood_score": 1}])
+
     response = client.get("/mood-logs/")
     assert response.status_code == 200
     assert len(response.json()) == 1
     assert response.json()[0]["mood_score"] == 8
+    assert "X-Next-Cursor" not in response.headers
+
+def test_get_mood_logs_unpaginated_by_default():
+    seed_logs(*[{"mood_score": 5, "stress_level": 3, "energy_level": 5,
+                 "created_at": f"2026-01-01T00:{i:02d}:00+00:00"} for i in range(60)])
+
+    response = client.get("/mood-logs/")
+    # The dashboard computes totals from this list: no default page size
+    assert len(response.json()) == 60
+    assert "X-Next-Cursor" not in response.headers
+    assert "limit" not in fake.requests_to("mood_logs", "GET")[-1].url.params
+
+def test_get_mood_logs_paginated_and_projected():
+    rows = seed_logs(*[{
+        "mood_score": 6,
+        "stress_level": 4,
+        "energy_level": 5,
+        "note": "private",
+        "created_at": f"2026-01-2{i}T12:00:00+00:00"
+    } for i in (3, 2, 1)])
+
+    response = client.get("/mood-logs/?limit=2&exclude=note,voice_transcript")
+    assert response.status_code == 200
+    data = response.json()
+    assert [log["id"] for log in data] == [rows[0]["id"], rows[1]["id"]]
+    assert "note" not in data[0]
+    assert "note" not in fake.requests_to("mood_logs", "GET")[-1].url.params["select"]
+
+    from app.services.repositories import decode_cursor
+    cursor = response.headers["X-Next-Cursor"]
+    assert decode_cursor(cursor) == (rows[1]["created_at"], rows[1]["id"])
+
+    last_page = client.get(f"/mood-logs/?limit=2&cursor={cursor}")
+    assert [log["id"] for log in last_page.json()] == [rows[2]["id"]]
+    assert "X-Next-Cursor" not in last_page.headers
+
+def test_get_mood_logs_rejects_bad_params():
+    assert client.get("/mood-logs/?cursor=garbage").status_code == 400
+    assert client.get("/mood-logs/?exclude=mood_score").status_code == 400
+
+def test_calendar_reads_daily_summaries():
+    seed_logs(
+        {"mood_score": 8, "avatar_state": "STATE_JOYFUL", "activities": ["gym", "coding"],
+         "health_metrics": {"steps": 4000, "sleep_hours": 6}, "created_at": "2026-01-26T08:00:00+00:00"},
+        {"mood_score": 7, "avatar_state": "STATE_JOYFUL", "activities": ["gym", "reading"],
+         "health_metrics": {"steps": 5000, "sleep_hours": 7}, "created_at": "2026-01-26T12:00:00+00:00"},
+        {"mood_score": 5, "avatar_state": "STATE_SAD", "activities": ["cooking"],
+         "created_at": "2026-01-26T20:00:00+00:00"},
+    )
+
+    response = client.get("/mood-logs/calendar/?month=1&year=2026")
+    assert response.status_code == 200
+    data = response.json()
+    # Served from the trigger-maintained summaries, not the raw logs
+    assert fake.requests_to("daily_mood_summaries", "GET")
+    assert not fake.requests_to("mood_logs", "GET")
+    assert data["total_logs"] == 3
+    day = data["days"][0]
+    assert day["date"] == "2026-01-26"
+    assert day["average_mood_score"] == 6.7
+    assert day["primary_avatar_state"] == "STATE_JOYFUL"
+    assert day["top_activities"] == ["gym", "coding", "cooking"]
+    assert day["health_summary"]["total_steps"] == 9000
+    assert day["health_summary"]["avg_sleep_hours"] == 6.5
+    assert day["health_summary"]["total_meditation_min"] is None
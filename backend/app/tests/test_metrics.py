@@ -0,0 +1,107 @@
+"""
+Tests for the metrics registry, the HTTP middleware and /metrics
+"""
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.llm_executor import LLMExecutor, LLMTimeoutError
+from app.services.metrics import LLM_CALL_SECONDS, MetricsRegistry
+
+client = TestClient(app)
+
+
+class SlowModel:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def generate_content_async(self, prompt, **kwargs):
+        await asyncio.sleep(self.delay)
+        return "ok"
+
+
+class TestRegistry:
+    """Text exposition of counters, histograms and collectors"""
+
+    def test_counter_with_labels(self):
+        registry = MetricsRegistry(prefix="t_")
+        counter = registry.counter("fallbacks_total", "Fallbacks", ("agent",))
+        counter.inc("chat")
+        counter.inc("chat")
+        counter.inc("insight", amount=3)
+
+        text = registry.render()
+
+        assert "# TYPE t_fallbacks_total counter" in text
+        assert 't_fallbacks_total{agent="chat"} 2' in text
+        assert 't_fallbacks_total{agent="insight"} 3' in text
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = MetricsRegistry(prefix="t_")
+        histogram = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, "/x")
+
+        text = registry.render()
+
+        assert 't_latency_seconds_bucket{route="/x",le="0.1"} 1' in text
+        assert 't_latency_seconds_bucket{route="/x",le="1.0"} 2' in text
+        assert 't_latency_seconds_bucket{route="/x",le="+Inf"} 3' in text
+        assert 't_latency_seconds_count{route="/x"} 3' in text
+
+    def test_collector_exports_numeric_stats(self):
+        registry = MetricsRegistry(prefix="t_")
+        registry.collector("cache", lambda: {"hits": 4, "hit_rate": 0.5, "name": "lru"})
+
+        text = registry.render()
+
+        assert "t_cache_hits 4" in text
+        assert "t_cache_hit_rate 0.5" in text
+        assert "name" not in text
+
+    def test_label_values_are_escaped(self):
+        registry = MetricsRegistry(prefix="t_")
+        registry.counter("c_total", "C", ("v",)).inc('a"b')
+
+        assert 't_c_total{v="a\\"b"} 1' in registry.render()
+
+    def test_duplicate_metric_rejected(self):
+        registry = MetricsRegistry(prefix="t_")
+        registry.counter("c_total", "C")
+        with pytest.raises(ValueError):
+            registry.counter("c_total", "C")
+
+
+class TestInstrumentation:
+    """Requests and LLM calls show up on /metrics"""
+
+    def test_metrics_endpoint_labels_route_template(self):
+        client.get("/health")
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert 'auramind_http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in response.text
+        assert "auramind_llm_executor_max_concurrency" in response.text
+
+    def test_unknown_paths_share_one_label(self):
+        client.get("/no-such-path-123")
+
+        text = client.get("/metrics").text
+
+        assert 'route="unmatched",status="404"' in text
+        assert "no-such-path-123" not in text
+
+    @pytest.mark.asyncio
+    async def test_llm_calls_recorded_by_outcome(self):
+        executor = LLMExecutor(max_concurrency=2)
+        ok_before = LLM_CALL_SECONDS.count("metrics_test", "ok")
+        timeout_before = LLM_CALL_SECONDS.count("metrics_test", "timeout")
+
+        await executor.generate(SlowModel(0), "p", agent="metrics_test")
+        with pytest.raises(LLMTimeoutError):
+            await executor.generate(SlowModel(1), "p", agent="metrics_test", timeout=0.01)
+
+        assert LLM_CALL_SECONDS.count("metrics_test", "ok") == ok_before + 1
+        assert LLM_CALL_SECONDS.count("metrics_test", "timeout") == timeout_before + 1
@@ -0,0 +1,304 @@
+"""
+Tests for the stage-graph pipeline and local streak derivation
+"""
+import asyncio
+import pytest
+from datetime import date
+from app.services.pipeline import StageGraph
+from app.services.streaks import apply_log_to_streak, to_log_date
+from app.services.ai_manager import AIAgentManager
+
+
+class TestStageGraph:
+    """Test dependency-ordered concurrent execution"""
+
+    @pytest.mark.asyncio
+    async def test_independent_stages_overlap(self):
+        async def slow(value):
+            await asyncio.sleep(0.05)
+            return value
+
+        graph = StageGraph()
+        graph.add("a", lambda: slow(1))
+        graph.add("b", lambda: slow(2))
+        graph.add("c", lambda a, b: slow(a + b), deps=("a", "b"))
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        results = await graph.run()
+        elapsed = loop.time() - start
+
+        assert results == {"a": 1, "b": 2, "c": 3}
+        # a and b overlap: ~2 sleeps, not 3
+        assert elapsed < 0.14
+        assert set(graph.timer.timings) == {"a", "b", "c"}
+
+    def test_unknown_dependency_rejected(self):
+        graph = StageGraph()
+        with pytest.raises(ValueError):
+            graph.add("c", lambda a: a, deps=("a",))
+
+    @pytest.mark.asyncio
+    async def test_failure_propagates(self):
+        async def boom():
+            raise RuntimeError("stage failed")
+
+        async def never():
+            await asyncio.sleep(10)
+
+        graph = StageGraph()
+        graph.add("boom", boom)
+        graph.add("slow", never)
+        with pytest.raises(RuntimeError):
+            await graph.run()
+
+    def test_server_timing_header(self):
+        graph = StageGraph()
+        graph.timer.timings = {"ai": 12.5, "insert": 3.0}
+        assert graph.timer.server_timing() == "ai;dur=12.5, insert;dur=3.0"
+
+
+class TestStreakMirror:
+    """apply_log_to_streak must match the update_user_streak() trigger"""
+
+    def test_first_log(self):
+        profile = apply_log_to_streak({}, date(2026, 1, 10))
+        assert profile['current_streak'] == 1
+        assert profile['longest_streak'] == 1
+        assert profile['last_log_date'] == "2026-01-10"
+
+    def test_same_day_unchanged(self):
+        before = {'current_streak': 4, 'longest_streak': 6, 'last_log_date': "2026-01-10"}
+        assert apply_log_to_streak(before, date(2026, 1, 10)) == before
+
+    def test_next_day_increments(self):
+        before = {'current_streak': 6, 'longest_streak': 6, 'last_log_date': "2026-01-10"}
+        after = apply_log_to_streak(before, date(2026, 1, 11))
+        assert after['current_streak'] == 7
+        assert after['longest_streak'] == 7
+
+    def test_gap_resets(self):
+        before = {'current_streak': 5, 'longest_streak': 9, 'last_log_date': "2026-01-10"}
+        after = apply_log_to_streak(before, date(2026, 1, 15))
+        assert after['current_streak'] == 1
+        assert after['longest_streak'] == 9
+
+    def test_backfill_ignored(self):
+        before = {'current_streak': 5, 'longest_streak': 9, 'last_log_date': "2026-01-10"}
+        assert apply_log_to_streak(before, date(2026, 1, 2)) == before
+
+    def test_log_date_is_utc(self):
+        assert to_log_date("2026-01-26T23:30:00Z") == date(2026, 1, 26)
+
+
+class TestConcurrentAnalyzePipeline:
+    """analyze and context stages must overlap inside analyze_mood"""
+
+    @pytest.mark.asyncio
+    async def test_context_fetch_overlaps_analyzer(self):
+        manager = AIAgentManager()
+
+        async def analyze(text):
+            await asyncio.sleep(0.05)
+            return {"mood_score": 8, "stress_level": 2, "primary_emotion": "vui"}
+
+        async def get_user_context(user_id, supabase):
+            await asyncio.sleep(0.05)
+            return {"streak": 3, "has_context": True}
+
+        async def respond(text, analyzer_output, user_context):
+            return f"streak={user_context['streak']}"
+
+        manager.analyzer.analyze = analyze
+        manager.empathizer.get_user_context = get_user_context
+        manager.empathizer.respond = respond
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await manager.analyze_mood("Hôm nay vui", user_id="u1", supabase=object())
+        elapsed = loop.time() - start
+
+        assert result["ai_feedback"] == "streak=3"
+        assert result["avatar_state"] == "STATE_JOYFUL"
+        assert elapsed < 0.09
+        assert set(result["timings"]) == {"analyze", "context", "respond"}
+
+
+class TestFusedPipeline:
+    """Fused mode: one LLM call, falls back to split on invalid output"""
+
+    def make_manager(self, fused_text: str) -> tuple:
+        from app.services.ai_manager import PIPELINE_FUSED
+        from app.services.llm_executor import LLMExecutor
+
+        manager = AIAgentManager(executor=LLMExecutor(), pipeline_mode=PIPELINE_FUSED)
+        calls = []
+
+        class FakeResponse:
+            def __init__(self, text):
+                self.text = text
+
+        async def generate(model, prompt, *, agent, **kwargs):
+            calls.append(agent)
+            return FakeResponse(fused_text)
+
+        async def analyze(text):
+            calls.append("analyzer")
+            return {"mood_score": 4, "stress_level": 5, "primary_emotion": "buồn"}
+
+        async def respond(text, analyzer_output, user_context):
+            calls.append("empathy")
+            return "split reply"
+
+        manager.fused_agent.executor.generate = generate
+        manager.analyzer.analyze = analyze
+        manager.empathizer.respond = respond
+        return manager, calls
+
+    @pytest.mark.asyncio
+    async def test_valid_output_uses_one_call(self):
+        manager, calls = self.make_manager(
+            '{"mood_score": 9, "stress_level": 2, "energy_level": 8, '
+            '"primary_emotion": "vui", "activities": ["gym", "", null], '
+            '"summary": "Vui", "ai_feedback": " Thật tuyệt! "}'
+        )
+        result = await manager.analyze_mood("Hôm nay đi gym rất vui")
+
+        assert calls == ["fused"]
+        assert result["pipeline_mode"] == "fused"
+        assert result["ai_feedback"] == "Thật tuyệt!"
+        assert result["activities"] == ["gym"]
+        assert result["avatar_state"] == "STATE_JOYFUL"
+
+    @pytest.mark.asyncio
+    async def test_invalid_output_falls_back_to_split(self):
+        # mood_score out of range and ai_feedback missing
+        manager, calls = self.make_manager('{"mood_score": 42, "stress_level": 2}')
+        result = await manager.analyze_mood("Hôm nay hơi buồn")
+
+        assert calls == ["fused", "analyzer", "empathy"]
+        assert result["pipeline_mode"] == "split"
+        assert result["ai_feedback"] == "split reply"
+        assert manager.fused_fallbacks == 1
+
+    @pytest.mark.asyncio
+    async def test_non_json_output_falls_back(self):
+        manager, calls = self.make_manager("Xin chào! Mình là Aura.")
+        result = await manager.analyze_mood("Hôm nay hơi buồn")
+
+        assert result["pipeline_mode"] == "split"
+        assert calls[0] == "fused"
+
+
+class TestSingleFlight:
+    """Concurrent identical AI calls share one in-flight call"""
+
+    @staticmethod
+    def make_manager(calls: list, delay: float = 0.05) -> AIAgentManager:
+        manager = AIAgentManager()
+
+        async def analyze(text):
+            calls.append(text)
+            await asyncio.sleep(delay)
+            return {"mood_score": 8, "stress_level": 2, "primary_emotion": "vui"}
+
+        async def get_user_context(user_id, supabase):
+            return {"has_context": False}
+
+        async def respond(text, analyzer_output, user_context):
+            return "ok"
+
+        manager.analyzer.analyze = analyze
+        manager.empathizer.get_user_context = get_user_context
+        manager.empathizer.respond = respond
+        return manager
+
+    @pytest.mark.asyncio
+    async def test_double_fired_analysis_runs_once(self):
+        calls = []
+        manager = self.make_manager(calls)
+
+        first, second = await asyncio.gather(
+            manager.analyze_mood("Hôm nay vui", user_id="u1"),
+            manager.analyze_mood("Hôm nay vui", user_id="u1"),
+        )
+
+        assert calls == ["Hôm nay vui"]
+        assert first == second
+        assert first is not second  # joined callers get their own copy
+        assert manager.flights.stats() == {"in_flight": 0, "calls": 1, "shared": 1}
+
+    @pytest.mark.asyncio
+    async def test_different_users_or_text_not_shared(self):
+        calls = []
+        manager = self.make_manager(calls)
+
+        await asyncio.gather(
+            manager.analyze_mood("Hôm nay vui", user_id="u1"),
+            manager.analyze_mood("Hôm nay vui", user_id="u2"),
+            manager.analyze_mood("Hôm nay buồn", user_id="u1"),
+        )
+
+        assert len(calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_sequential_calls_not_cached(self):
+        calls = []
+        manager = self.make_manager(calls, delay=0)
+
+        await manager.analyze_mood("Hôm nay vui", user_id="u1")
+        await manager.analyze_mood("Hôm nay vui", user_id="u1")
+
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        from app.services.single_flight import SingleFlight
+        flights = SingleFlight()
+        started = []
+
+        async def work():
+            started.append(1)
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.ensure_future(flights.do("k", work))
+        follower = asyncio.ensure_future(flights.do("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        assert await follower == "done"
+        assert started == [1]
+
+    @pytest.mark.asyncio
+    async def test_call_cancelled_when_every_caller_left(self):
+        from app.services.single_flight import SingleFlight
+        flights = SingleFlight()
+        finished = []
+
+        async def work():
+            await asyncio.sleep(0.05)
+            finished.append(1)
+
+        callers = [asyncio.ensure_future(flights.do("k", work)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.sleep(0.1)
+
+        assert finished == []
+        assert flights.stats()["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_caller(self):
+        from app.services.single_flight import SingleFlight
+        flights = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(
+            flights.do("k", fail), flights.do("k", fail), return_exceptions=True
+        )
+        assert [str(r) for r in results] == ["boom", "boom"]
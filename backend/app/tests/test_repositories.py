@@ -0,0 +1,117 @@
+"""
+Tests for the async repository layer (PostgREST requests it issues)
+"""
+import json
+import httpx
+import pytest
+from app.core import SupabasePool
+from app.services.repositories import Repositories
+
+
+def make_repos(handler) -> Repositories:
+    pool = SupabasePool(
+        "https://example.supabase.co",
+        "anon-key",
+        transport=httpx.MockTransport(handler),
+    )
+    return Repositories(pool.bind("user-jwt"))
+
+
+class TestRepositories:
+    """Test that typed methods map to the expected PostgREST calls"""
+
+    @pytest.mark.asyncio
+    async def test_mood_log_insert_returns_row(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            assert request.method == "POST"
+            assert request.url.path == "/rest/v1/mood_logs"
+            return httpx.Response(201, json=[{"id": "log-1", **json.loads(request.content)}])
+
+        repos = make_repos(handler)
+        row = await repos.mood_logs.insert({"user_id": "u1", "mood_score": 7})
+
+        assert row["id"] == "log-1"
+        assert row["mood_score"] == 7
+
+    @pytest.mark.asyncio
+    async def test_mood_log_page_uses_keyset(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            params = request.url.params
+            assert params["order"] == "created_at.desc,id.desc"
+            assert params["limit"] == "3"
+            assert params["or"] == (
+                '(created_at.lt."2026-01-26T12:00:00+00:00",'
+                'and(created_at.eq."2026-01-26T12:00:00+00:00",id.lt.log-9))'
+            )
+            return httpx.Response(200, json=[
+                {"id": "log-3", "created_at": "2026-01-25T00:00:00+00:00"},
+                {"id": "log-2", "created_at": "2026-01-24T00:00:00+00:00"},
+            ])
+
+        repos = make_repos(handler)
+        rows, next_cursor = await repos.mood_logs.page(
+            "u1", 2, cursor=("2026-01-26T12:00:00+00:00", "log-9"), columns="id, created_at"
+        )
+
+        assert [r["id"] for r in rows] == ["log-3", "log-2"]
+        assert next_cursor is None
+
+    @pytest.mark.asyncio
+    async def test_chat_recent_is_chronological(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            assert request.url.params["order"] == "created_at.desc"
+            assert request.url.params["limit"] == "10"
+            return httpx.Response(200, json=[
+                {"role": "assistant", "content": "second"},
+                {"role": "user", "content": "first"},
+            ])
+
+        repos = make_repos(handler)
+        history = await repos.chat_messages.recent("u1", limit=10)
+
+        assert [m["content"] for m in history] == ["first", "second"]
+
+    @pytest.mark.asyncio
+    async def test_profile_get_missing_returns_none(self):
+        repos = make_repos(lambda request: httpx.Response(200, json=[]))
+        assert await repos.profiles.get("u1") is None
+
+    @pytest.mark.asyncio
+    async def test_profile_update_filters_by_id(self):
+        seen = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            seen.append(request)
+            return httpx.Response(200, json=[])
+
+        repos = make_repos(handler)
+        await repos.profiles.update_avatar_state("u1", "STATE_JOYFUL")
+
+        assert seen[0].method == "PATCH"
+        assert seen[0].url.params["id"] == "eq.u1"
+
+    @pytest.mark.asyncio
+    async def test_achievement_codes(self):
+        repos = make_repos(lambda request: httpx.Response(200, json=[
+            {"badge_code": "FIRST_STEP"}, {"badge_code": "STREAK_3"}
+        ]))
+        assert await repos.achievements.list_codes("u1") == {"FIRST_STEP", "STREAK_3"}
+
+    @pytest.mark.asyncio
+    async def test_achievement_bulk_award_is_one_upsert(self):
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            assert request.url.params["on_conflict"] == "user_id,badge_code"
+            assert "resolution=ignore-duplicates" in request.headers["prefer"]
+            body = json.loads(request.content)
+            assert [row["badge_code"] for row in body] == ["FIRST_STEP", "STREAK_3"]
+            # FIRST_STEP already held: only STREAK_3 comes back
+            return httpx.Response(201, json=[body[1]])
+
+        repos = make_repos(handler)
+        awarded = await repos.achievements.insert_many("u1", ["FIRST_STEP", "STREAK_3"], "2026-01-26T00:00:00")
+
+        assert awarded == ["STREAK_3"]
+        assert len(requests) == 1
@@ -0,0 +1,64 @@
+"""
+Tests for the shared, connection-pooled Supabase transport
+"""
+import httpx
+import pytest
+from app.core import SupabasePool
+
+
+def make_pool(handler, max_connections: int = 10) -> SupabasePool:
+    return SupabasePool(
+        "https://example.supabase.co",
+        "anon-key",
+        max_connections=max_connections,
+        transport=httpx.MockTransport(handler),
+    )
+
+
+class TestSupabasePool:
+    """Test JWT binding and pool metrics"""
+
+    @pytest.mark.asyncio
+    async def test_bind_forwards_user_jwt(self):
+        seen = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            seen.append(request)
+            return httpx.Response(200, json=[{"id": 1}])
+
+        pool = make_pool(handler)
+        response = await pool.bind("user-jwt").table("mood_logs").select("*").execute()
+
+        assert response.data == [{"id": 1}]
+        assert seen[0].headers["Authorization"] == "Bearer user-jwt"
+        assert seen[0].headers["apikey"] == "anon-key"
+        assert str(seen[0].url).startswith("https://example.supabase.co/rest/v1/mood_logs")
+
+    def test_clients_share_one_transport(self):
+        pool = make_pool(lambda request: httpx.Response(200, json=[]))
+
+        first = pool.bind("jwt-a")
+        second = pool.bind("jwt-b")
+
+        assert first.session is second.session
+        # JWTs stay isolated per request
+        assert first.headers["Authorization"] == "Bearer jwt-a"
+        assert second.headers["Authorization"] == "Bearer jwt-b"
+
+    def test_anon_bind_uses_anon_key(self):
+        pool = make_pool(lambda request: httpx.Response(200, json=[]))
+        assert pool.bind(None).headers["Authorization"] == "Bearer anon-key"
+
+    @pytest.mark.asyncio
+    async def test_stats_track_requests_and_release(self):
+        pool = make_pool(lambda request: httpx.Response(200, json=[]))
+        client = pool.bind("jwt")
+
+        await client.table("mood_logs").select("*").execute()
+        await client.table("profiles").select("*").execute()
+
+        stats = pool.stats()
+        assert stats["total_requests"] == 2
+        assert stats["in_flight"] == 0
+        assert stats["peak_in_flight"] == 1
+        assert stats["saturated_requests"] == 0
@@ -0,0 +1,145 @@
+"""
+Tests for the LLM usage ledger
+"""
+import asyncio
+import time
+import pytest
+from app.services.llm_executor import LLMExecutor, LLMTimeoutError
+from app.services.usage_ledger import UsageLedger, usage_user
+
+
+class Usage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+
+
+class UsageResponse:
+    def __init__(self, usage: Usage):
+        self.text = "ok"
+        self.usage_metadata = usage
+
+
+class UsageModel:
+    model_name = "models/gemini-1.5-flash"
+
+    def __init__(self, usage: Usage, delay: float = 0.0):
+        self.usage = usage
+        self.delay = delay
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        await asyncio.sleep(self.delay)
+        if not stream:
+            return UsageResponse(self.usage)
+        return self._chunks()
+
+    async def _chunks(self):
+        yield UsageResponse(Usage(self.usage.prompt_token_count, 1))
+        yield UsageResponse(self.usage)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return UsageLedger(path=str(tmp_path / "usage.sqlite3"), flush_size=100)
+
+
+class TestUsageLedger:
+    """Buffered writes and per-agent / per-user queries"""
+
+    def test_entries_buffered_until_flush(self, ledger):
+        ledger.record("chat", "gemini-1.5-flash", Usage(100, 20), latency_ms=50)
+
+        assert ledger.stats()["buffered"] == 1
+        assert ledger.flush() == 1
+        assert ledger.stats()["buffered"] == 0
+
+    @pytest.mark.asyncio
+    async def test_flush_size_wakes_flusher(self, tmp_path):
+        ledger = UsageLedger(path=str(tmp_path / "usage.sqlite3"), flush_size=2, flush_interval=60)
+        flusher = asyncio.create_task(ledger.run_flusher())
+        try:
+            await asyncio.sleep(0)
+            ledger.record("chat", "m")
+            ledger.record("chat", "m")
+            # record() itself never writes
+            assert ledger.stats()["flushed"] == 0
+            for _ in range(100):
+                if ledger.stats()["flushed"] == 2:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            flusher.cancel()
+
+        assert ledger.stats()["flushed"] == 2
+
+    def test_summary_per_agent(self, ledger):
+        for latency in range(1, 21):
+            ledger.record("chat", "gemini-1.5-flash", Usage(1000, 100), latency_ms=latency)
+        ledger.record("insight", "gemini-1.5-flash", Usage(10, 5), latency_ms=5, outcome="timeout")
+
+        summary = ledger.summary(since=time.time() - 60)
+
+        chat, insight = summary
+        assert chat["agent"] == "chat"
+        assert chat["calls"] == 20
+        assert chat["prompt_tokens"] == 20000
+        assert chat["p50_latency_ms"] == 11
+        assert chat["p95_latency_ms"] == 19
+        assert chat["cost_usd"] == pytest.approx((20000 * 0.075 + 2000 * 0.30) / 1_000_000)
+        assert insight["errors"] == 1
+
+    def test_top_users_by_tokens(self, ledger):
+        ledger.record("chat", "m", Usage(10, 10), user_id="light")
+        ledger.record("chat", "m", Usage(500, 100), user_id="heavy")
+        ledger.record("chat", "m", Usage(900, 900))
+
+        top = ledger.top_users(since=time.time() - 60)
+
+        assert [row["user_id"] for row in top] == ["heavy", "light"]
+        assert top[0]["total_tokens"] == 600
+
+    def test_failed_write_keeps_entries(self, tmp_path):
+        ledger = UsageLedger(path=str(tmp_path / "missing" / "usage.sqlite3"))
+        ledger.record("chat", "m")
+
+        assert ledger.flush() == 0
+        assert ledger.stats()["buffered"] == 1
+        assert ledger.stats()["errors"] == 1
+
+
+class TestExecutorRecording:
+    """LLMExecutor records every call with the current user"""
+
+    @pytest.mark.asyncio
+    async def test_generate_recorded_with_user(self, ledger):
+        executor = LLMExecutor(ledger=ledger)
+
+        with usage_user("user-1"):
+            await executor.generate(UsageModel(Usage(120, 30)), "p", agent="chat")
+
+        top = ledger.top_users(since=time.time() - 60)
+        summary = ledger.summary(since=time.time() - 60)
+        assert top[0]["user_id"] == "user-1"
+        assert summary[0]["model"] == "gemini-1.5-flash"
+        assert summary[0]["prompt_tokens"] == 120
+        assert summary[0]["output_tokens"] == 30
+
+    @pytest.mark.asyncio
+    async def test_stream_uses_last_chunk_usage(self, ledger):
+        executor = LLMExecutor(ledger=ledger)
+
+        async for _ in executor.stream(UsageModel(Usage(80, 40)), "p", agent="chat"):
+            pass
+
+        assert ledger.summary(since=time.time() - 60)[0]["output_tokens"] == 40
+
+    @pytest.mark.asyncio
+    async def test_timeout_recorded(self, ledger):
+        executor = LLMExecutor(ledger=ledger)
+
+        with pytest.raises(LLMTimeoutError):
+            await executor.generate(UsageModel(Usage(1, 1), delay=1), "p", agent="insight", timeout=0.01)
+
+        row = ledger.summary(since=time.time() - 60)[0]
+        assert row["errors"] == 1
+        assert row["prompt_tokens"] == 0
@@ -0,0 +1,57 @@
+"""
+Award the badges a user's existing mood logs qualify for
+
+Use after adding a badge rule (see app/services/badge_rules.py), or for users
+whose logs were written while badge checks were failing. The logs are replayed
+oldest first and each badge is stamped with the log that earned it; badges the
+user already holds are skipped. Requires SUPABASE_SERVICE_ROLE_KEY: the
+script reads and writes other users' rows.
+
+Usage (from backend/):
+    python backfill_badges.py --user <uuid>
+    python backfill_badges.py --user <uuid> --user <uuid>
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app.core import supabase_pool
+from app.services.badges import BadgeCodeCache, BadgeService
+from app.services.repositories import Repositories
+
+
+async def backfill(user_ids: list) -> dict:
+    service_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+    if not service_key:
+        raise SystemExit("SUPABASE_SERVICE_ROLE_KEY must be set to backfill badges")
+
+    db = supabase_pool.bind(service_key)
+    repos = Repositories(db)
+    awarded = {}
+    try:
+        for user_id in user_ids:
+            cache = BadgeCodeCache()
+            cache.add(user_id, await repos.achievements.list_codes(user_id))
+            logs, _ = await repos.mood_logs.page(user_id, None)
+            # page() returns newest first; the replay needs oldest first
+            awarded[user_id] = await BadgeService(db, code_cache=cache).backfill_badges(user_id, logs[::-1])
+        return awarded
+    finally:
+        await supabase_pool.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", action="append", required=True, help="User to backfill (repeatable)")
+    args = parser.parse_args()
+
+    for user_id, codes in asyncio.run(backfill(args.user)).items():
+        print(f"{user_id}: {', '.join(codes) if codes else 'nothing new'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Local stand-ins for Gemini and Supabase, used by the load harness
+
+One ASGI app serves both:
+- /v1beta/models/{model}:generateContent and :streamGenerateContent
+  Gemini REST API shape (candidates + usageMetadata, SSE for streams), with
+  canned answers per agent and a configurable latency distribution / error rate
+- /rest/v1/{table}
+  The in-memory PostgREST of app/tests/fake_supabase.py (the one the test
+  suite uses): the query subset the backend sends, the streak (migration 006)
+  and daily summary (007) triggers, and RLS by the JWT's sub
+
+Latency specs:
+    const:800            every call takes 800ms
+    uniform:200:1200     uniformly between 200 and 1200ms
+    lognormal:800:0.5    median 800ms, sigma 0.5 (long tail, like real providers)
+
+Usage (from backend/):
+    python benchmarks/fake_services.py --port 8900 --gemini-latency lognormal:800:0.5 --gemini-error-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+from typing import Optional
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# Add backend directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# app.core refuses to import without Supabase settings; the fake needs none
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1")
+os.environ.setdefault("SUPABASE_ANON_KEY", "fake-anon-key")
+
+from app.tests.fake_supabase import FakeDatabase, FakeSupabase
+
+
+class Latency:
+    """Latency distribution parsed from a spec string (see module docstring)"""
+
+    def __init__(self, spec: str = "const:0"):
+        kind, *args = spec.split(":")
+        values = [float(arg) for arg in args]
+        if kind == "const" and len(values) == 1:
+            self._sample = lambda: values[0]
+        elif kind == "uniform" and len(values) == 2:
+            self._sample = lambda: random.uniform(values[0], values[1])
+        elif kind == "lognormal" and len(values) == 2:
+            mu = math.log(max(values[0], 0.001))
+            self._sample = lambda: random.lognormvariate(mu, values[1])
+        else:
+            raise ValueError(f"Invalid latency spec: {spec}")
+        self.spec = spec
+
+    def sample(self) -> float:
+        """One delay in seconds"""
+        return max(self._sample(), 0.0) / 1000
+
+
+class Faults:
+    """Delay and error injection for one fake service"""
+
+    def __init__(self, latency: str = "const:0", error_rate: float = 0.0):
+        self.latency = Latency(latency)
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+
+    async def apply(self) -> bool:
+        """Sleep for a sampled delay; True if this call should fail"""
+        self.calls += 1
+        await asyncio.sleep(self.latency.sample())
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+
+# ---------------------------------------------------------------------------
+# Gemini
+# ---------------------------------------------------------------------------
+
+ANALYZER_OUTPUTS = [
+    {"mood_score": 7, "stress_level": 4, "energy_level": 6, "primary_emotion": "vui",
+     "activities": ["gym", "bạn bè"], "summary": "Một ngày vui vẻ và nhiều năng lượng."},
+    {"mood_score": 3, "stress_level": 8, "energy_level": 3, "primary_emotion": "lo lắng",
+     "activities": ["làm việc"], "summary": "Áp lực công việc và thiếu ngủ."},
+    {"mood_score": 5, "stress_level": 5, "energy_level": 5, "primary_emotion": "bình yên",
+     "activities": ["đọc sách"], "summary": "Một ngày bình thường."},
+]
+EMPATHY_REPLY = "Mình nghe bạn rồi, cảm ơn bạn đã chia sẻ. Hôm nay bạn đã cố gắng nhiều đó!"
+CHAT_REPLY = "Mình hiểu cảm giác của bạn. Bạn muốn kể thêm về chuyện đó không?"
+INSIGHT_REPLY = "Những ngày bạn ngủ đủ giấc và vận động, mood của bạn cao hơn rõ rệt!"
+
+
+def gemini_answer(agent: str, prompt: str, json_mode: bool, stream: bool) -> str:
+    """Canned output in the format each agent parses"""
+    if agent == "analyzer":
+        return json.dumps(random.choice(ANALYZER_OUTPUTS), ensure_ascii=False)
+    if agent == "fused":
+        return json.dumps({**random.choice(ANALYZER_OUTPUTS), "ai_feedback": EMPATHY_REPLY}, ensure_ascii=False)
+    if agent == "chat":
+        if json_mode and not stream:
+            return json.dumps({"reply": CHAT_REPLY, "avatar_state": "STATE_NEUTRAL"}, ensure_ascii=False)
+        return f"STATE_NEUTRAL\n{CHAT_REPLY}"
+    if agent == "insight":
+        return INSIGHT_REPLY
+    if agent == "summary":
+        return "Người dùng hay kể về công việc căng thẳng và việc tập gym giúp họ thấy tốt hơn."
+    return EMPATHY_REPLY
+
+
+def _gemini_payload(text: str, prompt_tokens: int, output_tokens: int) -> dict:
+    return {
+        "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        },
+    }
+
+
+class FakeGemini:
+    """Gemini REST endpoints; the calling agent is named in the X-Agent header"""
+
+    STREAM_CHUNK_CHARS = 24
+
+    def __init__(self, faults: Faults):
+        self.faults = faults
+
+    async def handle(self, request: Request) -> Response:
+        model, _, method = request.path_params["target"].partition(":")
+        body = await request.json()
+        prompt = "".join(
+            part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", [])
+        )
+        config = body.get("generationConfig") or {}
+        json_mode = config.get("responseMimeType") == "application/json"
+        stream = method == "streamGenerateContent"
+
+        if await self.faults.apply():
+            return JSONResponse({"error": {"code": 503, "message": "The model is overloaded.",
+                                           "status": "UNAVAILABLE"}}, status_code=503)
+
+        text = gemini_answer(request.headers.get("x-agent", ""), prompt, json_mode, stream)
+        prompt_tokens = max(1, len(prompt) // 3)
+        output_tokens = max(1, len(text) // 3)
+        if not stream:
+            return JSONResponse(_gemini_payload(text, prompt_tokens, output_tokens))
+
+        async def events():
+            size = self.STREAM_CHUNK_CHARS
+            pieces = [text[i:i + size] for i in range(0, len(text), size)]
+            for index, piece in enumerate(pieces):
+                last = index == len(pieces) - 1
+                payload = _gemini_payload(piece, prompt_tokens, output_tokens if last else 0)
+                yield f"data: {json.dumps(payload, ensure_ascii=False)}\r\n\r\n"
+                await asyncio.sleep(0.005)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# ---------------------------------------------------------------------------
+# PostgREST
+# ---------------------------------------------------------------------------
+
+class FakePostgREST:
+    """Serves app/tests/fake_supabase.py over HTTP, with fault injection"""
+
+    def __init__(self, supabase: FakeSupabase, faults: Faults):
+        self.supabase = supabase
+        self.faults = faults
+
+    async def handle(self, request: Request) -> Response:
+        if await self.faults.apply():
+            return JSONResponse({"message": "connection reset", "code": "08006"}, status_code=503)
+
+        answer = self.supabase.handle(httpx.Request(
+            request.method, str(request.url), headers=request.headers.raw, content=await request.body()
+        ))
+        return Response(answer.content, status_code=answer.status_code,
+                        media_type=answer.headers.get("content-type"))
+
+
+def create_app(
+    gemini_faults: Optional[Faults] = None,
+    db_faults: Optional[Faults] = None,
+    db: Optional[FakeDatabase] = None
+) -> Starlette:
+    """One ASGI app serving both fakes"""
+    gemini = FakeGemini(gemini_faults or Faults())
+    postgrest = FakePostgREST(FakeSupabase(db), db_faults or Faults())
+
+    async def stats(request: Request) -> Response:
+        return JSONResponse({
+            "gemini": {"calls": gemini.faults.calls, "errors": gemini.faults.errors},
+            "postgrest": {"calls": postgrest.faults.calls, "errors": postgrest.faults.errors},
+        })
+
+    async def seed(request: Request) -> Response:
+        body = await request.json()
+        for user_id in body.get("users", []):
+            postgrest.supabase.db.seed_profile(user_id)
+        return JSONResponse({"seeded": len(body.get("users", []))})
+
+    app = Starlette(routes=[
+        Route("/v1beta/models/{target:path}", gemini.handle, methods=["POST"]),
+        Route("/rest/v1/{table}", postgrest.handle, methods=["GET", "POST", "PATCH", "DELETE"]),
+        Route("/_fake/stats", stats),
+        Route("/_fake/seed", seed, methods=["POST"]),
+    ])
+    app.state.db = postgrest.supabase.db
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--gemini-latency", default="lognormal:800:0.5")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--db-latency", default="lognormal:8:0.4")
+    parser.add_argument("--db-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    app = create_app(
+        Faults(args.gemini_latency, args.gemini_error_rate),
+        Faults(args.db_latency, args.db_error_rate)
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
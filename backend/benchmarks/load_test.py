@@ -0,0 +1,407 @@
+"""
+Load test: the full API against local Gemini and Supabase stand-ins
+
+Starts three things, all on this machine, no network needed:
+1. benchmarks/fake_services.py  fake Gemini + PostgREST (latency/error injection)
+2. app.main:app under uvicorn   real routers, pool, executor, caches, job queue;
+                                the agents' Gemini models are swapped for a thin
+                                HTTP client of the fake Gemini endpoint
+3. the load driver              N users with signed JWTs, a weighted mix of
+                                mood-log, chat, chat-stream, calendar and list calls
+
+Reports per-scenario throughput and latency percentiles, the API's event-loop
+lag (from /metrics) and the driver's own loop lag (if that is high, the
+driver, not the API, is the bottleneck).
+
+Usage (from backend/):
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --users 200 --concurrency 50 --duration 60 \\
+        --gemini-latency lognormal:1200:0.6 --gemini-error-rate 0.05 \\
+        --mix mood=4,chat=2,stream=2,calendar=1,list=1
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import re
+import socket
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# Add backend directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Base64, like the secret Supabase issues (app/auth.py decodes it)
+JWT_SECRET = base64.b64encode(b"auramind-load-test-jwt-secret-0123456789").decode()
+
+SAMPLE_NOTES = [
+    "Hôm nay mình đi gym buổi sáng, làm việc hiệu quả và tối đi ăn với bạn bè. Rất vui!",
+    "Deadline dồn dập, ngủ có 4 tiếng, cảm thấy kiệt sức và lo lắng về dự án.",
+    "Một ngày bình thường, đọc sách và nấu ăn ở nhà.",
+    "Cãi nhau với người yêu, buồn và không muốn làm gì cả.",
+]
+SAMPLE_MESSAGES = [
+    "Mình thấy hơi mệt hôm nay",
+    "Bạn có gợi ý gì để ngủ ngon hơn không?",
+    "Hôm nay mình được khen ở công ty!",
+    "Mình lo lắng về kỳ thi tuần sau",
+]
+
+DEFAULT_MIX = "mood=4,chat=2,stream=1,calendar=2,list=1"
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# ---------------------------------------------------------------------------
+# API process
+# ---------------------------------------------------------------------------
+
+class _Usage:
+    def __init__(self, metadata: dict):
+        self.prompt_token_count = metadata.get("promptTokenCount")
+        self.candidates_token_count = metadata.get("candidatesTokenCount")
+        self.total_token_count = metadata.get("totalTokenCount")
+
+
+class _Response:
+    def __init__(self, payload: dict):
+        parts = payload["candidates"][0]["content"]["parts"]
+        self.text = "".join(part.get("text", "") for part in parts)
+        usage = payload.get("usageMetadata")
+        self.usage_metadata = _Usage(usage) if usage else None
+
+
+class HttpGeminiModel:
+    """
+    Minimal stand-in for genai.GenerativeModel speaking Gemini's REST API
+
+    The SDK's async client only supports gRPC, which cannot be pointed at a
+    local plain-HTTP server, so the load test swaps each agent's model for
+    this client. Prompts, JSON mode and streaming go over HTTP as usual.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, base_url: str, agent: str, original: Any):
+        self.client = client
+        self.base_url = base_url
+        self.agent = agent
+        self.model_name = getattr(original, "model_name", "models/gemini-1.5-flash")
+        self.generation_config = dict(getattr(original, "_generation_config", None) or {})
+
+    def _body(self, prompt: Any, generation_config: Optional[dict]) -> dict:
+        config = {**self.generation_config, **(generation_config or {})}
+        return {
+            "contents": [{"role": "user", "parts": [{"text": str(prompt)}]}],
+            "generationConfig": {
+                "responseMimeType": config["response_mime_type"]
+            } if "response_mime_type" in config else {},
+        }
+
+    async def generate_content_async(self, prompt, stream: bool = False, generation_config=None, **kwargs):
+        method = "streamGenerateContent" if stream else "generateContent"
+        url = f"{self.base_url}/v1beta/{self.model_name}:{method}"
+        headers = {"x-goog-api-key": "fake", "x-agent": self.agent}
+        body = self._body(prompt, generation_config)
+        if not stream:
+            response = await self.client.post(url, json=body, headers=headers)
+            response.raise_for_status()
+            return _Response(response.json())
+        return self._stream(url, body, headers)
+
+    async def _stream(self, url: str, body: dict, headers: dict):
+        async with self.client.stream("POST", url, params={"alt": "sse"}, json=body, headers=headers) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    yield _Response(json.loads(line[len("data: "):]))
+
+
+def serve_api(port: int, fakes_url: str, work_dir: str, analyzer_cache: bool):
+    """Run app.main:app with every external dependency pointed at the fakes (state files in work_dir)"""
+    os.environ.update({
+        "SUPABASE_URL": fakes_url,
+        "SUPABASE_ANON_KEY": "fake-anon-key",
+        "SUPABASE_JWT_SECRET": JWT_SECRET,
+        "RATE_LIMIT_MAX_CALLS": "1000000",
+        "JOB_SPOOL_PATH": os.path.join(work_dir, "jobs.sqlite3"),
+        "USAGE_LEDGER_PATH": os.path.join(work_dir, "usage.sqlite3"),
+        "ANALYZER_CACHE_PATH": os.path.join(work_dir, "analyzer.sqlite3"),
+        "RATE_LIMIT_SQLITE_PATH": os.path.join(work_dir, "rate_limits.sqlite3"),
+    })
+    if not analyzer_cache:
+        os.environ["ANALYZER_CACHE_MAX_ENTRIES"] = "0"
+
+    import uvicorn
+    from app.main import app
+    from app.services.ai_manager import ai_manager
+
+    client = httpx.AsyncClient(
+        timeout=60.0, limits=httpx.Limits(max_connections=1000, max_keepalive_connections=200)
+    )
+    agents = (ai_manager.analyzer, ai_manager.empathizer, ai_manager.fused_agent,
+              ai_manager.chat_agent, ai_manager.chat_summary_agent, ai_manager.insight_agent)
+    for agent in agents:
+        agent.model = HttpGeminiModel(client, fakes_url, agent.name, agent.model)
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def make_token(user_id: str) -> str:
+    import jwt
+    now = int(time.time())
+    return jwt.encode(
+        {"sub": user_id, "role": "authenticated", "iat": now, "exp": now + 24 * 3600},
+        base64.b64decode(JWT_SECRET), algorithm="HS256"
+    )
+
+
+async def scenario_mood(client: httpx.AsyncClient, headers: dict) -> int:
+    response = await client.post("/mood-logs/", headers=headers, json={
+        "mood_score": 5, "stress_level": 5, "energy_level": 5,
+        "note": random.choice(SAMPLE_NOTES),
+        "health_metrics": {"steps": random.randint(2000, 12000), "sleep_hours": random.choice([5, 6.5, 8])},
+    })
+    return response.status_code
+
+
+async def scenario_chat(client: httpx.AsyncClient, headers: dict) -> int:
+    response = await client.post("/chat/", headers=headers, json={"message": random.choice(SAMPLE_MESSAGES)})
+    return response.status_code
+
+
+async def scenario_stream(client: httpx.AsyncClient, headers: dict) -> int:
+    body = {"message": random.choice(SAMPLE_MESSAGES)}
+    async with client.stream("POST", "/chat/stream", headers=headers, json=body) as response:
+        async for _ in response.aiter_bytes():
+            pass
+        return response.status_code
+
+
+async def scenario_calendar(client: httpx.AsyncClient, headers: dict) -> int:
+    now = time.gmtime()
+    response = await client.get("/mood-logs/calendar/", headers=headers, params={
+        "month": now.tm_mon, "year": now.tm_year, "include_insight": "true"
+    })
+    return response.status_code
+
+
+async def scenario_list(client: httpx.AsyncClient, headers: dict) -> int:
+    response = await client.get("/mood-logs/", headers=headers, params={"limit": 20})
+    return response.status_code
+
+
+SCENARIOS = {
+    "mood": scenario_mood,
+    "chat": scenario_chat,
+    "stream": scenario_stream,
+    "calendar": scenario_calendar,
+    "list": scenario_list,
+}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}' (choose from {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class LagProbe:
+    """Measures this process's own event-loop lag"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(loop.time() - start - self.interval, 0.0))
+
+
+def histogram_quantiles(metrics_text: str, name: str, quantiles=(0.5, 0.99)) -> Dict[str, float]:
+    """Approximate quantiles (bucket upper bounds) of an unlabelled histogram"""
+    buckets = [
+        (float("inf") if le == "+Inf" else float(le), float(count))
+        for le, count in re.findall(rf'^{name}_bucket\{{le="([^"]+)"\}} (\S+)$', metrics_text, re.M)
+    ]
+    total = buckets[-1][1] if buckets else 0
+    result = {}
+    for q in quantiles:
+        bound = next((le for le, count in buckets if total and count >= q * total), 0.0)
+        result[f"p{int(q * 100)}"] = bound
+    mean_sum = re.search(rf"^{name}_sum (\S+)$", metrics_text, re.M)
+    result["mean"] = float(mean_sum.group(1)) / total if mean_sum and total else 0.0
+    return result
+
+
+async def wait_until_up(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+
+async def drive(args, api_url: str, fakes_url: str):
+    users = [str(uuid.uuid4()) for _ in range(args.users)]
+    tokens = {user: make_token(user) for user in users}
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+
+    async with httpx.AsyncClient() as client:
+        await client.post(f"{fakes_url}/_fake/seed", json={"users": users})
+
+    results: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, int] = {name: 0 for name in names}
+    probe = LagProbe()
+    probe_task = asyncio.create_task(probe.run())
+
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=api_url, timeout=120.0, limits=limits) as client:
+        # Warm-up: one request per scenario (imports, pools, first JWT verification)
+        for name in names:
+            await SCENARIOS[name](client, {"Authorization": f"Bearer {tokens[users[0]]}"})
+
+        deadline = time.perf_counter() + args.duration
+        started = time.perf_counter()
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                name = random.choices(names, weights)[0]
+                headers = {"Authorization": f"Bearer {tokens[random.choice(users)]}"}
+                start = time.perf_counter()
+                try:
+                    status = await SCENARIOS[name](client, headers)
+                except httpx.HTTPError:
+                    status = 0
+                results[name].append((time.perf_counter() - start) * 1000)
+                if not 200 <= status < 300:
+                    errors[name] += 1
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        metrics_text = (await client.get("/metrics")).text
+        fake_stats = (await client.get(f"{fakes_url}/_fake/stats")).json()
+
+    probe_task.cancel()
+    report(args, results, errors, elapsed, metrics_text, fake_stats, probe.samples)
+
+
+def report(args, results, errors, elapsed, metrics_text, fake_stats, driver_lag):
+    total = sum(len(latencies) for latencies in results.values())
+    print("=" * 78)
+    print(f"Load test: {args.users} users, concurrency {args.concurrency}, {elapsed:.1f}s, "
+          f"gemini {args.gemini_latency} err {args.gemini_error_rate}, db {args.db_latency}")
+    print("=" * 78)
+    print(f"{'scenario':<10}{'requests':>9}{'errors':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'max ms':>9}")
+    for name, latencies in results.items():
+        if not latencies:
+            continue
+        print(f"{name:<10}{len(latencies):>9}{errors[name]:>8}{len(latencies) / elapsed:>8.1f}"
+              f"{percentile(latencies, 50):>9.0f}{percentile(latencies, 95):>9.0f}"
+              f"{percentile(latencies, 99):>9.0f}{max(latencies):>9.0f}")
+    print(f"{'total':<10}{total:>9}{sum(errors.values()):>8}{total / elapsed:>8.1f}")
+    print()
+
+    lag = histogram_quantiles(metrics_text, "auramind_event_loop_lag_seconds")
+    print(f"API event-loop lag:    mean {lag['mean'] * 1000:.1f}ms, p50 <= {lag['p50'] * 1000:g}ms, "
+          f"p99 <= {lag['p99'] * 1000:g}ms")
+    if driver_lag:
+        print(f"Driver event-loop lag: p50 {percentile(driver_lag, 50) * 1000:.1f}ms, "
+              f"p99 {percentile(driver_lag, 99) * 1000:.1f}ms")
+    print(f"Fake Gemini calls: {fake_stats['gemini']['calls']} ({fake_stats['gemini']['errors']} injected errors), "
+          f"PostgREST calls: {fake_stats['postgrest']['calls']} ({fake_stats['postgrest']['errors']} injected errors)")
+    print()
+
+
+async def run(args):
+    fakes_port, api_port = free_port(), free_port()
+    fakes_url = f"http://127.0.0.1:{fakes_port}"
+    api_url = f"http://127.0.0.1:{api_port}"
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    fakes = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(here, "fake_services.py"), "--port", str(fakes_port),
+        "--gemini-latency", args.gemini_latency, "--gemini-error-rate", str(args.gemini_error_rate),
+        "--db-latency", args.db_latency, "--db-error-rate", str(args.db_error_rate),
+    )
+    # The API's SQLite files (job spool, ledger, caches), removed afterwards
+    work_dir = tempfile.TemporaryDirectory(prefix="auramind_load_")
+    api_args = ["--serve-api", str(api_port), "--fakes-url", fakes_url, "--work-dir", work_dir.name]
+    if args.analyzer_cache:
+        api_args.append("--analyzer-cache")
+    api = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), *api_args,
+        cwd=os.path.join(here, ".."), stdout=None if args.verbose else asyncio.subprocess.DEVNULL
+    )
+    try:
+        await wait_until_up(f"{fakes_url}/_fake/stats")
+        await wait_until_up(f"{api_url}/health")
+        await drive(args, api_url, fakes_url)
+    finally:
+        for process in (api, fakes):
+            if process.returncode is None:
+                process.terminate()
+                await process.wait()
+        work_dir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="Distinct users (JWTs)")
+    parser.add_argument("--concurrency", type=int, default=20, help="Requests in flight")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--gemini-latency", default="lognormal:800:0.5", help="Latency spec (see fake_services.py)")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--db-latency", default="lognormal:8:0.4")
+    parser.add_argument("--db-error-rate", type=float, default=0.0)
+    parser.add_argument("--analyzer-cache", action="store_true",
+                        help="Keep the analyzer cache on (off by default so every log calls Gemini)")
+    parser.add_argument("--verbose", action="store_true", help="Show the API's output")
+    # Internal: run the API process
+    parser.add_argument("--serve-api", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    parser.add_argument("--fakes-url", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_api:
+        serve_api(args.serve_api, args.fakes_url, args.work_dir, args.analyzer_cache)
+        return
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: split (Analyzer + Empathy) vs fused (single call) mood pipeline
+
+Reports latency percentiles, LLM calls and tokens per mood log for each
+AI_PIPELINE_MODE.
+
+Usage (from backend/, with the same .env as the API):
+    python benchmarks/pipeline_modes.py                  # real Gemini, needs GEMINI_API_KEY
+    python benchmarks/pipeline_modes.py --simulate 800   # offline, every LLM call takes 800ms
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+# Add backend directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.ai_manager import AIAgentManager, PIPELINE_FUSED, PIPELINE_SPLIT
+from app.services.llm_executor import LLMExecutor
+
+SAMPLE_NOTES = [
+    "Hôm nay mình đi gym buổi sáng, làm việc hiệu quả và tối đi ăn với bạn bè. Rất vui!",
+    "Deadline dồn dập, ngủ có 4 tiếng, cảm thấy kiệt sức và lo lắng về dự án.",
+    "Một ngày bình thường, đọc sách và nấu ăn ở nhà.",
+    "Cãi nhau với người yêu, buồn và không muốn làm gì cả.",
+]
+
+SIMULATED_OUTPUTS = {
+    "analyzer": json.dumps({
+        "mood_score": 7, "stress_level": 4, "energy_level": 6,
+        "primary_emotion": "vui", "activities": ["gym"], "summary": "Ổn"
+    }),
+    "empathy": "Mình nghe bạn nói hôm nay khá ổn, thật tốt!",
+    "fused": json.dumps({
+        "mood_score": 7, "stress_level": 4, "energy_level": 6,
+        "primary_emotion": "vui", "activities": ["gym"], "summary": "Ổn",
+        "ai_feedback": "Mình nghe bạn nói hôm nay khá ổn, thật tốt!"
+    }),
+}
+
+
+class _SimulatedResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class RecordingExecutor(LLMExecutor):
+    """LLMExecutor that counts calls and tokens (optionally simulating Gemini)"""
+
+    def __init__(self, simulate_ms: float = None):
+        super().__init__()
+        self.simulate_ms = simulate_ms
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    async def generate(self, model, prompt, *, agent, timeout=None, **kwargs):
+        self.calls += 1
+        if self.simulate_ms is not None:
+            await asyncio.sleep(self.simulate_ms / 1000)
+            return _SimulatedResponse(SIMULATED_OUTPUTS[agent])
+
+        response = await super().generate(model, prompt, agent=agent, timeout=timeout, **kwargs)
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            self.prompt_tokens += usage.prompt_token_count or 0
+            self.output_tokens += usage.candidates_token_count or 0
+        return response
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_mode(mode: str, rounds: int, simulate_ms: float = None) -> dict:
+    executor = RecordingExecutor(simulate_ms)
+    manager = AIAgentManager(executor=executor, pipeline_mode=mode)
+
+    latencies = []
+    for _ in range(rounds):
+        for note in SAMPLE_NOTES:
+            start = time.perf_counter()
+            await manager.analyze_mood(note)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    logs = len(latencies)
+    return {
+        "mode": mode,
+        "logs": logs,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "mean_ms": statistics.mean(latencies),
+        "calls_per_log": executor.calls / logs,
+        "tokens_per_log": (executor.prompt_tokens + executor.output_tokens) / logs,
+        "fallbacks": manager.fused_fallbacks,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=3, help="Passes over the sample notes per mode")
+    parser.add_argument("--simulate", type=float, default=None, metavar="MS",
+                        help="Skip Gemini; every LLM call sleeps MS milliseconds")
+    args = parser.parse_args()
+
+    print("=" * 72)
+    print("Mood pipeline benchmark: split vs fused")
+    print("=" * 72)
+    print(f"{'mode':<8}{'logs':>6}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}"
+          f"{'calls/log':>11}{'tokens/log':>12}{'fallbacks':>11}")
+    for mode in (PIPELINE_SPLIT, PIPELINE_FUSED):
+        r = await run_mode(mode, args.rounds, args.simulate)
+        print(f"{r['mode']:<8}{r['logs']:>6}{r['p50_ms']:>10.0f}{r['p95_ms']:>10.0f}{r['mean_ms']:>10.0f}"
+              f"{r['calls_per_log']:>11.2f}{r['tokens_per_log']:>12.0f}{r['fallbacks']:>11}")
+    print()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""
+Benchmark: rate limiter check-and-increment latency per backend
+
+Usage (from backend/):
+    python benchmarks/rate_limiter.py
+    python benchmarks/rate_limiter.py --users 10000 --calls 50000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Add backend directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.rate_limiter import MemoryBackend, RateLimiter, SqliteBackend
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(name: str, limiter: RateLimiter, users: int, calls: int) -> None:
+    user_ids = [f"user-{i}" for i in range(users)]
+    latencies = []
+    for _ in range(calls):
+        user_id = random.choice(user_ids)
+        start = time.perf_counter()
+        await limiter.is_allowed(user_id)
+        latencies.append((time.perf_counter() - start) * 1_000_000)
+    print(f"{name:<24}{percentile(latencies, 50):>10.1f}{percentile(latencies, 99):>10.1f}"
+          f"{max(latencies):>10.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'backend / algorithm':<24}{'p50 us':>10}{'p99 us':>10}{'max us':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for algorithm in ("sliding_window", "token_bucket"):
+            await run(f"memory/{algorithm}", RateLimiter(algorithm=algorithm, backend=MemoryBackend()),
+                args.users, args.calls)
+            path = os.path.join(tmp, f"{algorithm}.sqlite3")
+            await run(f"sqlite/{algorithm}", RateLimiter(algorithm=algorithm, backend=SqliteBackend(path)),
+                args.users, args.calls)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
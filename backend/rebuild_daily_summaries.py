@@ -0,0 +1,51 @@
+"""
+Rebuild daily_mood_summaries from mood_logs (migration 007)
+
+Run once after applying the migration to backfill existing logs, or any time
+the summaries need to be recomputed. Requires SUPABASE_SERVICE_ROLE_KEY: the
+rebuild function is not callable with the anon key or a user token.
+
+Usage (from backend/):
+    python rebuild_daily_summaries.py                            # all users
+    python rebuild_daily_summaries.py --user <uuid>              # one user
+    python rebuild_daily_summaries.py --user <uuid> --day 2026-01-26
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app.core import supabase_pool
+
+
+async def rebuild(user_id: str = None, day: str = None) -> int:
+    service_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+    if not service_key:
+        raise SystemExit("SUPABASE_SERVICE_ROLE_KEY must be set to rebuild summaries")
+
+    db = supabase_pool.bind(service_key)
+    try:
+        response = await db.rpc(
+            "rebuild_daily_mood_summaries",
+            {"p_user_id": user_id, "p_day": day}
+        ).execute()
+        return response.data
+    finally:
+        await supabase_pool.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", default=None, help="Only rebuild this user's summaries")
+    parser.add_argument("--day", default=None, help="Only rebuild this UTC date (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    written = asyncio.run(rebuild(args.user, args.day))
+    print(f"Rebuilt {written} daily summary row(s)")
+
+
+if __name__ == "__main__":
+    main()
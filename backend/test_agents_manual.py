@@ -63,8 +63,8 @@ async def test_rate_limiter():
     # Test 1: First 3 calls should succeed
     print("Test 1: Allowing calls within limit")
     for i in range(3):
-        allowed = limiter.is_allowed(user_id)
-        remaining = limiter.get_remaining_calls(user_id)
+        allowed = await limiter.is_allowed(user_id)
+        remaining = await limiter.get_remaining_calls(user_id)
         status = "✓ PASS" if allowed else "✗ FAIL"
         print(f"  {status} | Call {i+1}/3: Allowed={allowed}, Remaining={remaining}")
         if not allowed:
@@ -72,8 +72,8 @@ async def test_rate_limiter():
     
     # Test 2: 4th call should be blocked
     print("\nTest 2: Blocking call over limit")
-    allowed = limiter.is_allowed(user_id)
-    remaining = limiter.get_remaining_calls(user_id)
+    allowed = await limiter.is_allowed(user_id)
+    remaining = await limiter.get_remaining_calls(user_id)
     status = "✓ PASS" if not allowed else "✗ FAIL"
     print(f"  {status} | Call 4/3: Allowed={allowed}, Remaining={remaining}")
     if allowed:
@@ -81,8 +81,8 @@ async def test_rate_limiter():
     
     # Test 3: Reset user
     print("\nTest 3: Reset user limit")
-    limiter.reset_user(user_id)
-    remaining = limiter.get_remaining_calls(user_id)
+    await limiter.reset_user(user_id)
+    remaining = await limiter.get_remaining_calls(user_id)
     status = "✓ PASS" if remaining == 3 else "✗ FAIL"
     print(f"  {status} | After reset: Remaining={remaining}")
     if remaining != 3:
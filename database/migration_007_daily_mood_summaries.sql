@@ -0,0 +1,253 @@
+-- ============================================================================
+-- AuraMind Database Migration 007: Daily Mood Summaries
+-- ============================================================================
+-- Purpose: Pre-aggregate mood_logs per user per day so the calendar endpoint
+-- reads at most 31 rows per month instead of every raw log.
+-- Rows are kept up to date by triggers on mood_logs:
+--   INSERT          -> the new log is added to its day incrementally
+--   UPDATE / DELETE -> the affected day(s) are recomputed from mood_logs
+-- Existing data: run SELECT rebuild_daily_mood_summaries(); once after this
+-- migration (or `python rebuild_daily_summaries.py` from backend/).
+-- ============================================================================
+
+-- ============================================================================
+-- STEP 1: Summary table
+-- ============================================================================
+-- Count maps are stored as JSONB objects, e.g.
+--   avatar_state_counts: {"STATE_JOYFUL": 2, "STATE_SAD": 1}
+--   activity_counts:     {"gym": 3, "coding": 1}
+--   health_sums:         {"steps": 12000, "sleep_hours": 14.5}
+--   health_counts:       {"steps": 2, "sleep_hours": 2}   (logs that reported the metric)
+
+CREATE TABLE IF NOT EXISTS daily_mood_summaries (
+    user_id UUID NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    log_date DATE NOT NULL, -- UTC date, same as created_at::DATE in the streak trigger
+    log_count INT NOT NULL DEFAULT 0,
+    mood_score_sum INT NOT NULL DEFAULT 0,
+    mood_score_count INT NOT NULL DEFAULT 0,
+    avatar_state_counts JSONB NOT NULL DEFAULT '{}',
+    activity_counts JSONB NOT NULL DEFAULT '{}',
+    health_sums JSONB NOT NULL DEFAULT '{}',
+    health_counts JSONB NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, log_date)
+);
+
+-- Enable RLS
+ALTER TABLE daily_mood_summaries ENABLE ROW LEVEL SECURITY;
+
+-- RLS: Users can view their own summaries (writes only happen in the triggers below)
+CREATE POLICY "Users can view own daily summaries" ON daily_mood_summaries
+    FOR SELECT USING (auth.uid() = user_id);
+
+-- ============================================================================
+-- STEP 2: Helper - add two count/sum maps key by key
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION mood_summary_merge(a JSONB, b JSONB)
+RETURNS JSONB AS $$
+    SELECT COALESCE(jsonb_object_agg(key, total), '{}'::JSONB)
+    FROM (
+        SELECT key, SUM(value::NUMERIC) AS total
+        FROM (
+            SELECT * FROM jsonb_each_text(a)
+            UNION ALL
+            SELECT * FROM jsonb_each_text(b)
+        ) kv
+        GROUP BY key
+    ) merged
+$$ LANGUAGE sql IMMUTABLE;
+
+-- ============================================================================
+-- STEP 3: Rebuild / backfill
+-- ============================================================================
+-- Recomputes summaries from mood_logs.
+--   SELECT rebuild_daily_mood_summaries();                      -- everything
+--   SELECT rebuild_daily_mood_summaries('<user uuid>');         -- one user
+--   SELECT rebuild_daily_mood_summaries('<user uuid>', '2026-01-26'); -- one day
+-- Returns the number of summary rows written.
+
+CREATE OR REPLACE FUNCTION rebuild_daily_mood_summaries(
+    p_user_id UUID DEFAULT NULL,
+    p_day DATE DEFAULT NULL
+)
+RETURNS INT AS $$
+DECLARE
+    written INT;
+BEGIN
+    DELETE FROM daily_mood_summaries
+    WHERE (p_user_id IS NULL OR user_id = p_user_id)
+      AND (p_day IS NULL OR log_date = p_day);
+
+    WITH logs AS (
+        SELECT
+            user_id,
+            (created_at AT TIME ZONE 'UTC')::DATE AS log_date,
+            mood_score,
+            avatar_state,
+            activities,
+            CASE WHEN jsonb_typeof(health_metrics) = 'object'
+                 THEN health_metrics ELSE '{}'::JSONB END AS health_metrics
+        FROM mood_logs
+        WHERE (p_user_id IS NULL OR user_id = p_user_id)
+          AND (p_day IS NULL OR (created_at AT TIME ZONE 'UTC')::DATE = p_day)
+    ),
+    days AS (
+        SELECT user_id, log_date,
+               COUNT(*) AS log_count,
+               COALESCE(SUM(mood_score), 0) AS mood_score_sum,
+               COUNT(mood_score) AS mood_score_count
+        FROM logs
+        GROUP BY user_id, log_date
+    ),
+    states AS (
+        SELECT user_id, log_date, jsonb_object_agg(avatar_state, n) AS counts
+        FROM (
+            SELECT user_id, log_date, avatar_state, COUNT(*) AS n
+            FROM logs WHERE avatar_state IS NOT NULL
+            GROUP BY user_id, log_date, avatar_state
+        ) s
+        GROUP BY user_id, log_date
+    ),
+    acts AS (
+        SELECT user_id, log_date, jsonb_object_agg(activity, n) AS counts
+        FROM (
+            SELECT l.user_id, l.log_date, a.activity, COUNT(*) AS n
+            FROM logs l, unnest(l.activities) AS a(activity)
+            WHERE a.activity IS NOT NULL
+            GROUP BY l.user_id, l.log_date, a.activity
+        ) s
+        GROUP BY user_id, log_date
+    ),
+    health AS (
+        SELECT user_id, log_date,
+               jsonb_object_agg(metric, total) AS sums,
+               jsonb_object_agg(metric, n) AS counts
+        FROM (
+            SELECT l.user_id, l.log_date, m.key AS metric,
+                   SUM((m.value #>> '{}')::NUMERIC) AS total, COUNT(*) AS n
+            FROM logs l, jsonb_each(l.health_metrics) AS m
+            WHERE m.key IN ('steps', 'sleep_hours', 'meditation_min', 'water_glasses', 'exercise_min')
+              AND jsonb_typeof(m.value) = 'number'
+            GROUP BY l.user_id, l.log_date, m.key
+        ) s
+        GROUP BY user_id, log_date
+    )
+    INSERT INTO daily_mood_summaries (
+        user_id, log_date, log_count, mood_score_sum, mood_score_count,
+        avatar_state_counts, activity_counts, health_sums, health_counts
+    )
+    SELECT d.user_id, d.log_date, d.log_count, d.mood_score_sum, d.mood_score_count,
+           COALESCE(s.counts, '{}'), COALESCE(a.counts, '{}'),
+           COALESCE(h.sums, '{}'), COALESCE(h.counts, '{}')
+    FROM days d
+    LEFT JOIN states s USING (user_id, log_date)
+    LEFT JOIN acts a USING (user_id, log_date)
+    LEFT JOIN health h USING (user_id, log_date);
+
+    GET DIAGNOSTICS written = ROW_COUNT;
+    RETURN written;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Rebuilding is an admin task: not callable with the anon key or a user JWT
+REVOKE EXECUTE ON FUNCTION rebuild_daily_mood_summaries(UUID, DATE) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION rebuild_daily_mood_summaries(UUID, DATE) TO service_role;
+
+-- ============================================================================
+-- STEP 4: Incremental trigger for new logs
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION add_log_to_daily_summary()
+RETURNS TRIGGER AS $$
+DECLARE
+    log_day DATE := (NEW.created_at AT TIME ZONE 'UTC')::DATE;
+    acts JSONB;
+    sums JSONB;
+    counts JSONB;
+BEGIN
+    SELECT COALESCE(jsonb_object_agg(activity, n), '{}')
+    INTO acts
+    FROM (
+        SELECT activity, COUNT(*) AS n
+        FROM unnest(COALESCE(NEW.activities, '{}'::TEXT[])) AS activity
+        WHERE activity IS NOT NULL
+        GROUP BY activity
+    ) a;
+
+    SELECT COALESCE(jsonb_object_agg(m.key, (m.value #>> '{}')::NUMERIC), '{}'),
+           COALESCE(jsonb_object_agg(m.key, 1), '{}')
+    INTO sums, counts
+    FROM jsonb_each(
+        CASE WHEN jsonb_typeof(NEW.health_metrics) = 'object'
+             THEN NEW.health_metrics ELSE '{}'::JSONB END
+    ) AS m
+    WHERE m.key IN ('steps', 'sleep_hours', 'meditation_min', 'water_glasses', 'exercise_min')
+      AND jsonb_typeof(m.value) = 'number';
+
+    INSERT INTO daily_mood_summaries AS s (
+        user_id, log_date, log_count, mood_score_sum, mood_score_count,
+        avatar_state_counts, activity_counts, health_sums, health_counts
+    )
+    VALUES (
+        NEW.user_id, log_day, 1,
+        COALESCE(NEW.mood_score, 0),
+        CASE WHEN NEW.mood_score IS NULL THEN 0 ELSE 1 END,
+        CASE WHEN NEW.avatar_state IS NULL THEN '{}'::JSONB
+             ELSE jsonb_build_object(NEW.avatar_state, 1) END,
+        acts, sums, counts
+    )
+    ON CONFLICT (user_id, log_date) DO UPDATE SET
+        log_count = s.log_count + 1,
+        mood_score_sum = s.mood_score_sum + EXCLUDED.mood_score_sum,
+        mood_score_count = s.mood_score_count + EXCLUDED.mood_score_count,
+        avatar_state_counts = mood_summary_merge(s.avatar_state_counts, EXCLUDED.avatar_state_counts),
+        activity_counts = mood_summary_merge(s.activity_counts, EXCLUDED.activity_counts),
+        health_sums = mood_summary_merge(s.health_sums, EXCLUDED.health_sums),
+        health_counts = mood_summary_merge(s.health_counts, EXCLUDED.health_counts),
+        updated_at = NOW();
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS on_mood_log_added_summary ON mood_logs;
+
+CREATE TRIGGER on_mood_log_added_summary
+    AFTER INSERT ON mood_logs
+    FOR EACH ROW
+    EXECUTE FUNCTION add_log_to_daily_summary();
+
+-- ============================================================================
+-- STEP 5: Edited / deleted logs -> recompute the affected day(s)
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION refresh_daily_summary_for_log()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM rebuild_daily_mood_summaries(OLD.user_id, (OLD.created_at AT TIME ZONE 'UTC')::DATE);
+    IF TG_OP = 'UPDATE' AND (
+        NEW.user_id IS DISTINCT FROM OLD.user_id OR
+        (NEW.created_at AT TIME ZONE 'UTC')::DATE <> (OLD.created_at AT TIME ZONE 'UTC')::DATE
+    ) THEN
+        PERFORM rebuild_daily_mood_summaries(NEW.user_id, (NEW.created_at AT TIME ZONE 'UTC')::DATE);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS on_mood_log_changed_summary ON mood_logs;
+
+CREATE TRIGGER on_mood_log_changed_summary
+    AFTER UPDATE OR DELETE ON mood_logs
+    FOR EACH ROW
+    EXECUTE FUNCTION refresh_daily_summary_for_log();
+
+-- ============================================================================
+-- Migration Complete
+-- ============================================================================
+-- Next steps:
+-- 1. Run this migration in Supabase SQL Editor
+-- 2. Backfill existing logs: SELECT rebuild_daily_mood_summaries();
+-- 3. Verify: SELECT * FROM daily_mood_summaries ORDER BY log_date DESC LIMIT 10;
+-- ============================================================================
@@ -0,0 +1,46 @@
+-- ============================================================================
+-- AuraMind Database Migration 008: Monthly Insight Cache
+-- ============================================================================
+-- Purpose: Persist the AI-generated holistic insight per user per month so
+-- repeat calendar views don't call Gemini (or spend a rate-limit token) again.
+-- `fingerprint` is a hash of the month's aggregated day summaries; when a new
+-- log changes the month, the fingerprint no longer matches and the stored
+-- insight is served as stale while a fresh one is generated in the background.
+-- ============================================================================
+
+-- ============================================================================
+-- STEP 1: Cache table
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS monthly_insights (
+    user_id UUID NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    year INT NOT NULL,
+    month INT NOT NULL CHECK (month BETWEEN 1 AND 12),
+    fingerprint TEXT NOT NULL, -- sha256 of the insight input data
+    insight TEXT NOT NULL,
+    generated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, year, month)
+);
+
+-- ============================================================================
+-- STEP 2: RLS - the backend writes with the user's JWT
+-- ============================================================================
+
+ALTER TABLE monthly_insights ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own monthly insights" ON monthly_insights
+    FOR SELECT USING (auth.uid() = user_id);
+
+CREATE POLICY "Users can insert own monthly insights" ON monthly_insights
+    FOR INSERT WITH CHECK (auth.uid() = user_id);
+
+CREATE POLICY "Users can update own monthly insights" ON monthly_insights
+    FOR UPDATE USING (auth.uid() = user_id) WITH CHECK (auth.uid() = user_id);
+
+-- ============================================================================
+-- Migration Complete
+-- ============================================================================
+-- Next steps:
+-- 1. Run this migration in Supabase SQL Editor (after migration 007)
+-- 2. Verify: SELECT user_id, year, month, generated_at FROM monthly_insights LIMIT 10;
+-- ============================================================================
@@ -0,0 +1,45 @@
+-- ============================================================================
+-- AuraMind Database Migration 009: Rolling Chat Summaries
+-- ============================================================================
+-- Purpose: Store one rolling summary of each user's older chat messages.
+-- The chat prompt packs the newest messages that fit the token budget
+-- verbatim. Messages that no longer fit are folded into this summary once
+-- (in the background), so it is reused on every later turn instead of
+-- being recomputed.
+-- `summarized_until` is the created_at of the newest message already
+-- covered by the summary.
+-- ============================================================================
+
+-- ============================================================================
+-- STEP 1: Summary table
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS chat_summaries (
+    user_id UUID PRIMARY KEY REFERENCES profiles(id) ON DELETE CASCADE,
+    summary TEXT NOT NULL,
+    summarized_until TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- ============================================================================
+-- STEP 2: RLS - the backend writes with the user's JWT
+-- ============================================================================
+
+ALTER TABLE chat_summaries ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own chat summary" ON chat_summaries
+    FOR SELECT USING (auth.uid() = user_id);
+
+CREATE POLICY "Users can insert own chat summary" ON chat_summaries
+    FOR INSERT WITH CHECK (auth.uid() = user_id);
+
+CREATE POLICY "Users can update own chat summary" ON chat_summaries
+    FOR UPDATE USING (auth.uid() = user_id) WITH CHECK (auth.uid() = user_id);
+
+-- ============================================================================
+-- Migration Complete
+-- ============================================================================
+-- Next steps:
+-- 1. Run this migration in Supabase SQL Editor
+-- 2. Verify: SELECT user_id, summarized_until, updated_at FROM chat_summaries LIMIT 10;
+-- ============================================================================
@@ -235,9 +235,16 @@ class _MoodCheckinScreenState extends State<MoodCheckinScreen> {
         activities: _selectedActivities,
       );
 
+      // Badges are awarded by a server-side job after the log is saved
+      var newAchievements = response['new_achievements'] as List<dynamic>?;
+      if ((newAchievements == null || newAchievements.isEmpty) &&
+          response['id'] != null) {
+        newAchievements =
+            await apiService.waitForAchievements(response['id'].toString());
+      }
+
       if (mounted) {
         // Check for new achievements
-        final newAchievements = response['new_achievements'] as List<dynamic>?;
 
         if (newAchievements != null && newAchievements.isNotEmpty) {
           await _showAchievementDialog(newAchievements);
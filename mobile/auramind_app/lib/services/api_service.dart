@@ -122,6 +122,27 @@ class ApiService {
     }
   }
 
+  /// Badges earned by a mood log. The server awards them in a background job
+  /// after createMoodLog returns, so this polls until the job settles.
+  Future<List<dynamic>> waitForAchievements(String logId) async {
+    try {
+      for (var attempt = 0; attempt < 10; attempt++) {
+        final response = await http.get(
+          Uri.parse('$baseUrl/mood-logs/$logId/achievements'),
+          headers: _headers,
+        );
+        if (response.statusCode != 200) return [];
+        final body = jsonDecode(response.body);
+        if (body['status'] == 'done') return body['new_achievements'];
+        if (body['status'] == 'failed') return [];
+        await Future.delayed(const Duration(milliseconds: 300));
+      }
+    } catch (e) {
+      debugPrint('Failed to fetch achievements: $e');
+    }
+    return [];
+  }
+
   /// Get calendar data for a specific month
   Future<Map<String, dynamic>> getCalendarData({
     required int month,